@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
 
 
 class CityshopsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cityshops'
+
+    def ready(self):
+        from cityshops import signals  # noqa: F401
+        from cityshops.db import check_connections
+        request_started.connect(check_connections)
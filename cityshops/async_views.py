@@ -0,0 +1,72 @@
+'''Async read path of cityshops API for ASGI deployment
+
+Django 3.2 has no async ORM, so each view runs its queries in one
+sync_to_async call. Unlike sync views, which ASGI handler runs one at
+a time in its single thread sensitive executor, these calls go to a
+thread pool, so concurrent requests read database in parallel.
+Sync views are dispatched as they are, with authentication, permissions,
+throttling, replica routing, search validation, pagination, response
+cache and conditional GET, responses are identical
+'''
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponseNotAllowed, JsonResponse
+from rest_framework.response import Response
+
+from cityshops.profiling import record_queries
+from cityshops.views import CityList, CityStreetsList, ShopList
+
+
+def read_page(view_class, request, **kwargs):
+    '''Dispatch request to sync view, response is left unrendered'''
+    return view_class.as_view()(request, **kwargs)
+
+
+@sync_to_async(thread_sensitive=False)
+def read_page_in_thread(view_class, request, **kwargs):
+    '''Run read_page in pool thread with its own database connection
+
+    Connection is closed as at the end of sync request, according to
+    CONN_MAX_AGE
+    '''
+    close_old_connections()
+    try:
+        with record_queries():  # profile lives in context of request
+            return read_page(view_class, request, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def respond(view_class, request, **kwargs):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    response = await read_page_in_thread(view_class, request, **kwargs)
+    if not isinstance(response, Response):  # 304 Not Modified
+        return response
+
+    json_response = JsonResponse(
+        response.data, status=response.status_code, safe=False,
+        json_dumps_params={
+            'ensure_ascii': False, 'separators': (',', ':'),  # as JSONRenderer
+        },
+    )
+    for header in ('ETag', 'Last-Modified'):
+        if response.has_header(header):
+            json_response[header] = response[header]
+    return json_response
+
+
+async def city_list(request):
+    '''List all cities'''
+    return await respond(CityList, request)
+
+
+async def city_streets_list(request, city_pk: int):
+    '''List all streets of given city'''
+    return await respond(CityStreetsList, request, city_pk=city_pk)
+
+
+async def shop_list(request):
+    '''List all shops or search specific shop'''
+    return await respond(ShopList, request)
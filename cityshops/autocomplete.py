@@ -0,0 +1,277 @@
+import logging
+from bisect import bisect_left, insort
+from collections import Counter
+from threading import RLock, Thread
+from time import monotonic
+
+from django.db import close_old_connections, connection
+
+from cityshops.models import City, Street, TableVersion
+
+
+logger = logging.getLogger(__name__)
+
+
+def trigrams(text: str) -> set:
+    '''Trigrams of words padded like PostgreSQL pg_trgm does'''
+    return {
+        padded[i:i + 3]
+        for word in text.split()
+        for padded in (f'  {word} ',)
+        for i in range(len(padded) - 2)
+    }
+
+
+class NameIndex:
+    '''Names of rows kept sorted by case folded name and by trigram
+
+    Prefix lookup is binary search over sorted keys, fuzzy lookup counts
+    trigrams shared with indexed names
+    '''
+
+    def __init__(self):
+        self.keys = []  # sorted (folded name, id)
+        self.rows = {}  # id -> (name, folded name, number of trigrams)
+        self.trigram_ids = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, row_id: int) -> bool:
+        return row_id in self.rows
+
+    def add(self, row_id: int, name: str):
+        self.remove(row_id)
+        folded = name.casefold()
+        name_trigrams = trigrams(folded)
+        self.rows[row_id] = name, folded, len(name_trigrams)
+        insort(self.keys, (folded, row_id))
+        for trigram in name_trigrams:
+            self.trigram_ids.setdefault(trigram, set()).add(row_id)
+
+    def remove(self, row_id: int):
+        if (row := self.rows.pop(row_id, None)) is None:
+            return
+        folded = row[1]
+        del self.keys[bisect_left(self.keys, (folded, row_id))]
+        for trigram in trigrams(folded):
+            row_ids = self.trigram_ids[trigram]
+            row_ids.discard(row_id)
+            if not row_ids:
+                del self.trigram_ids[trigram]
+
+    def name(self, row_id: int) -> str:
+        return self.rows[row_id][0]
+
+    def starting_with(self, text: str, limit: int) -> list:
+        '''Ids of names starting with text in name order'''
+        prefix = text.casefold()
+        row_ids = []
+        for index in range(bisect_left(self.keys, (prefix,)), len(self.keys)):
+            folded, row_id = self.keys[index]
+            if not folded.startswith(prefix) or len(row_ids) == limit:
+                break
+            row_ids.append(row_id)
+        return row_ids
+
+    def similar_to(self, text: str, limit: int,
+                   threshold: float = 0.3) -> list:
+        '''Ids of names most similar to text by shared trigrams'''
+        searched = trigrams(text.casefold())
+        shared = Counter()
+        for trigram in searched:
+            shared.update(self.trigram_ids.get(trigram, ()))
+        scores = []
+        for row_id, count in shared.items():
+            _, folded, name_trigrams = self.rows[row_id]
+            score = count / (len(searched) + name_trigrams - count)
+            if score >= threshold:
+                scores.append((-score, folded, row_id))
+        return [row_id for *_, row_id in sorted(scores)[:limit]]
+
+
+class AutocompleteIndex:
+    '''In-process index of city and street names
+
+    Saves and deletes of this process are applied after commit (see
+    cityshops.signals). Table versions are checked at most every
+    `check_interval` seconds, so writes of other processes and bulk writes
+    show up within it, while keystrokes do not query database. Changed
+    versions start rebuild in background thread, searches are served by
+    stale index until rebuilt one replaces it at once
+    '''
+
+    check_interval = 5
+
+    def __init__(self):
+        self.lock = RLock()
+        self.rebuilding = False
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.versions = None  # (city version, street version)
+            self.checked_at = None
+            self.cities = NameIndex()
+            self.streets = NameIndex()
+            self.city_streets = {}  # city id -> NameIndex of its streets
+            self.street_cities = {}  # street id -> city id
+
+    def get_versions(self) -> tuple:
+        versions = {label: version for label, version, _
+                    in TableVersion.objects.of((City, Street))}
+        return (versions.get(City._meta.label_lower),
+                versions.get(Street._meta.label_lower))
+
+    def refresh(self):
+        if self.checked_at is not None \
+                and monotonic() - self.checked_at < self.check_interval:
+            return
+        if (versions := self.get_versions()) != self.versions:
+            self.start_rebuild(versions)
+        self.checked_at = monotonic()
+
+    def start_rebuild(self, versions: tuple):
+        '''Rebuild unless other rebuild runs
+
+        Index never built has nothing to serve meanwhile, so it is built
+        by caller
+        '''
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        # thread would not see rows of caller's transaction, which versions
+        # may come from
+        if self.versions is not None and not connection.in_atomic_block:
+            Thread(target=self.rebuild_in_thread, args=(versions,),
+                   daemon=True).start()
+        else:
+            self.rebuild(versions)
+
+    def rebuild_in_thread(self, versions: tuple):
+        close_old_connections()
+        try:
+            self.rebuild(versions)
+        except Exception:
+            logger.exception('Autocomplete index rebuild failed')
+        finally:
+            connection.close()
+
+    def rebuild(self, versions: tuple):
+        '''Load index stamped with versions read before rows'''
+        try:
+            index = AutocompleteIndex()
+            for city_id, name in City.objects.values_list('id', 'name'):
+                index.cities.add(city_id, name)
+            streets = Street.objects.values_list('id', 'name', 'city_id')
+            for street_id, name, city_id in streets.iterator(
+                    chunk_size=10_000):
+                index.add_street(street_id, name, city_id)
+            with self.lock:
+                # writes applied meanwhile moved versions past stamp of
+                # index, next check starts another rebuild
+                self.cities, self.streets = index.cities, index.streets
+                self.city_streets = index.city_streets
+                self.street_cities = index.street_cities
+                self.versions = versions
+        finally:
+            self.rebuilding = False
+
+    def add_street(self, street_id: int, name: str, city_id: int):
+        self.remove_street(street_id)
+        self.streets.add(street_id, name)
+        self.city_streets.setdefault(city_id, NameIndex()).add(street_id, name)
+        self.street_cities[street_id] = city_id
+
+    def remove_street(self, street_id: int):
+        if (city_id := self.street_cities.pop(street_id, None)) is None:
+            return
+        self.streets.remove(street_id)
+        streets = self.city_streets[city_id]
+        streets.remove(street_id)
+        if not streets:
+            del self.city_streets[city_id]
+
+    def table_changed(self, position: int):
+        '''Count write applied in place of table version bump it made'''
+        versions = list(self.versions)
+        if versions[position] is not None:
+            versions[position] += 1
+        self.versions = tuple(versions)
+
+    def city_saved(self, city_id: int, name: str):
+        with self.lock:
+            if self.versions is None:
+                return
+            self.cities.add(city_id, name)
+            self.table_changed(0)
+
+    def city_deleted(self, city_id: int):
+        with self.lock:
+            if self.versions is None:
+                return
+            self.cities.remove(city_id)
+            self.table_changed(0)
+
+    def street_saved(self, street_id: int, name: str, city_id: int):
+        with self.lock:
+            if self.versions is None:
+                return
+            self.add_street(street_id, name, city_id)
+            self.table_changed(1)
+
+    def street_deleted(self, street_id: int):
+        with self.lock:
+            if self.versions is None:
+                return
+            self.remove_street(street_id)
+            self.table_changed(1)
+
+    def search(self, text: str, limit: int, fuzzy: bool = False,
+               city_id=None) -> dict:
+        '''Cities and streets with names starting with text
+
+        Fuzzy search fills results up to `limit` with similar names.
+        `city_id` restricts streets to one city and skips cities
+        '''
+        self.refresh()
+        with self.lock:
+            cities = [] if city_id is not None else \
+                self.lookup(self.cities, text, limit, fuzzy)
+            streets = self.streets if city_id is None else \
+                self.city_streets.get(city_id, NameIndex())
+            return {
+                'cities': [{'id': row_id, 'name': self.cities.name(row_id)}
+                           for row_id in cities],
+                'streets': self.represent_streets(
+                    streets, self.lookup(streets, text, limit, fuzzy)),
+            }
+
+    def represent_streets(self, streets: NameIndex, row_ids: list) -> list:
+        '''Streets with names of their cities
+
+        Street saved by this process may belong to city which other process
+        created since last check, such streets are skipped until next
+        search rebuilds index
+        '''
+        results = []
+        for row_id in row_ids:
+            if (city_id := self.street_cities[row_id]) not in self.cities:
+                self.checked_at = None
+                continue
+            results.append({'id': row_id, 'name': streets.name(row_id),
+                            'city': self.cities.name(city_id)})
+        return results
+
+    def lookup(self, names: NameIndex, text: str, limit: int,
+               fuzzy: bool) -> list:
+        row_ids = names.starting_with(text, limit)
+        if fuzzy and len(row_ids) < limit:
+            found = set(row_ids)
+            row_ids += [row_id for row_id in names.similar_to(text, limit)
+                        if row_id not in found][:limit - len(row_ids)]
+        return row_ids
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,14 @@
+'''Helpers of benchmark management commands'''
+import statistics
+
+
+def summarize(latencies: list, elapsed: float) -> dict:
+    '''Throughput and latency percentiles in milliseconds'''
+    quantiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(quantiles[49] * 1000, 2),
+        'p90_ms': round(quantiles[89] * 1000, 2),
+        'p95_ms': round(quantiles[94] * 1000, 2),
+        'p99_ms': round(quantiles[98] * 1000, 2),
+    }
@@ -0,0 +1,134 @@
+import json
+from functools import partial
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import Max
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+
+from cityshops.models import City, RowChange, Shop, Street
+from cityshops.serializers import ShopImportSerializer
+from cityshops.signals import tables_changed
+
+
+def iter_json_lines(lines):
+    '''Yield (line number, line) pairs skipping blank lines'''
+    for number, line in enumerate(lines, start=1):
+        if line.strip():
+            yield number, line
+
+
+def import_shops(lines, batch_size: int = 1000) -> dict:
+    '''Create shops from JSON Lines, one transaction per batch
+
+    Invalid rows are reported and skipped, the rest of batch is inserted.
+    Cities and streets of a batch are resolved in two queries. Every
+    committed batch bumps shop table version, so batches committed before
+    a failing one are not hidden by caches
+    '''
+    serializer = ShopImportSerializer()
+    report = {'created': 0, 'errors': []}
+    numbered_lines = iter_json_lines(lines)
+    while batch := list(islice(numbered_lines, batch_size)):
+        rows = []
+        for number, line in batch:
+            try:
+                rows.append((number, serializer.run_validation(json.loads(line))))
+            except ValueError as error:
+                report['errors'].append(error_row(number, {
+                    api_settings.NON_FIELD_ERRORS_KEY: [f'Invalid JSON: {error}'],
+                }))
+            except ValidationError as error:
+                report['errors'].append(error_row(number, error.detail))
+
+        shops = build_shops(rows, report['errors'])
+        with transaction.atomic():
+            created_ids = bulk_create_shops(shops, batch_size)
+            Shop.objects.filter(id__in=created_ids) \
+                        .create_daily_opening_hours()
+            # bulk_create does not send post_save
+            RowChange.objects.record(Shop, created_ids, created=True)
+            if created_ids:
+                transaction.on_commit(partial(tables_changed, Shop))
+        report['created'] += len(shops)
+
+    report['errors'].sort(key=lambda row: row['line'])
+    return report
+
+
+def bulk_create_shops(shops: list, batch_size: int) -> list:
+    '''Insert shops, return their ids
+
+    PostgreSQL returns ids from insert. Other databases get rows above
+    previous largest id, which are ours only while database lock keeps
+    other transactions from inserting, as SQLite does
+    '''
+    if connection.features.can_return_rows_from_bulk_insert:
+        Shop.objects.bulk_create(shops, batch_size=batch_size)
+        return [shop.id for shop in shops]
+    last_id = Shop.objects.aggregate(Max('id'))['id__max'] or 0
+    Shop.objects.bulk_create(shops, batch_size=batch_size)
+    return list(Shop.objects.filter(id__gt=last_id)
+                            .values_list('id', flat=True))
+
+
+def build_shops(rows: list, errors: list) -> list:
+    '''Resolve names of validated rows to ids in two set-based queries'''
+    city_names = {attrs['city'] for _, attrs in rows}
+    city_ids = dict(City.objects.filter(name__in=city_names)
+                                .values_list('name', 'id'))
+
+    street_names = {attrs['street'] for _, attrs in rows}
+    street_ids = {
+        (city_id, name): street_id
+        for street_id, city_id, name in Street.objects.filter(
+            city_id__in=city_ids.values(), name__in=street_names,
+        ).values_list('id', 'city_id', 'name')
+    }
+
+    shops = []
+    message = 'Object with name={} does not exist.'
+    for number, attrs in rows:
+        city_name, street_name = attrs.pop('city'), attrs.pop('street')
+        if (city_id := city_ids.get(city_name)) is None:
+            errors.append(error_row(number, {
+                'city': [message.format(city_name)],
+            }))
+        elif (street_id := street_ids.get((city_id, street_name))) is None:
+            errors.append(error_row(number, {
+                'street': [message.format(street_name)],
+            }))
+        else:
+            shops.append(Shop(city_id=city_id, street_id=street_id, **attrs))
+    return shops
+
+
+def upsert_streets(city_id: int, names: list) -> dict:
+    '''Create missing streets of city, report created and existing ones
+
+    Conflicting concurrent inserts are skipped by ('name', 'city') unique
+    constraint, such streets are reported as created
+    '''
+    names = list(dict.fromkeys(names))
+    streets = Street.objects.filter(city_id=city_id, name__in=names)
+    existing = set(streets.values_list('name', flat=True))
+    with transaction.atomic():
+        Street.objects.bulk_create(
+            [Street(city_id=city_id, name=name)
+             for name in names if name not in existing],
+            ignore_conflicts=True,
+        )
+        ids = dict(streets.values_list('name', 'id'))
+        # concurrent insert of skipped conflicting street has logged it
+        RowChange.objects.record(Street, [ids[name] for name in names
+                                          if name not in existing])
+    report = {'created': [], 'existing': []}
+    for name in names:
+        status = 'existing' if name in existing else 'created'
+        report[status].append({'id': ids[name], 'name': name})
+    return report
+
+
+def error_row(number: int, errors) -> dict:
+    return {'line': number, 'errors': errors}
@@ -0,0 +1,124 @@
+from hashlib import md5
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from cityshops.models import TableVersion
+
+
+def generation_key(model) -> str:
+    return f'cityshops:generation:{model._meta.label_lower}'
+
+
+def get_generations(models) -> list:
+    '''Current generation token of each model, one cache round trip
+
+    Missing token is replaced by a new unique one rather than a default,
+    so entries stored before eviction can never become valid again
+    '''
+    keys = [generation_key(model) for model in models]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, uuid4().hex, timeout=None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def make_key(prefix: str, *parts) -> str:
+    '''Fixed length cache key of any repr-able parts'''
+    return f'cityshops:{prefix}:' + md5(repr(parts).encode()).hexdigest()
+
+
+def invalidate(model):
+    '''Drop every cached response that depends on model rows'''
+    cache.set(generation_key(model), uuid4().hex, timeout=None)
+
+
+class CachedListMixin:
+    '''Cache list responses until rows of `cache_models` change
+
+    Key is request path plus normalized query parameters listed in
+    `get_cache_parameters`, requests with other parameters bypass cache.
+    Invalidation is driven by model signals, see cityshops.signals
+    '''
+
+    cache_models = ()
+
+    def list(self, request, *args, **kwargs):
+        if (key := self.get_cache_key()) is None:
+            return super().list(request, *args, **kwargs)
+
+        if (data := cache.get(key)) is not None:
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        cache.set(key, response.data, self.get_cache_timeout())
+        return response
+
+    def get_cache_parameters(self) -> tuple:
+        search_parameters = getattr(self, 'valid_search_parameters', ())
+        return self.paginator.query_parameters + tuple(search_parameters)
+
+    def get_cache_key(self):
+        query_params = self.request.query_params
+        if not set(query_params).issubset(self.get_cache_parameters()):
+            return None
+
+        query = sorted(query_params.items())
+        generations = get_generations(self.cache_models)
+        # versions read along with rows, so rows of lagging replica are
+        # never cached as current ones
+        versions = [row[:2] for row in getattr(self, 'table_versions', ())]
+        return make_key('response', self.request.get_host(),
+                        self.request.path, query, generations, versions)
+
+    def get_cache_timeout(self) -> int:
+        return settings.RESPONSE_CACHE_TIMEOUT
+
+
+class ConditionalListMixin:
+    '''Answer conditional GET of list with 304 Not Modified
+
+    ETag and Last-Modified come from TableVersion rows of `cache_models`
+    plus `get_etag_extra`, so 304 costs one small query and never runs
+    queryset or serializer
+    '''
+
+    cache_models = ()
+    use_if_modified_since = True
+
+    def list(self, request, *args, **kwargs):
+        # kept on view, so queryset code can check its own derived state
+        self.table_versions = versions = TableVersion.objects.of(self.cache_models)
+        etag = self.get_etag(versions)
+        timestamp = None
+        if updated := [updated_at for _, _, updated_at in versions]:
+            timestamp = int(max(updated).timestamp())
+
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=timestamp if self.use_if_modified_since else None,
+        )
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def get_etag(self, versions: list) -> str:
+        query = sorted(self.request.query_params.items())
+        source = repr((self.request.get_host(), self.request.path, query,
+                       [row[:2] for row in versions], self.get_etag_extra()))
+        return quote_etag(md5(source.encode()).hexdigest())
+
+    def get_etag_extra(self):
+        '''Response state not stored in tables, such as time of day'''
+        return None
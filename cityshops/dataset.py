@@ -0,0 +1,95 @@
+'''Synthetic cities, streets and shops for benchmarks and query plans'''
+import random
+from datetime import time
+from itertools import islice
+
+from cityshops.models import City, Shop, Street
+from cityshops.signals import tables_changed
+
+
+# (weight, opening time, closing time), None means random hours
+OPENING_HOURS = (
+    (40, time(hour=9), time(hour=21)),
+    (20, time(hour=8), time(hour=20)),
+    (15, time(hour=10), time(hour=22)),
+    (10, time(hour=0), time(hour=23, minute=59, second=59)),
+    (5, time(hour=22), time(hour=6)),  # closes next day
+    (10, None, None),
+)
+
+
+def random_opening_hours(rng: random.Random) -> tuple:
+    weights = [weight for weight, _, _ in OPENING_HOURS]
+    _, opening, closing = rng.choices(OPENING_HOURS, weights=weights)[0]
+    if opening is None:
+        opening = time(hour=rng.randint(6, 11), minute=rng.choice((0, 30)))
+        closing = time(hour=rng.randint(17, 23), minute=rng.choice((0, 30)))
+    return opening, closing
+
+
+# shops are scattered this many degrees around center of their city
+CITY_SPAN = 0.1
+
+
+def city_center(city_id: int, seed: int) -> tuple:
+    '''Random but stable (latitude, longitude) of city'''
+    rng = random.Random(f'{seed}:{city_id}')
+    return rng.uniform(-60, 70), rng.uniform(-180, 180)
+
+
+def bulk_create_in_batches(model, objects, batch_size: int):
+    '''bulk_create that never holds more than one batch in memory'''
+    objects = iter(objects)
+    while batch := list(islice(objects, batch_size)):
+        model.objects.bulk_create(batch)
+
+
+def iter_shops(street_rows, shops: int, prefix: str, rng: random.Random,
+               seed: int = 0):
+    for street_id, city_id in street_rows:
+        latitude, longitude = city_center(city_id, seed)
+        for s in range(shops):
+            opening_time, closing_time = random_opening_hours(rng)
+            yield Shop(
+                latitude=latitude + rng.uniform(-CITY_SPAN, CITY_SPAN),
+                longitude=longitude + rng.uniform(-CITY_SPAN, CITY_SPAN),
+                name=f'{prefix}Shop {s}',
+                city_id=city_id,
+                street_id=street_id,
+                house_numbers=str(rng.randint(1, 200)),
+                opening_time=opening_time,
+                closing_time=closing_time,
+            )
+
+
+def generate(cities: int, streets: int, shops: int, prefix: str = '',
+             seed: int = 0, batch_size: int = 5000) -> int:
+    '''Create cities, `streets` per city and `shops` per street
+
+    Names start with `prefix`, so several datasets may share database.
+    Returns number of created shops
+    '''
+    rng = random.Random(seed)
+    bulk_create_in_batches(City, (
+        City(name=f'{prefix}City {c}') for c in range(cities)
+    ), batch_size)
+
+    # refetch instead of relying on bulk_create returning ids
+    city_ids = City.objects.filter(name__startswith=f'{prefix}City ') \
+                           .values_list('id', flat=True)
+    bulk_create_in_batches(Street, (
+        Street(name=f'{prefix}Street {s}', city_id=city_id)
+        for city_id in city_ids.iterator() for s in range(streets)
+    ), batch_size)
+
+    street_rows = Street.objects.filter(city_id__in=city_ids) \
+                                .values_list('id', 'city_id')
+    bulk_create_in_batches(
+        Shop, iter_shops(street_rows.iterator(), shops, prefix, rng, seed),
+        batch_size,
+    )
+    Shop.objects.filter(city_id__in=city_ids) \
+                .create_daily_opening_hours(batch_size)
+
+    tables_changed(City, Street, Shop)
+    return cities * streets * shops
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.db import connections
+
+
+def check_connections(**kwargs):
+    '''Close persistent connections which stopped working
+
+    Connected to request_started, runs while DATABASE_CONN_HEALTH_CHECKS
+    is on, so request after database or pgbouncer restart gets new
+    connection instead of error. Unlike CONN_HEALTH_CHECKS of Django 4.1,
+    which checks connection on its first use in request, every open
+    connection is pinged at request start, replicas included: a round
+    trip per connection per request
+    '''
+    if not settings.DATABASE_CONN_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        if not connection.is_usable():
+            connection.close()
@@ -0,0 +1,336 @@
+'''Server-Sent Events of shops opening, closing and changing
+
+Served by ASGI application (see test_assignment_DRF/asgi.py) at
+/shop/events/?city=<name>&street=<name>, search parameters mean the same
+as in ShopList. One scheduler per process watches shops of all
+subscribed places: it sleeps until next opening or closing of them and
+reads change log (see RowChange) at most every `check_interval` seconds.
+Idle subscribers cost a queue and a task waiting for disconnect each
+'''
+import asyncio
+import logging
+import operator
+from datetime import timedelta
+from functools import reduce
+from urllib.parse import parse_qsl
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from cityshops.models import (
+    City, RowChange, Shop, Street, TableVersion, seconds_until,
+)
+from cityshops.name_cache import city_cache, street_cache
+from cityshops.renderers import dumps
+from cityshops.serializers import shop_row_fields, shop_rows_to_representation
+
+
+logger = logging.getLogger(__name__)
+
+
+def place_condition(place: tuple) -> Q:
+    city_id, street_ids = place
+    condition = Q()
+    if city_id is not None:
+        condition &= Q(city_id=city_id)
+    if street_ids is not None:
+        condition &= Q(street_id__in=street_ids)
+    return condition
+
+
+def in_place(place: tuple, city_id: int, street_id: int) -> bool:
+    place_city_id, street_ids = place
+    return place_city_id in (None, city_id) \
+        and (street_ids is None or street_id in street_ids)
+
+
+class Subscriber:
+    '''Events of one stream, closed when client lags `queue_size` behind'''
+
+    def __init__(self, place: tuple, queue_size: int):
+        self.place = place
+        self.queue = asyncio.Queue(queue_size)
+        self.needs_snapshot = True
+
+    def send(self, event: str, data):
+        try:
+            self.queue.put_nowait((event, data))
+        except asyncio.QueueFull:
+            self.close()
+
+    def close(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class EventScheduler:
+    '''Wakes at openings and closings of watched shops, fans out events
+
+    Subscribers live in event loop thread, database is read in pool
+    thread by `refresh`, which alone touches watched state
+    '''
+
+    check_interval = 5
+    queue_size = 100
+
+    def __init__(self):
+        self.places = {}  # (city id, street ids) -> subscribers
+        self.task = None
+        self.wakeup = None
+        # watched state, see refresh
+        self.watched_places = frozenset()
+        self.shops = {}  # shop id -> (city id, street id)
+        self.opened = set()
+        self.token = None
+        self.boundary_at = None  # datetime of next opening or closing
+
+    def subscribe(self, place: tuple) -> Subscriber:
+        '''Add subscriber, it gets snapshot of opened shops on next step'''
+        subscriber = Subscriber(place, self.queue_size)
+        self.places.setdefault(place, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self.places[subscriber.place]
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self.places[subscriber.place]
+        if not self.places and self.wakeup is not None:
+            self.wakeup.set()  # let scheduler task finish
+
+    def wake(self):
+        '''Run step now, start scheduler task in running loop if needed'''
+        if self.task is None or self.task.done():
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.ensure_future(self.run())
+        self.wakeup.set()
+
+    async def run(self):
+        '''Step until last subscriber leaves, failed step is retried after
+        `check_interval`'''
+        while self.places:
+            self.wakeup.clear()
+            try:
+                delay = await self.step()
+            except Exception:
+                logger.exception('Shop events step failed')
+                delay = None
+            timeout = self.check_interval if delay is None \
+                else min(delay, self.check_interval)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def step(self):
+        '''Apply passed boundaries and logged changes, seconds to next
+        boundary or None'''
+        events, delay = await sync_to_async(
+            self.refresh_in_thread, thread_sensitive=False,
+        )(frozenset(self.places))
+        for city_id, street_id, event, data in events:
+            for place, subscribers in self.places.items():
+                if in_place(place, city_id, street_id):
+                    for subscriber in subscribers:
+                        if not subscriber.needs_snapshot:
+                            subscriber.send(event, data)
+        for place, subscribers in self.places.items():
+            if place in self.watched_places:
+                self.send_snapshots(place, subscribers)
+        return delay
+
+    def send_snapshots(self, place: tuple, subscribers: set):
+        snapshot = None
+        for subscriber in subscribers:
+            if not subscriber.needs_snapshot:
+                continue
+            if snapshot is None:
+                snapshot = {'opened': sorted(
+                    shop_id for shop_id in self.opened
+                    if in_place(place, *self.shops[shop_id]))}
+            subscriber.send('snapshot', snapshot)
+            subscriber.needs_snapshot = False
+
+    def refresh_in_thread(self, places: frozenset) -> tuple:
+        close_old_connections()
+        try:
+            return self.refresh(places)
+        except Exception:
+            # change log may be read past changes not applied yet, next
+            # refresh reloads shops of every place
+            self.watched_places = frozenset()
+            raise
+        finally:
+            close_old_connections()
+
+    def refresh(self, places: frozenset) -> tuple:
+        '''([(city id, street id, event, data)], seconds to next boundary)
+
+        Shops are reloaded when places or rows change, opened ones are
+        reloaded then and after boundary. Shops new to watched places get
+        no transition events
+        '''
+        if not places:
+            self.watched_places, self.shops, self.opened = places, {}, set()
+            self.boundary_at = None
+            return [], None
+        changed_ids = self.read_changes()
+        if not changed_ids and places == self.watched_places \
+                and not self.boundary_passed():
+            return [], self.seconds_to_boundary()
+
+        shops = Shop.objects.filter(
+            reduce(operator.or_, map(place_condition, places)))
+        previous_shops = self.shops
+        if changed_ids or places != self.watched_places:
+            self.shops = {shop_id: (city_id, street_id) for shop_id, city_id,
+                          street_id in shops.values_list('id', 'city_id',
+                                                         'street_id')}
+        events = self.change_events(changed_ids, previous_shops)
+
+        # shop committed after change log was read is not in self.shops,
+        # it joins with its change on next refresh
+        opened = set(shops.opened().values_list('id', flat=True)) \
+            & self.shops.keys()
+        for shop_id in (opened ^ self.opened) & previous_shops.keys():
+            if shop_id in self.shops:
+                event = 'opened' if shop_id in opened else 'closed'
+                events.append((*self.shops[shop_id], event, {'id': shop_id}))
+        self.opened = opened
+        self.watched_places = places
+
+        self.boundary_at = None
+        if (boundary := shops.next_boundary()) is not None:
+            self.boundary_at = timezone.now() \
+                + timedelta(seconds=seconds_until(boundary))
+        return events, self.seconds_to_boundary()
+
+    def boundary_passed(self) -> bool:
+        return self.boundary_at is not None \
+            and timezone.now() >= self.boundary_at
+
+    def seconds_to_boundary(self):
+        if self.boundary_at is None:
+            return None
+        return (self.boundary_at - timezone.now()).total_seconds()
+
+    def read_changes(self) -> set:
+        '''Ids of shops changed since last read, all of them on city change'''
+        if self.token is None:
+            self.token = RowChange.objects.aggregate(Max('id'))['id__max'] or 0
+            return set()
+        changes = list(RowChange.objects.filter(
+            id__gt=self.token,
+            table__in=(City._meta.label_lower, Shop._meta.label_lower),
+        ).order_by('id').values_list('id', 'table', 'row_id'))
+        if not changes:
+            return set()
+        self.token = changes[-1][0]
+        if any(table == City._meta.label_lower for _, table, _ in changes):
+            # renames and timezone changes alter shops of city
+            return set(self.shops) | {row_id for _, table, row_id in changes
+                                      if table == Shop._meta.label_lower}
+        return {row_id for _, _, row_id in changes}
+
+    def change_events(self, changed_ids: set, previous_shops: dict) -> list:
+        events = []
+        changed = [shop_id for shop_id in changed_ids if shop_id in self.shops]
+        rows = Shop.objects.filter(id__in=changed) \
+                           .values_list(*shop_row_fields, 'city__timezone')
+        for shop in shop_rows_to_representation(list(rows)):
+            place = self.shops[shop['id']]
+            events.append((*place, 'changed', shop))
+            if (previous := previous_shops.get(shop['id'], place)) != place:
+                events.append((*previous, 'changed', shop))  # moved out
+        for shop_id in changed_ids - self.shops.keys():
+            if shop_id in previous_shops:
+                events.append((*previous_shops[shop_id], 'deleted',
+                               {'id': shop_id}))
+        return events
+
+
+scheduler = EventScheduler()
+
+
+async def shop_events(scope, receive, send, heartbeat: float = 15):
+    '''ASGI application streaming events of shops of one place'''
+    if scope['method'] != 'GET':
+        await send_json(send, 405, {'detail': 'Method not allowed.'})
+        return
+    parameters = dict(parse_qsl(scope['query_string'].decode()))
+    place, errors = await sync_to_async(get_place, thread_sensitive=False)(
+        parameters.get('city'), parameters.get('street'))
+    if errors:
+        await send_json(send, 400, errors)
+        return
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream'),
+        (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no'),  # nginx must not buffer stream
+    ]})
+    subscriber = scheduler.subscribe(place)
+    scheduler.wake()
+    disconnect = asyncio.ensure_future(wait_disconnect(receive, subscriber))
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(subscriber.queue.get(),
+                                              heartbeat)
+            except asyncio.TimeoutError:
+                body = b': keepalive\n\n'  # comment keeps proxies from closing
+            else:
+                if item is None:
+                    break
+                body = encode_event(*item)
+            await send({'type': 'http.response.body', 'body': body,
+                        'more_body': True})
+    finally:
+        disconnect.cancel()
+        scheduler.unsubscribe(subscriber)
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def get_place(city_name, street_name) -> tuple:
+    '''((city id, street ids), errors) resolved by cached names'''
+    close_old_connections()
+    if not city_name and not street_name:
+        return None, {'detail': 'city or street parameter is required'}
+    versions = {table: version for table, version, _
+                in TableVersion.objects.of((City, Street))}
+    city_id = street_ids = None
+    if city_name:
+        cities = city_cache.get(city_name,
+                                versions.get(City._meta.label_lower))
+        if not cities:
+            return None, {'city': 'no such city in database'}
+        city_id = cities[0][0]
+    if street_name:
+        streets = street_cache.get(street_name,
+                                   versions.get(Street._meta.label_lower))
+        street_ids = tuple(sorted(
+            street_id for street_id, street_city_id in streets
+            if city_id in (None, street_city_id)
+        ))
+        if not street_ids:
+            return None, {'street': 'no such street in database'}
+    return (city_id, street_ids), None
+
+
+async def wait_disconnect(receive, subscriber: Subscriber):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+    subscriber.close()
+
+
+def encode_event(event: str, data) -> bytes:
+    return b'event: ' + event.encode() + b'\ndata: ' + dumps(data) + b'\n\n'
+
+
+async def send_json(send, status: int, data):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': dumps(data)})
@@ -0,0 +1,90 @@
+from math import asin, cos, radians, sin, sqrt
+
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_LENGTH = 12
+EARTH_RADIUS = 6_371_000  # meters
+METERS_PER_DEGREE = 111_195  # of latitude
+
+
+def encode(latitude: float, longitude: float,
+           length: int = GEOHASH_LENGTH) -> str:
+    '''Geohash of point, cells of its prefixes contain the point'''
+    ranges = [[-180.0, 180.0], [-90.0, 90.0]]  # longitude bits go first
+    values = (longitude, latitude)
+    chars = []
+    bit = 0
+    for _ in range(length):
+        index = 0
+        for _ in range(5):
+            low, high = ranges[bit % 2]
+            middle = (low + high) / 2
+            index <<= 1
+            if values[bit % 2] >= middle:
+                index |= 1
+                ranges[bit % 2][0] = middle
+            else:
+                ranges[bit % 2][1] = middle
+            bit += 1
+        chars.append(BASE32[index])
+    return ''.join(chars)
+
+
+def cell_size(length: int) -> tuple:
+    '''(latitude, longitude) degrees spanned by cell of geohash length'''
+    bits = 5 * length
+    return 180 / 2 ** (bits // 2), 360 / 2 ** ((bits + 1) // 2)
+
+
+def distance(latitude1: float, longitude1: float,
+             latitude2: float, longitude2: float) -> float:
+    '''Great circle distance in meters'''
+    latitude1, longitude1, latitude2, longitude2 = map(
+        radians, (latitude1, longitude1, latitude2, longitude2))
+    a = sin((latitude2 - latitude1) / 2) ** 2 + \
+        cos(latitude1) * cos(latitude2) * sin((longitude2 - longitude1) / 2) ** 2
+    return 2 * EARTH_RADIUS * asin(min(1.0, sqrt(a)))
+
+
+def next_prefix(prefix: str):
+    '''Smallest prefix after every geohash starting with `prefix`
+
+    Turns prefix search into range scan on plain index, which works with
+    any collation. None when no geohash comes after
+    '''
+    prefix = prefix.rstrip(BASE32[-1])
+    if not prefix:
+        return None
+    return prefix[:-1] + BASE32[BASE32.index(prefix[-1]) + 1]
+
+
+def covering_prefixes(latitude: float, longitude: float,
+                      radius: float) -> set:
+    '''Geohash prefixes whose cells cover circle of radius meters
+
+    Picks longest prefix with cells not smaller than radius, so the circle
+    fits into cell of center and its 8 neighbours
+    '''
+    radius_degrees = radius / METERS_PER_DEGREE
+    # cells are narrowest at the circle's edge farthest from equator
+    widest_latitude = min(90.0, abs(latitude) + radius_degrees)
+    meters_per_longitude = METERS_PER_DEGREE * cos(radians(widest_latitude))
+
+    length = 1
+    while length < GEOHASH_LENGTH:
+        height, width = cell_size(length + 1)
+        if height * METERS_PER_DEGREE < radius \
+                or width * meters_per_longitude < radius:
+            break
+        length += 1
+
+    height, width = cell_size(length)
+    return {
+        encode(
+            max(-90.0, min(90.0, latitude + height * row)),
+            (longitude + width * column + 180) % 360 - 180,
+            length,
+        )
+        for row in (-1, 0, 1)
+        for column in (-1, 0, 1)
+    }
@@ -0,0 +1,127 @@
+import json
+import subprocess
+from itertools import combinations
+from time import perf_counter
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from cityshops.benchmark import summarize
+from cityshops.models import City, Shop, Street
+from cityshops.views import ShopList
+
+
+class Command(BaseCommand):
+    help = ('Measure latency percentiles and query counts of every endpoint '
+            'and ShopList filter combination, print results as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20,
+                            help='requests per case')
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='keep response cache between requests')
+        parser.add_argument('--output', help='write JSON to file')
+        parser.add_argument('--compare', help='JSON of previous run to '
+                                              'compare p50 latency with')
+
+    @override_settings(ALLOWED_HOSTS=['testserver'], DEBUG=False)
+    def handle(self, *args, **options):
+        '''Requests go through test client to handler, no server needed'''
+        report = {'meta': self.get_meta(), 'results': {}}
+        client = Client()
+        for name, path, data in self.get_cases():
+            report['results'][name] = self.measure(
+                client, path, data, options['requests'], options['warm_cache'],
+            )
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            with open(options['compare']) as previous_file:
+                self.compare(json.load(previous_file), report)
+
+    def get_meta(self) -> dict:
+        try:
+            commit = subprocess.run(
+                ('git', 'rev-parse', 'HEAD'), capture_output=True, text=True,
+            ).stdout.strip() or None
+        except OSError:
+            commit = None
+        return {
+            'commit': commit,
+            'database': connection.vendor,
+            'created_at': timezone.now().isoformat(),
+            'cities': City.objects.count(),
+            'streets': Street.objects.count(),
+            'shops': Shop.objects.count(),
+        }
+
+    def get_cases(self) -> list:
+        '''(name, path, query) of each endpoint and filter combination'''
+        shop = Shop.objects.select_related('city', 'street') \
+                           .order_by('-id').first()
+        if shop is None:
+            raise CommandError('No shops in database, run generate_shops first')
+
+        cases = [
+            ('city_list', '/city/', {}),
+            ('city_streets_list', f'/city/{shop.city_id}/street/', {}),
+        ]
+        values = {'city': shop.city.name, 'street': shop.street.name}
+        filters = ShopList.valid_search_parameters
+        for size in range(len(filters) + 1):
+            for combination in combinations(filters, size):
+                data = {parameter: values.get(parameter)
+                        for parameter in combination}
+                openness = ('0', '1') if 'opened' in combination else (None,)
+                for opened in openness:
+                    if opened is not None:
+                        data['opened'] = opened
+                    query = '&'.join(f'{key}={value}' if key == 'opened' else key
+                                     for key, value in data.items())
+                    name = f'shop_list?{query}' if query else 'shop_list'
+                    cases.append((name, '/shop/', dict(data)))
+
+        if shop.latitude is not None:
+            point = {'lat': shop.latitude, 'lon': shop.longitude}
+            cases += [
+                ('shop_nearby', '/shop/nearby/', point),
+                ('shop_nearby?radius=10000&opened=1', '/shop/nearby/',
+                 {**point, 'radius': 10_000, 'opened': '1'}),
+            ]
+        return cases
+
+    def measure(self, client, path: str, data: dict, total: int,
+                warm_cache: bool) -> dict:
+        latencies, queries = [], []
+        started = perf_counter()
+        for _ in range(total):
+            if not warm_cache:
+                cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                request_started = perf_counter()
+                response = client.get(path, data)
+                latencies.append(perf_counter() - request_started)
+            queries.append(len(context))
+        result = summarize(latencies, perf_counter() - started)
+        result.update(status=response.status_code, queries=max(queries))
+        return result
+
+    def compare(self, previous: dict, current: dict):
+        self.stderr.write(f'{"case":<40} {"p50 before":>10} {"p50 now":>10}')
+        for name, result in current['results'].items():
+            if (before := previous['results'].get(name)) is None:
+                continue
+            change = result['p50_ms'] / before['p50_ms'] - 1 \
+                if before['p50_ms'] else 0
+            self.stderr.write(f'{name:<40} {before["p50_ms"]:>10} '
+                              f'{result["p50_ms"]:>10} {change:+.0%}')
@@ -0,0 +1,103 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+from threading import Lock
+from time import perf_counter
+from wsgiref.util import setup_testing_defaults
+
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+
+from cityshops.benchmark import summarize
+
+
+class Command(BaseCommand):
+    help = ('Compare request latency with connection per request and with '
+            'persistent connections under concurrent load')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/city/')
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--max-age', type=int, default=60,
+                            help='CONN_MAX_AGE of persistent mode')
+
+    @override_settings(ALLOWED_HOSTS=['127.0.0.1'], DEBUG=False)
+    def handle(self, *args, **options):
+        '''Requests go to WSGI handler, which opens and closes connections
+        on request signals as under server. Test client keeps them open'''
+        path = options['path']
+        total, concurrency = options['requests'], options['concurrency']
+        results = {}
+        for mode, max_age in (('connection_per_request', 0),
+                              ('persistent', options['max_age'])):
+            cache.clear()  # measure database reads, not response cache
+            with conn_max_age(max_age), count_connections() as opened:
+                started = perf_counter()
+                latencies = self.run(path, total, concurrency)
+                results[mode] = summarize(latencies, perf_counter() - started)
+            results[mode]['connections_opened'] = opened[0]
+        self.stdout.write(json.dumps(
+            {'path': path, 'requests': total, 'concurrency': concurrency,
+             'database': connections['default'].vendor, 'results': results},
+            indent=2,
+        ))
+
+    def run(self, path: str, total: int, concurrency: int) -> list:
+        '''Worker threads keep own connections, as threaded server does'''
+        handler = WSGIHandler()
+
+        def get(requests: int) -> list:
+            latencies = []
+            for _ in range(requests):
+                environ = {'PATH_INFO': path, 'wsgi.input': BytesIO()}
+                setup_testing_defaults(environ)
+                started = perf_counter()
+                response = handler(environ, lambda status, headers: None)
+                b''.join(response)
+                response.close()  # sends request_finished
+                latencies.append(perf_counter() - started)
+            connections.close_all()
+            return latencies
+
+        shares = [total // concurrency + (worker < total % concurrency)
+                  for worker in range(concurrency)]
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return [latency for latencies in executor.map(get, shares)
+                    for latency in latencies]
+
+
+@contextmanager
+def conn_max_age(seconds: int):
+    '''Connections of every thread read settings dict of their alias'''
+    settings_dicts = [connections.settings[alias] for alias in connections]
+    saved = [settings_dict.get('CONN_MAX_AGE', 0)
+             for settings_dict in settings_dicts]
+    for settings_dict in settings_dicts:
+        settings_dict['CONN_MAX_AGE'] = seconds
+    try:
+        yield
+    finally:
+        for settings_dict, seconds in zip(settings_dicts, saved):
+            settings_dict['CONN_MAX_AGE'] = seconds
+
+
+@contextmanager
+def count_connections():
+    opened = [0]
+    lock = Lock()
+
+    def count(**kwargs):
+        with lock:
+            opened[0] += 1
+
+    connection_created.connect(count, weak=False)
+    try:
+        yield opened
+    finally:
+        connection_created.disconnect(count)
@@ -0,0 +1,68 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+
+from cityshops.benchmark import summarize
+
+
+class Command(BaseCommand):
+    help = 'Compare latency of sync WSGI, sync ASGI and async ASGI read paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/shop/',
+                            help='sync path, async one is prefixed by /async')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=20)
+
+    @override_settings(ALLOWED_HOSTS=['testserver'], DEBUG=False)
+    def handle(self, *args, **options):
+        '''Requests go through test clients to handlers, no server needed'''
+        path = options['path']
+        total, concurrency = options['requests'], options['concurrency']
+        modes = {
+            'wsgi_sync': lambda: self.run_wsgi(path, total, concurrency),
+            'asgi_sync': lambda: asyncio.run(
+                self.run_asgi(path, total, concurrency)),
+            'asgi_async': lambda: asyncio.run(
+                self.run_asgi('/async' + path, total, concurrency)),
+        }
+        results = {}
+        for mode, run in modes.items():
+            cache.clear()  # measure database reads, not response cache
+            started = perf_counter()
+            latencies = run()
+            results[mode] = summarize(latencies, perf_counter() - started)
+        self.stdout.write(json.dumps(
+            {'path': path, 'requests': total, 'concurrency': concurrency,
+             'results': results},
+            indent=2,
+        ))
+
+    def run_wsgi(self, path: str, total: int, concurrency: int) -> list:
+        '''Threads calling WSGI handler, as threaded WSGI server does'''
+        def get(_):
+            started = perf_counter()
+            Client().get(path)
+            return perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(get, range(total)))
+
+    async def run_asgi(self, path: str, total: int, concurrency: int) -> list:
+        '''Coroutines calling ASGI handler, as ASGI server does'''
+        semaphore = asyncio.Semaphore(concurrency)
+        client = AsyncClient()
+
+        async def get():
+            async with semaphore:
+                started = perf_counter()
+                await client.get(path)
+                return perf_counter() - started
+
+        return await asyncio.gather(*(get() for _ in range(total)))
+
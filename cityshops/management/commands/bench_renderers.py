@@ -0,0 +1,83 @@
+import json
+import random
+import tracemalloc
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from cityshops.dataset import random_opening_hours
+from cityshops.renderers import FastJSONRenderer, dumps, orjson
+from cityshops.views import ShopExport
+
+
+class Command(BaseCommand):
+    help = ('Compare time and peak memory of rendering shop list by '
+            'JSONRenderer and FastJSONRenderer, and of encoding it as '
+            'JSON Lines export does')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='best time of this many renders is reported')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        '''Rows are built in memory as ShopSerializer represents them'''
+        data = make_shop_list(options['rows'], random.Random(options['seed']))
+        fast = FastJSONRenderer()
+        modes = {
+            'json_renderer': lambda: [JSONRenderer().render(data)],
+            'fast_renderer': lambda: [fast.render(data)],
+            # as ShopExport streams, chunks are dropped once sent
+            'json_lines_export': lambda: [
+                len(b''.join(dumps(row, newline=True) for row in chunk))
+                for chunk in iter_chunks(data, ShopExport.chunk_size)],
+        }
+        results = {}
+        for mode, render in modes.items():
+            seconds = []
+            for _ in range(options['repeat']):
+                started = perf_counter()
+                render()
+                seconds.append(perf_counter() - started)
+            tracemalloc.start()
+            render()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[mode] = {'best_ms': round(min(seconds) * 1000, 2),
+                             'peak_memory_mb': round(peak / 2 ** 20, 2)}
+        self.stdout.write(json.dumps(
+            {'rows': options['rows'], 'orjson': orjson is not None,
+             'bytes': len(fast.render(data)), 'results': results},
+            indent=2,
+        ))
+
+
+def iter_chunks(data: list, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def make_shop_list(rows: int, rng: random.Random) -> list:
+    shops = []
+    for shop_id in range(1, rows + 1):
+        opening, closing = random_opening_hours(rng)
+        shops.append({
+            'id': shop_id,
+            'name': f'Shop {shop_id}',
+            'city': f'City {shop_id % 1000}',
+            'street': f'Street {shop_id % 100_000}',
+            'house_numbers': str(rng.randint(1, 200)),
+            'latitude': rng.uniform(-60, 70),
+            'longitude': rng.uniform(-180, 180),
+            'opening_time': opening.isoformat(),
+            'closing_time': closing.isoformat(),
+            'opening_hours': [
+                {'weekday': weekday, 'opening_time': opening.isoformat(),
+                 'closing_time': closing.isoformat()}
+                for weekday in range(7)
+            ],
+            'is_opened': rng.random() < 0.5,
+        })
+    return shops
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from cityshops import dataset
+from cityshops.models import City, Shop, Street
+from cityshops.signals import tables_changed
+from cityshops.views import ShopList
+
+
+class Rollback(Exception):
+    '''Raised to drop seeded data after explain'''
+
+
+class Command(BaseCommand):
+    help = 'Print query plans of ShopList search filters on seeded dataset'
+
+    search_shapes = (
+        ('city', 'street'),
+        ('city', 'street', 'opened'),
+        ('city', 'opened'),
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cities', type=int, default=100)
+        parser.add_argument('--streets', type=int, default=20,
+                            help='streets per city')
+        parser.add_argument('--shops', type=int, default=50,
+                            help='shops per street')
+        parser.add_argument('--keep', action='store_true',
+                            help='do not roll back seeded data')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                dataset.generate(options['cities'], options['streets'],
+                                 options['shops'], prefix='Explain ')
+                with connection.cursor() as cursor:
+                    cursor.execute(f'ANALYZE {Shop._meta.db_table}')
+                self.explain_search_shapes()
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            tables_changed(City, Street, Shop)  # rollback sends no signals
+
+    def explain_search_shapes(self):
+        street = Street.objects.select_related('city') \
+                               .filter(name__startswith='Explain ').last()
+        values = {'city': street.city.name, 'street': street.name,
+                  'opened': '1'}
+        for shape in self.search_shapes:
+            params = {parameter: values[parameter] for parameter in shape}
+            queryset = self.get_search_queryset(params)
+            self.stdout.write(f'--- {", ".join(shape)}')
+            self.stdout.write(queryset.explain())
+
+    def get_search_queryset(self, params: dict):
+        '''Queryset as ShopList builds it for given search
+
+        Schedule index is disabled, so opened search shows database query
+        used when index finds too many shops
+        '''
+        view = ShopList()
+        view.schedule_index_max_ids = 0
+        view.request = Request(APIRequestFactory().get('/shop/', params))
+        view.kwargs = {}
+        return view.get_queryset()
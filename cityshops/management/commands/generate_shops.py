@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from cityshops import dataset
+
+
+class Command(BaseCommand):
+    help = 'Fill database with synthetic cities, streets and shops'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cities', type=int, default=1000)
+        parser.add_argument('--streets', type=int, default=100,
+                            help='streets per city')
+        parser.add_argument('--shops', type=int, default=10,
+                            help='shops per street')
+        parser.add_argument('--prefix', default='',
+                            help='prefix of generated names')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='random seed of opening hours')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        created = dataset.generate(
+            options['cities'], options['streets'], options['shops'],
+            prefix=options['prefix'], seed=options['seed'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(f'Created {created} shops')
@@ -0,0 +1,48 @@
+import json
+from urllib.error import URLError
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ('Print per endpoint request profiles collected by running server '
+            'with REQUEST_PROFILING enabled')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/profiling/',
+                            help='profiling endpoint of local server')
+        parser.add_argument('--json', action='store_true',
+                            help='print raw JSON instead of table')
+
+    def handle(self, *args, **options):
+        '''Stats live in server process, so ask it over HTTP
+
+        Server lets in PROFILING_STATS_TOKEN of this process's settings
+        '''
+        request = Request(options['url'], headers={
+            'X-Profiling-Token': settings.PROFILING_STATS_TOKEN,
+        })
+        try:
+            with urlopen(request) as response:
+                stats = json.load(response)
+        except (URLError, ValueError) as error:
+            raise CommandError(f'Cannot read {options["url"]}: {error}')
+
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+        for endpoint, endpoint_stats in stats.items():
+            self.stdout.write(self.format_endpoint(endpoint, endpoint_stats))
+
+    def format_endpoint(self, endpoint: str, stats: dict) -> str:
+        timings = ' '.join(f'{name}={ms}ms'
+                           for name, ms in stats['mean_ms'].items())
+        histogram = ' '.join(f'{bucket}:{count}'
+                             for bucket, count in stats['histogram'].items()
+                             if count)
+        return (f'{endpoint}\n'
+                f'  requests={stats["count"]} '
+                f'queries={stats["mean_queries"]} {timings}\n'
+                f'  {histogram}')
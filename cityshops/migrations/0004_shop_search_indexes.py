@@ -0,0 +1,21 @@
+# Generated by Django 3.2.9 on 2026-10-18 10:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cityshops', '0003_shop'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['city', 'street'], name='shop_city_street_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shop',
+            index=models.Index(fields=['city', 'opening_time', 'closing_time'], name='shop_city_hours_idx'),
+        ),
+    ]
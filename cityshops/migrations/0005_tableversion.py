@@ -0,0 +1,30 @@
+# Generated by Django 3.2.9 on 2026-10-18 10:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def create_table_versions(apps, schema_editor):
+    TableVersion = apps.get_model('cityshops', 'TableVersion')
+    for table in ('cityshops.city', 'cityshops.street', 'cityshops.shop'):
+        TableVersion.objects.get_or_create(table=table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cityshops', '0004_shop_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=64, unique=True)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(create_table_versions, migrations.RunPython.noop),
+    ]
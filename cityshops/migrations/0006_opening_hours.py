@@ -0,0 +1,82 @@
+# Generated by Django 3.2.9 on 2026-10-18 10:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+DAY = 24 * 60 * 60
+
+
+def seconds_of_day(moment) -> int:
+    return (moment.hour * 60 + moment.minute) * 60 + moment.second
+
+
+def create_daily_opening_hours(apps, schema_editor):
+    '''Same interval on every weekday from opening and closing time'''
+    Shop = apps.get_model('cityshops', 'Shop')
+    OpeningHours = apps.get_model('cityshops', 'OpeningHours')
+    rows = Shop.objects.exclude(opening_time=models.F('closing_time')) \
+                       .values_list('id', 'opening_time', 'closing_time')
+    batch = []
+    for shop_id, opening, closing in rows.iterator(chunk_size=2000):
+        for weekday in range(7):
+            start = weekday * DAY + seconds_of_day(opening)
+            end = weekday * DAY + seconds_of_day(closing)
+            batch.append(OpeningHours(
+                shop_id=shop_id, weekday=weekday, opening_time=opening,
+                closing_time=closing, start=start, end=end,
+            ))
+        if len(batch) >= 14000:
+            OpeningHours.objects.bulk_create(batch)
+            batch = []
+    OpeningHours.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cityshops', '0005_tableversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OpeningHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('opening_time', models.TimeField()),
+                ('closing_time', models.TimeField()),
+                ('start', models.PositiveIntegerField(editable=False)),
+                ('end', models.PositiveIntegerField(editable=False)),
+            ],
+            options={
+                'ordering': ('weekday', 'opening_time'),
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='shop',
+            name='shop_city_hours_idx',
+        ),
+        migrations.AlterField(
+            model_name='shop',
+            name='closing_time',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='shop',
+            name='opening_time',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='openinghours',
+            name='shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='opening_hours', to='cityshops.shop'),
+        ),
+        # before index, so rows are not indexed one by one
+        migrations.RunPython(create_daily_opening_hours,
+                             migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='openinghours',
+            index=models.Index(fields=['start', 'end', 'shop'], name='openinghours_week_idx'),
+        ),
+    ]
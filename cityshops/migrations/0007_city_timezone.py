@@ -0,0 +1,19 @@
+# Generated by Django 3.2.9 on 2026-10-18 10:33
+
+import cityshops.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cityshops', '0006_opening_hours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='city',
+            name='timezone',
+            field=models.CharField(default='UTC', max_length=64, validators=[cityshops.models.validate_timezone]),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.9 on 2026-10-18 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cityshops', '0008_shop_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RowChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=64)),
+                ('row_id', models.PositiveBigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+            ],
+            options={
+                'unique_together': {('table', 'row_id')},
+            },
+        ),
+    ]
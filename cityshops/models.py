@@ -1,11 +1,27 @@
+import operator
+from datetime import datetime, time
+from functools import lru_cache, reduce
+
+import pytz
 from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.utils import timezone
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Now
+
+from cityshops import geo
+
+
+def validate_timezone(name: str):
+    if name not in pytz.all_timezones_set:
+        raise ValidationError(f'Unknown timezone "{name}"')
 
 
 class City(models.Model):
     name = models.CharField(max_length=256, unique=True)
+    timezone = models.CharField(max_length=64, default='UTC',
+                                validators=[validate_timezone])
 
     def __str__(self) -> str:
         return self.name
@@ -22,24 +38,529 @@ class Street(models.Model):
         return self.name
 
 
+DAY = 24 * 60 * 60
+WEEK = 7 * DAY
+
+WEEKDAYS = [(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'),
+            (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')]
+
+
+def seconds_of_day(moment: time) -> float:
+    seconds = (moment.hour * 60 + moment.minute) * 60 + moment.second
+    return seconds + moment.microsecond / 10**6
+
+
+def seconds_of_week() -> float:
+    '''Seconds since last Monday midnight'''
+    now = timezone.now()
+    return now.weekday() * DAY + seconds_of_day(now.time())
+
+
+# UTC offsets of timezones change at quarter hours only
+OFFSET_PERIOD = 15 * 60
+
+
+@lru_cache(maxsize=4096)
+def offset_in_period(timezone_name: str, period: int) -> int:
+    moment = datetime.fromtimestamp(period * OFFSET_PERIOD, pytz.utc)
+    local = moment.astimezone(pytz.timezone(timezone_name))
+    return int(local.utcoffset().total_seconds())
+
+
+def utc_offset(timezone_name: str) -> int:
+    '''Seconds east of UTC of timezone right now, cached per quarter hour'''
+    if timezone_name == 'UTC':
+        return 0
+    period = int(timezone.now().timestamp() // OFFSET_PERIOD)
+    return offset_in_period(timezone_name, period)
+
+
+def seconds_to_offset_change(timezone_name: str, within: float):
+    '''Seconds until next DST transition of timezone, None if not within'''
+    if timezone_name == 'UTC':
+        return None
+    now = timezone.now().timestamp()
+    first = int(now // OFFSET_PERIOD)
+    last = int((now + within) // OFFSET_PERIOD)
+    offset = offset_in_period(timezone_name, first)
+    if offset_in_period(timezone_name, last) == offset:
+        return None
+    while last - first > 1:  # at most one transition a week
+        middle = (first + last) // 2
+        if offset_in_period(timezone_name, middle) == offset:
+            first = middle
+        else:
+            last = middle
+    return last * OFFSET_PERIOD - now
+
+
+def local_seconds_of_week(timezone_name: str) -> float:
+    return (seconds_of_week() + utc_offset(timezone_name)) % WEEK
+
+
+def group_by_offset(timezone_names) -> dict:
+    '''Current UTC offset -> names of timezones having it'''
+    groups = {}
+    for name in timezone_names:
+        groups.setdefault(utc_offset(name), []).append(name)
+    return groups
+
+
+def seconds_until(boundary: int) -> float:
+    '''Seconds from now to boundary counted from this week's Monday'''
+    return boundary - seconds_of_week()
+
+
+def week_interval(weekday: int, opening: time, closing: time) -> tuple:
+    '''(start, end) seconds since Monday midnight of opening hours
+
+    Closing time before opening one means closing on next day, so end of
+    Sunday night interval lies past the week
+    '''
+    start = weekday * DAY + int(seconds_of_day(opening))
+    end = weekday * DAY + int(seconds_of_day(closing))
+    if closing < opening:
+        end += DAY
+    return start, end
+
+
+def is_in_intervals(moment: float, intervals) -> bool:
+    '''Whether second of week is inside any of (start, end) intervals'''
+    return any(start <= moment < end or start <= moment + WEEK < end
+               for start, end in intervals)
+
+
+def daily_hours(opening: time, closing: time) -> list:
+    '''(weekday, opening, closing) of same hours every day'''
+    if opening == closing:  # never opened
+        return []
+    return [(weekday, opening, closing) for weekday, _ in WEEKDAYS]
+
+
+class ShopQuerySet(models.QuerySet):
+    '''Opening hours are checked in local time of shop's city
+
+    Methods take distinct timezones of cities, fetched when not given, and
+    check each group of timezones with same UTC offset by own range query
+    '''
+
+    def opened(self, timezones=None):
+        '''Shops opened right now, same boundaries as Shop.is_opened'''
+        return self.filter(self.opened_condition(timezones))
+
+    def closed(self, timezones=None):
+        '''Shops closed right now, same boundaries as Shop.is_closed'''
+        return self.exclude(self.opened_condition(timezones))
+
+    def opened_condition(self, timezones=None) -> models.Q:
+        groups = self.group_timezones(timezones)
+        now = seconds_of_week()
+        conditions = []
+        for offset, names in groups.items():
+            opened_ids = OpeningHours.objects.at((now + offset) % WEEK) \
+                                             .values('shop_id')
+            condition = models.Q(id__in=opened_ids)
+            if len(groups) > 1:
+                condition &= models.Q(city__timezone__in=names)
+            conditions.append(condition)
+        if not conditions:
+            return models.Q(pk__in=[])
+        return reduce(operator.or_, conditions)
+
+    def group_timezones(self, timezones=None) -> dict:
+        if timezones is None:
+            timezones = City.objects.order_by() \
+                                    .values_list('timezone', flat=True) \
+                                    .distinct()
+        return group_by_offset(timezones)
+
+    def next_boundary(self, timezones=None):
+        '''Nearest opening or closing of shops in queryset after now
+
+        DST transition of shop's timezone counts as boundary too. Returns
+        seconds since this week's Monday midnight in UTC, past the week
+        when boundary is next week. None for shops without opening hours
+        '''
+        groups = self.group_timezones(timezones)
+        now = seconds_of_week()
+        intervals = OpeningHours.objects.filter(shop__in=self.values('id'))
+        aggregates = {}
+        for number, (offset, names) in enumerate(groups.items()):
+            local_now = (now + offset) % WEEK
+            group = models.Q(shop__city__timezone__in=names) \
+                if len(groups) > 1 else models.Q()
+            aggregates.update({
+                f'next_start_{number}': models.Min(
+                    'start', filter=group & models.Q(start__gt=local_now)),
+                f'next_end_{number}': models.Min(
+                    'end', filter=group & models.Q(end__gt=local_now)),
+                # Sunday night intervals closing on this Monday
+                f'next_wrapped_end_{number}': models.Min(
+                    models.F('end') - WEEK,
+                    filter=group & models.Q(end__gt=local_now + WEEK)),
+                f'first_start_{number}': models.Min('start', filter=group),
+            })
+        boundaries = intervals.aggregate(**aggregates) if aggregates else {}
+
+        delays = []
+        for number, (offset, names) in enumerate(groups.items()):
+            if (first_start := boundaries[f'first_start_{number}']) is None:
+                continue
+            candidates = [boundaries[f'{name}_{number}'] for name in
+                          ('next_start', 'next_end', 'next_wrapped_end')]
+            candidates.append(first_start + WEEK)
+            delay = min(candidate for candidate in candidates
+                        if candidate is not None) - (now + offset) % WEEK
+            delays.append(delay)
+            delays.extend(
+                change for name in names
+                if (change := seconds_to_offset_change(name, delay)) is not None
+            )
+        if not delays:
+            return None
+        return now + min(delays)
+
+    def seconds_to_next_boundary(self, timezones=None):
+        '''Seconds until nearest opening or closing of shops in queryset
+
+        Returns None for shops without opening hours
+        '''
+        if (boundary := self.next_boundary(timezones)) is None:
+            return None
+        return seconds_until(boundary)
+
+    def near(self, latitude: float, longitude: float, radius: float):
+        '''Shops in geohash cells covering circle, superset of ones within'''
+        conditions = []
+        for prefix in geo.covering_prefixes(latitude, longitude, radius):
+            condition = models.Q(geohash__gte=prefix)
+            if (end := geo.next_prefix(prefix)) is not None:
+                condition &= models.Q(geohash__lt=end)
+            conditions.append(condition)
+        return self.filter(reduce(operator.or_, conditions))
+
+    def nearest(self, latitude: float, longitude: float, radius: float,
+                limit: int, opened=None, first_radius: float = 250) -> list:
+        '''(distance, id) of at most `limit` nearest shops within radius
+
+        `opened` True or False keeps shops opened or closed right now,
+        checked against hours of candidates instead of whole hours index.
+        Searched circle doubles from `first_radius` until it holds `limit`
+        shops, so dense areas read few rows
+        '''
+        searched = min(first_radius, radius)
+        while True:
+            candidates = self.near(latitude, longitude, searched)
+            rows = candidates.values_list('id', 'latitude', 'longitude',
+                                          'city__timezone')
+            found = sorted(
+                (distance, shop_id, timezone_name)
+                for shop_id, *point, timezone_name in rows
+                if (distance := geo.distance(latitude, longitude, *point))
+                <= searched
+            )
+            if opened is not None:
+                found = self.filter_opened(found, candidates, opened)
+            if len(found) >= limit or searched >= radius:
+                return [(distance, shop_id)
+                        for distance, shop_id, _ in found[:limit]]
+            searched = min(searched * 2, radius)
+
+    @staticmethod
+    def filter_opened(found: list, candidates, opened: bool) -> list:
+        intervals = {}
+        rows = OpeningHours.objects.filter(shop__in=candidates.values('id')) \
+                                   .values_list('shop_id', 'start', 'end')
+        for shop_id, start, end in rows:
+            intervals.setdefault(shop_id, []).append((start, end))
+        local_now = {}
+        for _, _, timezone_name in found:
+            if timezone_name not in local_now:
+                local_now[timezone_name] = local_seconds_of_week(timezone_name)
+        return [
+            row for row in found
+            if is_in_intervals(local_now[row[2]],
+                               intervals.get(row[1], ())) == opened
+        ]
+
+    def create_daily_opening_hours(self, batch_size: int = 5000):
+        '''Add opening hours of daily time of shops which have none
+
+        For bulk created shops, which skip Shop.save
+        '''
+        shops = self.filter(opening_hours__isnull=True,
+                            opening_time__isnull=False,
+                            closing_time__isnull=False)
+        rows = shops.values_list('id', 'opening_time', 'closing_time')
+        opening_hours = []
+        for shop_id, opening, closing in rows.iterator():
+            opening_hours.extend(
+                OpeningHours(shop_id=shop_id, weekday=weekday,
+                             opening_time=opening, closing_time=closing)
+                for weekday, opening, closing in daily_hours(opening, closing)
+            )
+            if len(opening_hours) >= batch_size:
+                OpeningHours.objects.bulk_create(opening_hours)
+                opening_hours = []
+        OpeningHours.objects.bulk_create(opening_hours)
+
+
 class Shop(models.Model):
     name = models.CharField(max_length=256)
     city = models.ForeignKey(City, on_delete=models.CASCADE)
     street = models.ForeignKey(Street, on_delete=models.CASCADE)
     house_numbers = models.CharField(max_length=16)  # alphanumeric + specials
-    opening_time = models.TimeField()
-    closing_time = models.TimeField()
+    # same hours every day, None when OpeningHours differ by weekday
+    opening_time = models.TimeField(null=True, blank=True)
+    closing_time = models.TimeField(null=True, blank=True)
+    latitude = models.FloatField(
+        null=True, blank=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)],
+    )
+    longitude = models.FloatField(
+        null=True, blank=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)],
+    )
+    # derived from coordinates, empty without them
+    geohash = models.CharField(max_length=geo.GEOHASH_LENGTH, blank=True,
+                               editable=False)
+
+    objects = ShopQuerySet.as_manager()
+
+    class Meta:
+        indexes = [  # access paths of ShopList search
+            models.Index(fields=('city', 'street'),
+                         name='shop_city_street_idx'),
+            models.Index(fields=('geohash',), name='shop_geohash_idx'),
+        ]
+
+    daily_hours_fields = frozenset(('opening_time', 'closing_time'))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._saved_daily_hours = None  # unknown, see from_db
+        if self.pk is None:  # bulk_create skips save
+            self.geohash = self.get_geohash()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        '''Remember loaded daily time, deferred fields are left unread'''
+        shop = super().from_db(db, field_names, values)
+        if not shop.daily_hours_fields & shop.get_deferred_fields():
+            shop._saved_daily_hours = shop.get_daily_hours()
+        return shop
 
     def __str__(self) -> str:
         return self.name
 
     def clean(self):
-        if self.closing_time < self.opening_time:
-            raise ValidationError('Shop cannot have closing time earlier than opening time')
+        if (self.opening_time is None) != (self.closing_time is None):
+            raise ValidationError('Shop needs both opening and closing time')
+        if (self.latitude is None) != (self.longitude is None):
+            raise ValidationError('Shop needs both latitude and longitude')
+
+    def get_geohash(self) -> str:
+        if self.latitude is None or self.longitude is None:
+            return ''
+        return geo.encode(self.latitude, self.longitude)
+
+    def get_daily_hours(self) -> tuple:
+        return self.opening_time, self.closing_time
+
+    def save(self, *args, **kwargs):
+        '''Replace opening hours when daily opening or closing time changes
+
+        Daily time left deferred by queryset has not changed
+        '''
+        hours_loaded = not self.daily_hours_fields <= self.get_deferred_fields()
+        daily_hours_changed = hours_loaded and (
+            None not in self.get_daily_hours()
+            and self.get_daily_hours() != self._saved_daily_hours
+        )
+        self.geohash = self.get_geohash()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if daily_hours_changed:
+                self.replace_opening_hours(daily_hours(*self.get_daily_hours()))
+        if hours_loaded:
+            self._saved_daily_hours = self.get_daily_hours()
+
+    def set_opening_hours(self, hours: list):
+        '''Save shop with (weekday, opening, closing) hours
+
+        Daily time is kept only when every day has same single interval
+        '''
+        hours = sorted(hours)
+        daily = len(hours) == len(WEEKDAYS) and \
+            hours == daily_hours(*hours[0][1:])
+        self.opening_time, self.closing_time = \
+            hours[0][1:] if daily else (None, None)
+        self._saved_daily_hours = self.get_daily_hours()
+        with transaction.atomic():
+            if created := self.pk is None:
+                self.save()
+            self.replace_opening_hours(hours)
+            if not created:
+                self.save()  # sends post_save after hours are written
+
+    def replace_opening_hours(self, hours: list):
+        self.opening_hours.all().delete()
+        OpeningHours.objects.bulk_create(
+            OpeningHours(shop=self, weekday=weekday,
+                         opening_time=opening, closing_time=closing)
+            for weekday, opening, closing in hours
+        )
+        if hasattr(self, '_prefetched_objects_cache'):
+            self._prefetched_objects_cache.pop('opening_hours', None)
+
+    def get_intervals(self) -> list:
+        '''(start, end) of opening hours, prefetched ones if any'''
+        if self.pk is None:
+            hours = daily_hours(*self.get_daily_hours()) \
+                if None not in self.get_daily_hours() else []
+            return [week_interval(*row) for row in hours]
+        return [(hours.start, hours.end) for hours in self.opening_hours.all()]
 
     def is_closed(self) -> bool:
         return not self.is_opened()
 
     def is_opened(self) -> bool:
-        now = timezone.now().time()
-        return self.opening_time <= now < self.closing_time
+        '''Check in local time of shop's city'''
+        now = local_seconds_of_week(self.city.timezone)
+        return is_in_intervals(now, self.get_intervals())
+
+
+class OpeningHoursQuerySet(models.QuerySet):
+
+    def at(self, moment: float):
+        '''Intervals containing second of week, two index range scans
+
+        Intervals are shorter than a day, so start bounds both scans
+        '''
+        return self.filter(
+            models.Q(start__gt=moment - DAY, start__lte=moment,
+                     end__gt=moment)
+            | models.Q(start__gt=moment + WEEK - DAY, start__lte=moment + WEEK,
+                       end__gt=moment + WEEK)
+        )
+
+
+class OpeningHours(models.Model):
+    '''Interval of shop opening on weekday
+
+    Closing time before opening one means closing on next day. Interval is
+    also stored as seconds since Monday midnight, so openness at any moment
+    is a range query over `openinghours_week_idx`
+    '''
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE,
+                             related_name='opening_hours')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAYS)
+    opening_time = models.TimeField()
+    closing_time = models.TimeField()
+    start = models.PositiveIntegerField(editable=False)
+    end = models.PositiveIntegerField(editable=False)
+
+    objects = OpeningHoursQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('weekday', 'opening_time')
+        indexes = [
+            models.Index(fields=('start', 'end', 'shop'),
+                         name='openinghours_week_idx'),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        '''Derive interval here, so bulk_create stores it too'''
+        super().__init__(*args, **kwargs)
+        if self.start is None and self.opening_time is not None:
+            self.start, self.end = week_interval(
+                self.weekday, self.opening_time, self.closing_time,
+            )
+
+    def __str__(self) -> str:
+        return f'{self.get_weekday_display()} {self.opening_time}-{self.closing_time}'
+
+    def save(self, *args, **kwargs):
+        self.start, self.end = week_interval(
+            self.weekday, self.opening_time, self.closing_time,
+        )
+        super().save(*args, **kwargs)
+
+
+class TableVersionQuerySet(models.QuerySet):
+
+    def bump(self, model):
+        '''Register write to table of model'''
+        table = model._meta.label_lower
+        changes = {'version': models.F('version') + 1,
+                   'updated_at': Now()}
+        if not self.filter(table=table).update(**changes):
+            self.get_or_create(table=table)
+            self.filter(table=table).update(**changes)
+
+    def of(self, tables: tuple) -> list:
+        '''(table, version, updated_at) rows of given model tables'''
+        labels = [model._meta.label_lower for model in tables]
+        return list(self.filter(table__in=labels).order_by('table')
+                        .values_list('table', 'version', 'updated_at'))
+
+
+class TableVersion(models.Model):
+    '''Change counter of a table, bumped on every write by signals
+
+    Unlike latest updated_at of rows it also moves on delete
+    '''
+    table = models.CharField(max_length=64, unique=True)  # model label
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    objects = TableVersionQuerySet.as_manager()
+
+    def __str__(self) -> str:
+        return f'{self.table} v{self.version}'
+
+
+class RowChangeQuerySet(models.QuerySet):
+
+    def record(self, model, row_ids: list, deleted: bool = False,
+               created: bool = False):
+        '''Move rows of model to end of change log
+
+        Version of change log is bumped first. It locks version row until
+        commit, so changes get ids in commit order and token of a reader
+        never skips change committed later. Price of it: transactions
+        writing tracked tables wait for each other from this call to
+        commit. Versions of tables are to be bumped after it, so every
+        writer takes version locks in same order. Created rows have no
+        entries to move
+        '''
+        if not row_ids:
+            return
+        TableVersion.objects.bump(self.model)
+        table = model._meta.label_lower
+        if not created:
+            self.filter(table=table, row_id__in=row_ids).delete()
+        self.bulk_create([
+            self.model(table=table, row_id=row_id, deleted=deleted)
+            for row_id in row_ids
+        ])
+
+
+class RowChange(models.Model):
+    '''Last write to row of tracked table, deleted rows stay as tombstones
+
+    Id orders writes, so changes since token are range scan over primary
+    key. Row has one entry, written rows move to end of log
+    '''
+    table = models.CharField(max_length=64)  # model label
+    row_id = models.PositiveBigIntegerField()
+    deleted = models.BooleanField(default=False)
+
+    objects = RowChangeQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('table', 'row_id')  # one entry per row
+
+    def __str__(self) -> str:
+        action = 'deleted' if self.deleted else 'written'
+        return f'{self.table} {self.row_id} {action}'
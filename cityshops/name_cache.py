@@ -0,0 +1,71 @@
+from cityshops.models import City, Street
+
+
+class NameIdCache:
+    '''In-process cache of model rows looked up by name
+
+    Only names found in database are cached, so rows created by other
+    processes are never reported as missing. Whole cache is dropped when
+    TableVersion of model moves, so renames and deletes of other processes
+    are seen on their next lookup, and on every save or delete of this
+    process (see cityshops.signals), because renamed row's old name is
+    unknown at that point
+    '''
+
+    def __init__(self, model, fields: tuple, maxsize: int = 10_000):
+        self.model = model
+        self.fields = fields
+        self.maxsize = maxsize
+        self.clear()
+
+    def get(self, name: str, version) -> list:
+        '''Return values of `fields` of all rows with given name
+
+        `version` is TableVersion of model read by caller, None bypasses
+        cache
+        '''
+        if version is None or version != self.version:
+            self.clear()
+            self.version = version
+        elif (rows := self.rows_by_name.get(name)) is not None:
+            return rows
+
+        queryset = self.model.objects.filter(name=name).order_by('id')
+        rows = list(queryset.values_list(*self.fields))
+        if rows and version is not None:
+            if len(self.rows_by_name) >= self.maxsize:
+                self.rows_by_name = {}
+            self.rows_by_name[name] = rows
+        return rows
+
+    def clear(self):
+        self.version = None
+        self.rows_by_name = {}
+
+
+class TimezoneCache:
+    '''In-process cache of distinct timezones of cities
+
+    Stamped with city TableVersion, so cities saved by other processes
+    reload it on next lookup
+    '''
+
+    def __init__(self):
+        self.clear()
+
+    def get(self, version) -> list:
+        if version is None or version != self.version:
+            queryset = City.objects.order_by('timezone') \
+                                   .values_list('timezone', flat=True)
+            self.timezones = list(queryset.distinct())
+            self.version = version
+        return self.timezones
+
+    def clear(self):
+        self.version = None
+        self.timezones = []
+
+
+city_cache = NameIdCache(City, fields=('id',))
+street_cache = NameIdCache(Street, fields=('id', 'city_id'))
+timezone_cache = TimezoneCache()
@@ -0,0 +1,17 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    '''Keyset pagination over primary key
+
+    Cursor encodes last seen id, so every page is one indexed range scan
+    and rows inserted meanwhile never shift page borders
+    '''
+
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    @property
+    def query_parameters(self) -> tuple:
+        return (self.cursor_query_param, self.page_size_query_param)
@@ -0,0 +1,202 @@
+'''Opt-in per request profiling of SQL, serialization and rendering
+
+Enabled by REQUEST_PROFILING setting. When it is off middleware removes
+itself from chain and `profile_section` costs one context variable read
+'''
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, JsonResponse
+from django.utils.crypto import constant_time_compare
+from rest_framework import serializers
+
+
+current_profile = ContextVar('current_profile', default=None)
+
+
+class Profile:
+    '''Timings of one request, in seconds'''
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.render_started = None
+        self.queries = 0
+        self.sections = {'db': 0.0, 'serializer': 0.0, 'render': 0.0}
+
+    def record_query(self, execute, sql, params, many, context):
+        '''Connection execute wrapper'''
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sections['db'] += perf_counter() - started
+
+    def finish(self):
+        finished = perf_counter()
+        if self.render_started is not None:
+            self.sections['render'] = finished - self.render_started
+        self.sections['total'] = finished - self.started
+
+    def server_timing(self) -> str:
+        metrics = []
+        for name, seconds in self.sections.items():
+            description = f';desc="{self.queries} queries"' if name == 'db' else ''
+            metrics.append(f'{name};dur={seconds * 1000:.2f}{description}')
+        return ', '.join(metrics)
+
+
+@contextmanager
+def record_queries():
+    '''Count queries of this thread's connections into current profile
+
+    Middleware records queries of its own thread, code running queries in
+    other threads, as async views do, wraps them too
+    '''
+    if (profile := current_profile.get()) is None:
+        yield
+        return
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(
+                connection.execute_wrapper(profile.record_query))
+        yield
+
+
+@contextmanager
+def profile_section(name: str):
+    '''Add time of block to section of current request profile'''
+    if (profile := current_profile.get()) is None:
+        yield
+        return
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        profile.sections[name] += perf_counter() - started
+
+
+class ProfiledListSerializer(serializers.ListSerializer):
+    '''Count serialization of lists into `serializer` profile section'''
+
+    def to_representation(self, data):
+        with profile_section('serializer'):
+            return super().to_representation(data)
+
+
+class EndpointStats:
+    '''Aggregated profiles of all requests to endpoint in this process'''
+
+    buckets_ms = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+    def __init__(self):
+        self.count = 0
+        self.queries = 0
+        self.seconds = {}
+        self.histogram = [0] * (len(self.buckets_ms) + 1)
+
+    def add(self, profile: Profile):
+        self.count += 1
+        self.queries += profile.queries
+        for name, seconds in profile.sections.items():
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        total_ms = profile.sections['total'] * 1000
+        bucket = sum(total_ms > bound for bound in self.buckets_ms)
+        self.histogram[bucket] += 1
+
+    def as_dict(self) -> dict:
+        labels = [f'<={bound}ms' for bound in self.buckets_ms]
+        labels.append(f'>{self.buckets_ms[-1]}ms')
+        return {
+            'count': self.count,
+            'mean_queries': round(self.queries / self.count, 2),
+            'mean_ms': {name: round(seconds / self.count * 1000, 2)
+                        for name, seconds in self.seconds.items()},
+            'histogram': dict(zip(labels, self.histogram)),
+        }
+
+
+class ProfileStore:
+
+    def __init__(self):
+        self.lock = Lock()
+        self.endpoints = {}
+
+    def add(self, endpoint: str, profile: Profile):
+        with self.lock:
+            self.endpoints.setdefault(endpoint, EndpointStats()).add(profile)
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {endpoint: stats.as_dict()
+                    for endpoint, stats in sorted(self.endpoints.items())}
+
+    def clear(self):
+        with self.lock:
+            self.endpoints = {}
+
+
+profile_store = ProfileStore()
+
+
+class ProfilingMiddleware:
+    '''Record profile of every request
+
+    Expose it in Server-Timing header and add it to per endpoint stats.
+    Keep it last in MIDDLEWARE, so render time is not mixed with other
+    middleware
+    '''
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = Profile()
+        token = current_profile.set(profile)
+        try:
+            with record_queries():
+                response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+
+        profile.finish()
+        response['Server-Timing'] = profile.server_timing()
+        profile_store.add(self.get_endpoint(request), profile)
+        return response
+
+    def process_template_response(self, request, response):
+        '''Called right before DRF response is rendered'''
+        current_profile.get().render_started = perf_counter()
+        return response
+
+    def get_endpoint(self, request) -> str:
+        if (match := request.resolver_match) is not None:
+            return f'{request.method} /{match.route}'
+        return f'{request.method} {request.path}'
+
+
+def profiling_stats(request):
+    '''Aggregated profiles of this process, see can_read_stats'''
+    if not settings.REQUEST_PROFILING or not can_read_stats(request):
+        raise Http404
+    return JsonResponse(profile_store.as_dict())
+
+
+def can_read_stats(request) -> bool:
+    '''Staff users and holders of PROFILING_STATS_TOKEN read stats
+
+    Peer address is not checked, behind reverse proxy every request
+    comes from it
+    '''
+    if getattr(request, 'user', None) is not None and request.user.is_staff:
+        return True
+    token = settings.PROFILING_STATS_TOKEN
+    return bool(token) and constant_time_compare(
+        request.headers.get('X-Profiling-Token', ''), token)
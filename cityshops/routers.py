@@ -0,0 +1,74 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# set on responses to writes, client's next reads go to primary
+PRIMARY_COOKIE = 'use_primary'
+
+# replica alias serving reads of current request, None means primary
+current_replica = ContextVar('current_replica', default=None)
+
+
+class ReplicaRouter:
+    '''Route reads of ReplicaReadMixin views to replica of the request
+
+    Every write goes to primary and sends later reads of the request there
+    too, so request reads what it wrote
+    '''
+
+    def db_for_read(self, model, **hints):
+        return current_replica.get() or 'default'
+
+    def db_for_write(self, model, **hints):
+        current_replica.set(None)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # replicas hold same rows as primary
+
+
+class ReplicaReadMixin:
+    '''Serve safe requests from one random replica, same for whole request
+
+    Requests of clients which wrote recently are served by primary, see
+    ReplicaStickinessMiddleware
+    '''
+
+    def dispatch(self, request, *args, **kwargs):
+        token = current_replica.set(self.get_replica(request))
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            current_replica.reset(token)
+
+    def get_replica(self, request):
+        if request.method not in SAFE_METHODS \
+                or PRIMARY_COOKIE in request.COOKIES \
+                or not settings.DATABASE_REPLICAS:
+            return None
+        return random.choice(settings.DATABASE_REPLICAS)
+
+
+class ReplicaStickinessMiddleware:
+    '''Mark client for REPLICA_STICKY_SECONDS after successful write
+
+    Replicas may lag behind primary for that long, so client's next
+    requests read from primary and see own writes
+    '''
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                PRIMARY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
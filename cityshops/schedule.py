@@ -0,0 +1,202 @@
+import logging
+from bisect import bisect_right, insort
+from threading import RLock, Thread
+
+from django.db import close_old_connections, connection
+
+from cityshops.models import WEEK, City, OpeningHours, Shop, utc_offset
+
+
+logger = logging.getLogger(__name__)
+
+
+class CitySchedule:
+    '''Shop ids of one city grouped by (start, end) opening interval
+
+    Intervals are kept sorted, so ones started before given moment are
+    prefix of `intervals`. Shops share few distinct intervals, so lookup
+    scans groups instead of shops
+    '''
+
+    def __init__(self):
+        self.shop_ids = set()
+        self.intervals = []
+        self.interval_shop_ids = {}
+
+    def add(self, shop_id: int, intervals: tuple):
+        self.shop_ids.add(shop_id)
+        for interval in intervals:
+            if interval not in self.interval_shop_ids:
+                self.interval_shop_ids[interval] = set()
+                insort(self.intervals, interval)
+            self.interval_shop_ids[interval].add(shop_id)
+
+    def remove(self, shop_id: int, intervals: tuple):
+        self.shop_ids.discard(shop_id)
+        for interval in intervals:
+            shop_ids = self.interval_shop_ids[interval]
+            shop_ids.discard(shop_id)
+            if not shop_ids:
+                del self.interval_shop_ids[interval]
+                self.intervals.remove(interval)
+
+    def opened_groups(self, moment: float) -> list:
+        '''Id sets of shops opened at second of week, may overlap'''
+        groups = []
+        for point in (moment, moment + WEEK):  # past week for Sunday nights
+            started = bisect_right(self.intervals, (point, WEEK * 2))
+            groups.extend(self.interval_shop_ids[interval]
+                          for interval in self.intervals[:started]
+                          if interval[1] > point)
+        return groups
+
+
+class ScheduleIndex:
+    '''In-process index answering which shops are opened at given moment
+
+    Stamped with city and shop TableVersions. Shop saves and deletes of
+    this process update it incrementally after commit (see
+    cityshops.signals). Any other write changes table version: lookups
+    return None, so callers query database, until index is rebuilt in
+    background thread. Rebuild loads every opening hours row, so it runs
+    outside of lock and replaces index at once
+    '''
+
+    def __init__(self):
+        self.lock = RLock()
+        self.rebuilding = False
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.versions = None  # (city version, shop version)
+            self.cities = {}
+            self.timezones = {}  # city id -> timezone name
+            self.places = {}  # shop id -> (city id, intervals)
+
+    def start_rebuild(self, versions: tuple):
+        '''Rebuild unless other rebuild runs'''
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        # thread would not see rows of caller's transaction, which versions
+        # may come from
+        if not connection.in_atomic_block:
+            Thread(target=self.rebuild_in_thread, args=(versions,),
+                   daemon=True).start()
+        else:
+            self.rebuild(versions)
+
+    def rebuild_in_thread(self, versions: tuple):
+        close_old_connections()
+        try:
+            self.rebuild(versions)
+        except Exception:
+            logger.exception('Schedule index rebuild failed')
+        finally:
+            connection.close()
+
+    def rebuild(self, versions: tuple):
+        '''Load index stamped with versions read before rows'''
+        try:
+            index = ScheduleIndex()
+            index.timezones = dict(City.objects.values_list('id', 'timezone'))
+            intervals = {}
+            rows = OpeningHours.objects.order_by().values_list(
+                'shop_id', 'start', 'end',
+            )
+            for shop_id, start, end in rows.iterator(chunk_size=10_000):
+                intervals.setdefault(shop_id, []).append((start, end))
+            shops = Shop.objects.values_list('id', 'city_id')
+            for shop_id, city_id in shops.iterator(chunk_size=10_000):
+                index.add(shop_id, city_id,
+                          tuple(intervals.get(shop_id, ())))
+            with self.lock:
+                # writes applied meanwhile moved versions past stamp of
+                # index, next lookup starts another rebuild
+                self.cities, self.timezones = index.cities, index.timezones
+                self.places, self.versions = index.places, versions
+        finally:
+            self.rebuilding = False
+
+    def add(self, shop_id: int, city_id: int, intervals: tuple):
+        self.cities.setdefault(city_id, CitySchedule()).add(shop_id, intervals)
+        self.places[shop_id] = city_id, intervals
+
+    def remove(self, shop_id: int):
+        if (place := self.places.pop(shop_id, None)) is None:
+            return
+        city_id, intervals = place
+        schedule = self.cities[city_id]
+        schedule.remove(shop_id, intervals)
+        if not schedule.shop_ids:
+            del self.cities[city_id]
+
+    def shop_saved(self, shop_id: int, city_id: int):
+        '''Apply committed save, which bumped shop table version once'''
+        with self.lock:
+            if self.versions is None:
+                return
+            intervals = OpeningHours.objects.filter(shop_id=shop_id) \
+                                            .values_list('start', 'end')
+            self.remove(shop_id)
+            self.add(shop_id, city_id, tuple(intervals))
+            self.shop_table_changed()
+
+    def shop_deleted(self, shop_id: int):
+        '''Apply committed delete, which bumped shop table version once'''
+        with self.lock:
+            if self.versions is None:
+                return
+            self.remove(shop_id)
+            self.shop_table_changed()
+
+    def shop_table_changed(self):
+        city_version, shop_version = self.versions
+        self.versions = city_version, shop_version + 1
+
+    def local_moment(self, city_id: int, moment: float) -> float:
+        offset = utc_offset(self.timezones.get(city_id, 'UTC'))
+        return (moment + offset) % WEEK
+
+    def get_shop_ids(self, city_id, moment: float, opened: bool,
+                     versions: tuple, limit: int):
+        '''Sorted ids of shops opened (or closed) at second of week in UTC
+
+        Moment is converted to local time of every city by its current UTC
+        offset. `city_id` None means all cities. Returns None when more than
+        `limit` shops match, as database range query is faster then, and
+        while index is stale
+        '''
+        if self.versions != versions:
+            self.start_rebuild(versions)
+        with self.lock:
+            if self.versions != versions:
+                return None
+
+            if city_id is None:
+                city_ids = list(self.cities)
+            else:
+                city_ids = [city_id] if city_id in self.cities else []
+            schedules = [self.cities[id_] for id_ in city_ids]
+            groups = []
+            for id_, schedule in zip(city_ids, schedules):
+                groups.extend(
+                    schedule.opened_groups(self.local_moment(id_, moment)))
+            # group sizes bound number of opened shops from above
+            opened_at_most = sum(map(len, groups))
+            total = sum(len(schedule.shop_ids) for schedule in schedules)
+            if (opened_at_most if opened else total - opened_at_most) > limit:
+                return None
+
+            shop_ids = set().union(*groups)
+            if not opened:
+                shop_ids = set().union(*(schedule.shop_ids
+                                         for schedule in schedules)) - shop_ids
+                if len(shop_ids) > limit:
+                    return None
+            return sorted(shop_ids)
+
+
+schedule_index = ScheduleIndex()
@@ -1,14 +1,18 @@
 from django.core.exceptions import ValidationError
 from rest_framework import serializers
 
-from cityshops.models import City, Shop, Street
+from cityshops.models import (
+    City, OpeningHours, Shop, Street, is_in_intervals, local_seconds_of_week,
+)
+from cityshops.profiling import ProfiledListSerializer
 
 
 class CitySerializer(serializers.ModelSerializer):
 
     class Meta:
         model  = City
-        fields = ('id', 'name')
+        fields = ('id', 'name', 'timezone')
+        list_serializer_class = ProfiledListSerializer
 
 
 class StreetSerializer(serializers.ModelSerializer):
@@ -16,11 +20,22 @@ class StreetSerializer(serializers.ModelSerializer):
     class Meta:
         model  = Street
         fields = ('id', 'name', 'city')
+        list_serializer_class = ProfiledListSerializer
         extra_kwargs = {
             'city': {'write_only': True},  # exclude city_id from print
         }
 
 
+class StreetNamesField(serializers.ListField):
+    '''JSON list of names of streets created in one batch'''
+    child = serializers.CharField(max_length=256)
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('allow_empty', False)
+        kwargs.setdefault('max_length', 1000)
+        super().__init__(**kwargs)
+
+
 class StreetSlugRelatedField(serializers.SlugRelatedField):
     def get_queryset(self):
         '''Filter Street queryset to ensure unique_together constraint'''
@@ -33,6 +48,13 @@ class StreetSlugRelatedField(serializers.SlugRelatedField):
         return queryset.filter(name=street_name, city__name=city_name)
 
 
+class OpeningHoursSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model  = OpeningHours
+        fields = ('weekday', 'opening_time', 'closing_time')
+
+
 class ShopSerializer(serializers.ModelSerializer):
     city = serializers.SlugRelatedField(
             slug_field='name',
@@ -42,14 +64,166 @@ class ShopSerializer(serializers.ModelSerializer):
             slug_field='name',
             queryset=Street.objects.all(),
     )
+    opening_hours = OpeningHoursSerializer(many=True, required=False)
 
     def validate(self, attrs):
-        '''Validate closing and opening time'''
-        if attrs.get('closing_time', 0) < attrs.get('opening_time', 1):
-            raise ValidationError('Shop cannot have closing time earlier than opening time')
+        '''Validate opening time, closing time earlier means next day'''
+        daily_hours = attrs.get('opening_time'), attrs.get('closing_time')
+        if (daily_hours[0] is None) != (daily_hours[1] is None):
+            raise ValidationError('Shop needs both opening and closing time')
+        if (attrs.get('latitude') is None) != (attrs.get('longitude') is None):
+            raise ValidationError('Shop needs both latitude and longitude')
+        if self.instance is None and daily_hours[0] is None \
+                and 'opening_hours' not in attrs:
+            raise ValidationError('Shop needs opening and closing time '
+                                  'or opening hours')
         return super().validate(attrs)
 
+    def create(self, validated_data):
+        opening_hours = validated_data.pop('opening_hours', None)
+        return self.save_shop(Shop(**validated_data), opening_hours)
+
+    def update(self, instance, validated_data):
+        opening_hours = validated_data.pop('opening_hours', None)
+        for attribute, value in validated_data.items():
+            setattr(instance, attribute, value)
+        return self.save_shop(instance, opening_hours)
+
+    def save_shop(self, shop: Shop, opening_hours) -> Shop:
+        if opening_hours is None:
+            shop.save()
+        else:
+            shop.set_opening_hours([
+                (row['weekday'], row['opening_time'], row['closing_time'])
+                for row in opening_hours
+            ])
+        return shop
+
     class Meta:
         model  = Shop
-        fields = ('id', 'name', 'city', 'street', 'house_numbers', 
-                'opening_time', 'closing_time', 'is_opened')
+        fields = ('id', 'name', 'city', 'street', 'house_numbers',
+                'latitude', 'longitude', 'opening_time', 'closing_time',
+                'opening_hours', 'is_opened')
+        list_serializer_class = ProfiledListSerializer
+
+
+class ShopImportSerializer(ShopSerializer):
+    '''Validate shop row without resolving city and street
+
+    Names are resolved for whole batch at once in cityshops.bulk. Bulk
+    created shops get daily opening hours only
+    '''
+    city = serializers.CharField(max_length=256)
+    street = serializers.CharField(max_length=256)
+    opening_hours = None
+
+    class Meta(ShopSerializer.Meta):
+        fields = tuple(field for field in ShopSerializer.Meta.fields
+                       if field != 'opening_hours')
+
+
+shop_row_fields = ('id', 'name', 'city__name', 'street__name',
+                   'house_numbers', 'latitude', 'longitude', 'opening_time',
+                   'closing_time')
+# values ShopSerializer fields are built from besides opening hours rows
+shop_field_sources = {
+    'id': ('id',),
+    'name': ('name',),
+    'city': ('city__name',),
+    'street': ('street__name',),
+    'house_numbers': ('house_numbers',),
+    'latitude': ('latitude',),
+    'longitude': ('longitude',),
+    'opening_time': ('opening_time',),
+    'closing_time': ('closing_time',),
+    'opening_hours': (),
+    'is_opened': ('city__timezone',),
+}
+opening_hours_row_fields = ('shop_id', 'weekday', 'opening_time',
+                            'closing_time', 'start', 'end')
+
+
+def shop_row_to_representation(row: tuple, opening_hours: list,
+                               now: float) -> dict:
+    '''Same output as ShopSerializer for `shop_row_fields` values row
+
+    `opening_hours` are `opening_hours_row_fields` rows of the shop, `now`
+    is second of week in local time of shop's city. Skips serializer and
+    field instances, used where rows are many
+    '''
+    (shop_id, name, city, street, house_numbers, latitude, longitude,
+     opening, closing) = row
+    return {
+        'id': shop_id,
+        'name': name,
+        'city': city,
+        'street': street,
+        'house_numbers': house_numbers,
+        'latitude': latitude,
+        'longitude': longitude,
+        'opening_time': opening and opening.isoformat(),
+        'closing_time': closing and closing.isoformat(),
+        'opening_hours': [
+            {'weekday': weekday,
+             'opening_time': opening_time.isoformat(),
+             'closing_time': closing_time.isoformat()}
+            for _, weekday, opening_time, closing_time, _, _ in opening_hours
+        ],
+        'is_opened': is_in_intervals(
+            now, [(start, end) for *_, start, end in opening_hours],
+        ),
+    }
+
+
+def shop_rows_to_representation(rows: list, fields=None) -> list:
+    '''Same output as ShopSerializer for `shop_row_fields` values rows
+    followed by timezone of shop's city
+
+    Opening hours of all rows are fetched in one query, local time is
+    computed once per timezone. `fields` trims output, values not used by
+    them may be None, see `shop_field_sources`
+    '''
+    fields = fields or ShopSerializer.Meta.fields
+    opening_hours = {row[0]: [] for row in rows}
+    if {'opening_hours', 'is_opened'} & set(fields):
+        for hours in OpeningHours.objects.filter(shop_id__in=opening_hours) \
+                                         .values_list(*opening_hours_row_fields):
+            opening_hours[hours[0]].append(hours)
+    local_now = {
+        timezone_name: local_seconds_of_week(timezone_name)
+        if 'is_opened' in fields else 0
+        for timezone_name in {row[-1] for row in rows}
+    }
+    representations = [
+        shop_row_to_representation(row[:-1], opening_hours[row[0]],
+                                   local_now[row[-1]])
+        for row in rows
+    ]
+    if fields == ShopSerializer.Meta.fields:
+        return representations
+    return [{field: representation[field] for field in fields}
+            for representation in representations]
+
+
+class NearbySearchSerializer(serializers.Serializer):
+    '''Query parameters of ShopNearby, radius in meters'''
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lon = serializers.FloatField(min_value=-180, max_value=180)
+    radius = serializers.FloatField(min_value=1, max_value=10_000,
+                                    default=1000)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+    opened = serializers.ChoiceField(choices=('0', '1'), required=False)
+
+
+class ChangesSearchSerializer(serializers.Serializer):
+    '''Query parameters of ShopChanges, `since` is token of last fetch'''
+    since = serializers.IntegerField(min_value=0, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=100)
+
+
+class AutocompleteSearchSerializer(serializers.Serializer):
+    '''Query parameters of Autocomplete, `city` is id restricting streets'''
+    q = serializers.CharField(max_length=256)
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+    fuzzy = serializers.BooleanField(default=False)
+    city = serializers.IntegerField(required=False)
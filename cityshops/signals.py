@@ -0,0 +1,82 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from cityshops.autocomplete import autocomplete_index
+from cityshops.cache import invalidate
+from cityshops.models import City, RowChange, Shop, Street, TableVersion
+from cityshops.name_cache import city_cache, street_cache, timezone_cache
+from cityshops.schedule import schedule_index
+
+
+def tables_changed(*models):
+    '''Drop state derived from tables of models
+
+    Called by model signals, bulk writes must call it themselves
+    '''
+    for model in models:
+        if model is City:
+            city_cache.clear()
+            timezone_cache.clear()
+        elif model is Street:
+            street_cache.clear()
+        invalidate(model)
+        TableVersion.objects.bump(model)
+
+
+@receiver(post_save, sender=City)
+@receiver(post_save, sender=Street)
+@receiver(post_save, sender=Shop)
+def row_saved_receiver(sender, instance, created, **kwargs):
+    '''Log write in same transaction, see ShopChanges view
+
+    Change log version is locked before version of table, so writers of
+    several tables, as cascading deletes, lock versions in same order
+    '''
+    RowChange.objects.record(sender, [instance.pk], created=created)
+    tables_changed(sender)
+
+
+@receiver(post_delete, sender=City)
+@receiver(post_delete, sender=Street)
+@receiver(post_delete, sender=Shop)
+def row_deleted_receiver(sender, instance, **kwargs):
+    RowChange.objects.record(sender, [instance.pk], deleted=True)
+    tables_changed(sender)
+
+
+@receiver(post_save, sender=Shop)
+def shop_saved_receiver(sender, instance, **kwargs):
+    '''Update schedule index once save can no longer be rolled back'''
+    transaction.on_commit(partial(schedule_index.shop_saved,
+                                  instance.id, instance.city_id))
+
+
+@receiver(post_delete, sender=Shop)
+def shop_deleted_receiver(sender, instance, **kwargs):
+    transaction.on_commit(partial(schedule_index.shop_deleted, instance.id))
+
+
+@receiver(post_save, sender=City)
+def city_saved_receiver(sender, instance, **kwargs):
+    transaction.on_commit(partial(autocomplete_index.city_saved,
+                                  instance.id, instance.name))
+
+
+@receiver(post_delete, sender=City)
+def city_deleted_receiver(sender, instance, **kwargs):
+    transaction.on_commit(partial(autocomplete_index.city_deleted, instance.id))
+
+
+@receiver(post_save, sender=Street)
+def street_saved_receiver(sender, instance, **kwargs):
+    transaction.on_commit(partial(autocomplete_index.street_saved, instance.id,
+                                  instance.name, instance.city_id))
+
+
+@receiver(post_delete, sender=Street)
+def street_deleted_receiver(sender, instance, **kwargs):
+    transaction.on_commit(partial(autocomplete_index.street_deleted,
+                                  instance.id))
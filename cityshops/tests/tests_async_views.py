@@ -0,0 +1,95 @@
+import json
+from datetime import time
+from unittest.mock import patch
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import AsyncClient, TransactionTestCase, override_settings
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.test import APIClient
+
+from cityshops.models import City, Shop, Street
+from cityshops.views import ShopList
+
+
+class AsyncReadAPITest(TransactionTestCase):
+    '''Async views query from pool threads, so data must be committed'''
+
+    def setUp(self):
+        cache.clear()
+        self.city = City.objects.create(name='Moscow')
+        street = Street.objects.create(name='Ulitsa Borko', city=self.city)
+        for number in range(3):
+            Shop.objects.create(
+                name=f'Shop {number}',
+                city=self.city,
+                street=street,
+                house_numbers=number,
+                opening_time=time(hour=8),
+                closing_time=time(hour=20),
+            )
+        self.async_client = AsyncClient()
+
+    def get_async(self, path: str, data=None):
+        query = f'?{urlencode(data)}' if data else ''  # ignored as dict
+        return async_to_sync(self.async_client.get)(path + query)
+
+    def assertSameAsSync(self, path: str, data=None):
+        sync_response = APIClient().get(path, data)
+        async_response = self.get_async('/async' + path, data)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        # pagination links lead to async path
+        async_content = async_response.content.replace(b'/async/', b'/')
+        self.assertEqual(json.loads(async_content), sync_response.json())
+        return async_response
+
+    def test_city_list_same_as_sync(self):
+        self.assertSameAsSync('/city/')
+
+    def test_city_streets_list_same_as_sync(self):
+        self.assertSameAsSync(f'/city/{self.city.id}/street/')
+
+    def test_shop_search_same_as_sync(self):
+        self.assertSameAsSync('/shop/')
+        self.assertSameAsSync('/shop/', {'city': 'Moscow', 'opened': 1})
+        self.assertSameAsSync('/shop/', {'page_size': 2})
+
+    def test_shop_search_renders_same_bytes_as_sync(self):
+        sync_response = APIClient().get('/shop/', HTTP_ACCEPT='application/json')
+        async_response = self.get_async('/async/shop/')
+        self.assertEqual(async_response.content, sync_response.content)
+
+    def test_invalid_search_returns_400_as_sync(self):
+        response = self.assertSameAsSync('/shop/', {'opened': 15})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.assertSameAsSync('/shop/', {'rating': 10})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unknown_city_streets_returns_400_as_sync(self):
+        self.assertSameAsSync('/city/777/street/')
+
+    def test_permissions_are_enforced_as_sync(self):
+        with patch.object(ShopList, 'permission_classes', [IsAdminUser]):
+            response = self.assertSameAsSync('/shop/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_post_is_not_allowed(self):
+        response = async_to_sync(self.async_client.post)('/async/city/', {})
+        self.assertEqual(response.status_code,
+                         status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def test_matching_etag_returns_304(self):
+        etag = self.get_async('/async/shop/')['ETag']
+        response = async_to_sync(self.async_client.get)(
+            '/async/shop/', **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(REQUEST_PROFILING=True)
+    def test_server_timing_counts_queries_of_pool_thread(self):
+        self.async_client = AsyncClient()  # middleware loaded with settings
+        response = self.get_async('/async/shop/')
+        metrics = dict(metric.split(';', 1)
+                       for metric in response['Server-Timing'].split(', '))
+        self.assertIn('desc="5 queries"', metrics['db'])  # same as sync
@@ -0,0 +1,159 @@
+import json
+from io import BytesIO, StringIO
+from unittest.mock import patch
+from urllib.error import URLError
+
+from django.core.management import CommandError, call_command
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from cityshops.models import City, Shop, Street, TableVersion
+from cityshops.name_cache import city_cache
+
+
+class ExplainShopSearchCommandTest(TestCase):
+
+    def call_explain(self, *args) -> str:
+        stdout = StringIO()
+        call_command('explain_shop_search', '--cities=20', '--streets=10',
+                     '--shops=20', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_city_street_search_uses_city_street_index(self):
+        output = self.call_explain()
+        city_street_plan = output.split('--- ')[1]
+        self.assertIn('shop_city_street_idx', city_street_plan)
+
+    def test_city_opened_search_uses_opening_hours_index(self):
+        output = self.call_explain()
+        city_opened_plan = output.split('--- ')[3]
+        self.assertIn('openinghours_week_idx', city_opened_plan)
+
+    def test_seeded_data_is_rolled_back(self):
+        self.call_explain()
+        self.assertEqual(Shop.objects.count(), 0)
+
+    def test_keep_option_leaves_seeded_data(self):
+        self.call_explain('--keep')
+        self.assertEqual(Shop.objects.count(), 20 * 10 * 20)
+
+
+class GenerateShopsCommandTest(TestCase):
+
+    def test_creates_requested_quantity_of_rows(self):
+        call_command('generate_shops', '--cities=3', '--streets=4',
+                     '--shops=5', stdout=StringIO())
+        self.assertEqual(City.objects.count(), 3)
+        self.assertEqual(Street.objects.count(), 3 * 4)
+        self.assertEqual(Shop.objects.count(), 3 * 4 * 5)
+        self.assertEqual(Shop.objects.filter(city_id=F('street__city_id')).count(),
+                         3 * 4 * 5)
+
+    def test_opening_hours_are_valid_and_various(self):
+        call_command('generate_shops', '--cities=2', '--streets=5',
+                     '--shops=20', stdout=StringIO())
+        for shop in Shop.objects.all():
+            shop.full_clean()
+        hours = Shop.objects.values_list('opening_time', 'closing_time')
+        self.assertGreater(len(set(hours)), 3)
+        self.assertFalse(Shop.objects.filter(geohash='').exists())
+
+    def test_drops_caches_bypassed_by_bulk_create(self):
+        City.objects.create(name='City 0').delete()
+        (_, version, _), = TableVersion.objects.of((City,))
+        self.assertEqual(city_cache.get('City 0', version), [])
+        call_command('generate_shops', '--cities=1', '--streets=1',
+                     '--shops=1', stdout=StringIO())
+        (_, version, _), = TableVersion.objects.of((City,))
+        self.assertEqual(len(city_cache.get('City 0', version)), 1)
+
+
+class BenchApiCommandTest(TestCase):
+
+    def test_reports_every_endpoint_and_filter_combination(self):
+        call_command('generate_shops', '--cities=2', '--streets=2',
+                     '--shops=2', stdout=StringIO())
+        stdout = StringIO()
+        call_command('bench_api', '--requests=2', stdout=stdout)
+        report = json.loads(stdout.getvalue())
+
+        self.assertEqual(report['meta']['shops'], 8)
+        # 2 city endpoints, 8 filter subsets with opened subsets doubled,
+        # 2 nearby searches
+        self.assertEqual(len(report['results']), 2 + 4 + 4 * 2 + 2)
+        for result in report['results'].values():
+            self.assertEqual(result['status'], 200)
+            self.assertGreater(result['queries'], 0)
+
+    def test_empty_database_is_reported(self):
+        with self.assertRaises(CommandError):
+            call_command('bench_api', stdout=StringIO())
+
+
+class BenchRenderersCommandTest(TestCase):
+
+    def test_reports_every_renderer(self):
+        stdout = StringIO()
+        call_command('bench_renderers', '--rows=10', '--repeat=1',
+                     stdout=stdout)
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(report['rows'], 10)
+        self.assertEqual(set(report['results']), {
+            'json_renderer', 'fast_renderer', 'json_lines_export'})
+
+
+class BenchReadPathsCommandTest(TransactionTestCase):
+    '''Benchmarked handlers query from other threads'''
+
+    def test_reports_every_read_path_as_json(self):
+        stdout = StringIO()
+        call_command('bench_read_paths', '--path=/city/', '--requests=8',
+                     '--concurrency=2', stdout=stdout)
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(set(report['results']),
+                         {'wsgi_sync', 'asgi_sync', 'asgi_async'})
+        for result in report['results'].values():
+            self.assertGreater(result['requests_per_second'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+
+class BenchConnectionsCommandTest(TransactionTestCase):
+    '''Benchmarked handler queries from other threads'''
+
+    def test_reports_both_connection_modes(self):
+        stdout = StringIO()
+        call_command('bench_connections', '--requests=8', '--concurrency=2',
+                     stdout=stdout)
+        report = json.loads(stdout.getvalue())
+        results = report['results']
+        self.assertEqual(set(results), {'connection_per_request',
+                                        'persistent'})
+        self.assertLessEqual(results['persistent']['connections_opened'], 2)
+        for result in results.values():
+            self.assertGreater(result['requests_per_second'], 0)
+
+
+class ProfilingReportCommandTest(TestCase):
+
+    @override_settings(PROFILING_STATS_TOKEN='secret')
+    @patch('cityshops.management.commands.profiling_report.urlopen')
+    def test_prints_stats_of_every_endpoint(self, mock_urlopen):
+        stats = {'GET /shop/': {
+            'count': 2, 'mean_queries': 3.0,
+            'mean_ms': {'db': 1.5, 'total': 4.0},
+            'histogram': {'<=5ms': 2, '<=10ms': 0},
+        }}
+        mock_urlopen.return_value = BytesIO(json.dumps(stats).encode())
+        stdout = StringIO()
+        call_command('profiling_report', stdout=stdout)
+        self.assertEqual(stdout.getvalue(), 'GET /shop/\n'
+                         '  requests=2 queries=3.0 db=1.5ms total=4.0ms\n'
+                         '  <=5ms:2\n')
+        request = mock_urlopen.call_args[0][0]
+        self.assertEqual(request.get_header('X-profiling-token'), 'secret')
+
+    @patch('cityshops.management.commands.profiling_report.urlopen',
+           side_effect=URLError('refused'))
+    def test_unreachable_server_is_reported(self, _):
+        with self.assertRaises(CommandError):
+            call_command('profiling_report', stdout=StringIO())
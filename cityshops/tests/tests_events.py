@@ -0,0 +1,246 @@
+import asyncio
+import json
+from datetime import datetime, time
+from unittest.mock import patch
+
+import pytz
+from asgiref.sync import async_to_sync
+from django.db import DatabaseError
+from django.test import TransactionTestCase
+
+from cityshops.events import EventScheduler, shop_events
+from cityshops.models import City, Shop, Street
+from cityshops.name_cache import city_cache, street_cache
+
+
+@patch('cityshops.models.timezone.now')
+class EventSchedulerTest(TransactionTestCase):
+    '''Scheduler reads database from pool threads, data must be committed'''
+
+    def setUp(self):
+        self.city = City.objects.create(name='Moscow')
+        self.street = Street.objects.create(name='Prospekt Lenina',
+                                            city=self.city)
+        self.day_shop = self.create_shop(self.street, time(hour=8),
+                                         time(hour=20))
+        self.night_shop = self.create_shop(self.street, time(hour=22),
+                                           time(hour=6))
+        other_city = City.objects.create(name='Tula')
+        self.other_shop = self.create_shop(
+            Street.objects.create(name='Prospekt Lenina', city=other_city),
+            time(hour=9), time(hour=21),
+        )
+        self.scheduler = EventScheduler()
+        self.place = (self.city.id, None)
+
+    def create_shop(self, street: Street, opening: time, closing: time):
+        return Shop.objects.create(
+            name='Amused Kid', city=street.city, street=street,
+            house_numbers=13, opening_time=opening, closing_time=closing,
+        )
+
+    def set_now(self, mock_now, hour: int, minute: int = 0):
+        mock_now.return_value = datetime(2026, 1, 5, hour, minute,
+                                         tzinfo=pytz.utc)  # Monday
+
+    def step(self):
+        return async_to_sync(self.scheduler.step)()
+
+    def get_events(self, subscriber) -> list:
+        events = []
+        while not subscriber.queue.empty():
+            events.append(subscriber.queue.get_nowait())
+        return events
+
+    def test_snapshot_then_openings_and_closings(self, mock_now):
+        self.set_now(mock_now, 12)
+        subscriber = self.scheduler.subscribe(self.place)
+        self.assertEqual(self.step(), 8 * 60 * 60)  # closing at 20:00
+        self.assertEqual(self.get_events(subscriber),
+                         [('snapshot', {'opened': [self.day_shop.id]})])
+
+        self.set_now(mock_now, 20)
+        self.assertEqual(self.step(), 2 * 60 * 60)
+        self.assertEqual(self.get_events(subscriber),
+                         [('closed', {'id': self.day_shop.id})])
+
+        self.set_now(mock_now, 22)
+        self.step()
+        self.assertEqual(self.get_events(subscriber),
+                         [('opened', {'id': self.night_shop.id})])
+
+    def test_idle_step_reads_only_change_log(self, mock_now):
+        self.set_now(mock_now, 12)
+        self.scheduler.subscribe(self.place)
+        places = frozenset(self.scheduler.places)
+        self.scheduler.refresh(places)
+        self.set_now(mock_now, 19, 59)
+        with self.assertNumQueries(1):
+            delay = self.scheduler.refresh(places)[1]
+        self.assertEqual(delay, 60)
+
+    def test_changed_and_deleted_shops_of_place(self, mock_now):
+        self.set_now(mock_now, 12)
+        subscriber = self.scheduler.subscribe(self.place)
+        self.step()
+        self.get_events(subscriber)
+
+        self.day_shop.name = 'Renamed'
+        self.day_shop.save()
+        night_shop_id = self.night_shop.id
+        self.night_shop.delete()
+        self.other_shop.save()
+        self.step()
+        (changed, shop), deleted = self.get_events(subscriber)
+        self.assertEqual((changed, shop['id'], shop['name']),
+                         ('changed', self.day_shop.id, 'Renamed'))
+        self.assertEqual(deleted, ('deleted', {'id': night_shop_id}))
+
+    def test_street_subscribers_get_events_of_their_street(self, mock_now):
+        self.set_now(mock_now, 12)
+        street_subscriber = self.scheduler.subscribe(
+            (None, (self.other_shop.street_id,)))
+        self.step()
+        self.set_now(mock_now, 21)
+        self.step()
+        self.assertEqual(self.get_events(street_subscriber), [
+            ('snapshot', {'opened': [self.other_shop.id]}),
+            ('closed', {'id': self.other_shop.id}),
+        ])
+
+    def test_thousands_of_subscribers_share_one_refresh(self, mock_now):
+        self.set_now(mock_now, 12)
+        subscribers = [self.scheduler.subscribe(self.place)
+                       for _ in range(2000)]
+        self.step()
+        self.set_now(mock_now, 20)
+        self.step()
+        for subscriber in subscribers:
+            self.assertEqual(self.get_events(subscriber)[-1],
+                             ('closed', {'id': self.day_shop.id}))
+
+    def test_shop_committed_after_change_log_read_joins_later(self, mock_now):
+        self.set_now(mock_now, 12)
+        self.scheduler.subscribe(self.place)
+        self.step()
+        late_shop = self.create_shop(self.street, time(hour=19),
+                                     time(hour=23))
+        self.set_now(mock_now, 20)
+        subscriber = self.scheduler.subscribe(self.place)
+        with patch.object(self.scheduler, 'read_changes', return_value=set()):
+            self.step()  # boundary passed, late shop is not read yet
+        self.assertEqual(self.get_events(subscriber),
+                         [('snapshot', {'opened': []})])
+
+        self.step()
+        (event, shop), = self.get_events(subscriber)
+        self.assertEqual((event, shop['id'], shop['is_opened']),
+                         ('changed', late_shop.id, True))
+
+    def test_failed_step_is_logged_and_retried(self, mock_now):
+        self.set_now(mock_now, 12)
+        self.scheduler.check_interval = 0
+        subscriber = self.scheduler.subscribe(self.place)
+        refresh = self.scheduler.refresh
+
+        def fail_once(places):
+            if not hasattr(self, 'failed'):
+                self.failed = True
+                raise DatabaseError('connection lost')
+            return refresh(places)
+
+        async def run():
+            self.scheduler.wake()
+            event = await asyncio.wait_for(subscriber.queue.get(), 5)
+            self.scheduler.unsubscribe(subscriber)
+            await self.scheduler.task
+            return event
+
+        with patch.object(self.scheduler, 'refresh', side_effect=fail_once), \
+                self.assertLogs('cityshops.events', 'ERROR'):
+            event = async_to_sync(run)()
+        self.assertEqual(event, ('snapshot', {'opened': [self.day_shop.id]}))
+
+    def test_lagging_subscriber_is_closed(self, mock_now):
+        self.scheduler.queue_size = 1
+        self.set_now(mock_now, 12)
+        subscriber = self.scheduler.subscribe(self.place)
+        self.step()
+        self.set_now(mock_now, 20)
+        self.step()
+        self.assertEqual(self.get_events(subscriber), [None])
+
+
+@patch('cityshops.models.timezone.now')
+class ShopEventsAppTest(TransactionTestCase):
+
+    def setUp(self):
+        city_cache.clear()
+        street_cache.clear()
+        self.city = City.objects.create(name='Moscow')
+        street = Street.objects.create(name='Prospekt Lenina', city=self.city)
+        self.shop = Shop.objects.create(
+            name='Amused Kid', city=self.city, street=street,
+            house_numbers=13, opening_time=time(hour=8),
+            closing_time=time(hour=20),
+        )
+
+    def call(self, query_string: bytes, method: str = 'GET',
+             app=shop_events) -> list:
+        '''Messages sent by app, client disconnects after first event'''
+        scheduler = EventScheduler()
+        messages = []
+
+        async def run():
+            disconnected = asyncio.Event()
+            requests = [{'type': 'http.request', 'body': b''}]
+
+            async def receive():
+                if requests:
+                    return requests.pop()
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                messages.append(message)
+                if message.get('more_body'):
+                    disconnected.set()
+
+            scope = {'type': 'http', 'method': method,
+                     'path': '/shop/events/', 'query_string': query_string}
+            with patch('cityshops.events.scheduler', scheduler):
+                await app(scope, receive, send)
+                if scheduler.task is not None:
+                    await scheduler.task
+
+        async_to_sync(run)()
+        return messages
+
+    def test_streams_snapshot_of_city(self, mock_now):
+        mock_now.return_value = datetime(2026, 1, 5, 12, tzinfo=pytz.utc)
+        start, event, end = self.call(b'city=Moscow')
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'),
+                      start['headers'])
+        self.assertEqual(
+            event['body'],
+            b'event: snapshot\ndata: {"opened":[%d]}\n\n' % self.shop.id,
+        )
+        self.assertEqual(end, {'type': 'http.response.body', 'body': b''})
+
+    def test_unknown_place_returns_400(self, mock_now):
+        for query_string in (b'city=Atlantis', b'street=Nowhere', b''):
+            with self.subTest(query_string=query_string):
+                start, body = self.call(query_string)
+                self.assertEqual(start['status'], 400)
+                self.assertTrue(json.loads(body['body']))
+
+    def test_asgi_application_routes_event_stream(self, mock_now):
+        from test_assignment_DRF.asgi import application
+        start, body = self.call(b'city=Atlantis', app=application)
+        self.assertEqual(json.loads(body['body']),
+                         {'city': 'no such city in database'})
+
+    def test_post_returns_405(self, mock_now):
+        start, _ = self.call(b'city=Moscow', method='POST')
+        self.assertEqual(start['status'], 405)
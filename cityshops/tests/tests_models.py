@@ -1,11 +1,26 @@
 from unittest.mock import patch
 
-from datetime import time
+import random
+import re
+from datetime import datetime, time
+from threading import Event, Thread
+from unittest import skipUnless
 
+import pytz
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.db import connection, connections, transaction
+from django.db.models.signals import post_delete
+from django.test import TestCase, TransactionTestCase
 
-from cityshops.models import City, Shop, Street
+from cityshops import geo
+from cityshops.autocomplete import autocomplete_index
+from cityshops.models import (
+    DAY, WEEK, City, OpeningHours, RowChange, Shop, Street, TableVersion,
+    utc_offset,
+)
+from cityshops.name_cache import city_cache, street_cache
+from cityshops.schedule import schedule_index
+from cityshops.signals import tables_changed
 
 
 class CityModelTest(TestCase):
@@ -18,6 +33,10 @@ class CityModelTest(TestCase):
         with self.assertRaises(ValidationError):
             City(name='Moscow').full_clean()
 
+    def test_unknown_timezone_invalid(self):
+        with self.assertRaises(ValidationError):
+            City(name='Moscow', timezone='Europe/Atlantis').full_clean()
+
 
 class StreetModelTest(TestCase):
     def test_cannot_save_nameless_street(self):
@@ -56,21 +75,85 @@ class ShopModelTest(TestCase):
             closing_time=time(hour=20),
         )
 
-    def test_cannot_save_with_closing_time_lesser_than_opening_time(
-            self, mock_now):
-        shop = Shop(
-            name='Amused Kid',
-            city=self.city,
-            street=self.street,
-            house_numbers=13,
-            opening_time=time(hour=8),
-            closing_time=time(hour=7),
-        )
+    def test_cannot_save_with_only_opening_time(self, mock_now):
+        shop = self.get_valid_shop()
+        shop.closing_time = None
         with self.assertRaises(ValidationError):
             shop.full_clean()
 
+    def test_closing_time_lesser_than_opening_time_means_next_day(
+            self, mock_now):
+        shop = self.get_valid_shop()
+        shop.opening_time, shop.closing_time = time(hour=22), time(hour=2)
+        shop.full_clean()
+        moments = ((0, time(hour=23), True), (1, time(hour=1), True),
+                   (6, time(hour=23), True), (0, time(hour=1), True),
+                   (0, time(hour=2), False), (0, time(hour=12), False))
+        for weekday, moment, is_opened in moments:
+            mock_now().weekday.return_value = weekday
+            mock_now().time.return_value = moment
+            with self.subTest(weekday=weekday, moment=moment):
+                self.assertEqual(shop.is_opened(), is_opened)
+
+    def test_save_creates_daily_opening_hours(self, mock_now):
+        shop = self.get_valid_shop()
+        shop.save()
+        self.assertEqual(
+            list(shop.opening_hours.values_list('weekday', 'start', 'end')),
+            [(weekday, weekday * DAY + 8 * 3600, weekday * DAY + 20 * 3600)
+             for weekday in range(7)],
+        )
+
+        shop.closing_time = time(hour=2)
+        shop.save()
+        self.assertEqual(shop.opening_hours.last().end, WEEK + 2 * 3600)
+
+    def test_set_opening_hours_replaces_daily_time(self, mock_now):
+        shop = self.get_valid_shop()
+        shop.set_opening_hours([
+            (4, time(hour=18), time(hour=3)),
+            (5, time(hour=10), time(hour=14)),
+            (5, time(hour=18), time(hour=3)),
+        ])
+        self.assertIsNone(Shop.objects.get().opening_time)
+        self.assertEqual(shop.opening_hours.count(), 3)
+
+        mock_now().weekday.return_value = 5  # Saturday
+        for hour, is_opened in ((2, True), (9, False), (12, True),
+                                (15, False), (23, True)):
+            mock_now().time.return_value = time(hour=hour)
+            with self.subTest(hour=hour):
+                self.assertEqual(Shop.objects.get().is_opened(), is_opened)
+                self.assertEqual(Shop.objects.opened().exists(), is_opened)
+
+    def test_set_same_opening_hours_every_day_keeps_daily_time(self, mock_now):
+        shop = self.get_valid_shop()
+        shop.set_opening_hours([(weekday, time(hour=9), time(hour=18))
+                                for weekday in range(7)])
+        shop.refresh_from_db()
+        self.assertEqual(shop.opening_time, time(hour=9))
+        self.assertEqual(shop.closing_time, time(hour=18))
+
+    def test_deferred_loads_do_not_read_daily_time(self, mock_now):
+        self.get_valid_shop().save()
+        with self.assertNumQueries(1):
+            shop, = Shop.objects.only('id', 'name')
+        with self.assertNumQueries(1):
+            Shop.objects.defer('opening_time').get()
+
+        shop.name = 'Renamed'
+        shop.save()  # deferred daily time has not changed
+        self.assertEqual(Shop.objects.get().opening_time, time(hour=8))
+        self.assertEqual(shop.opening_hours.count(), 7)
+
+        shop = Shop.objects.defer('opening_time', 'closing_time').get()
+        shop.closing_time = time(hour=2)
+        shop.save()
+        self.assertEqual(shop.opening_hours.last().end, WEEK + 2 * 3600)
+
     def test_is_opened_returns_false_if_now_less_than_opening_time(
             self, mock_now):
+        mock_now().weekday.return_value = 0  # Monday
         mock_now().time.return_value = time(hour=7, minute=59, second=59)
         shop = self.get_valid_shop()
 
@@ -79,6 +162,7 @@ class ShopModelTest(TestCase):
 
     def test_is_opened_returns_true_if_now_between_opening_and_closing(
             self, mock_now):
+        mock_now().weekday.return_value = 0  # Monday
         mock_now().time.return_value = time(hour=12)
         shop = self.get_valid_shop()
 
@@ -87,6 +171,7 @@ class ShopModelTest(TestCase):
 
     def test_is_opened_returns_false_if_now_greater_than_closing_time(
             self, mock_now):
+        mock_now().weekday.return_value = 0  # Monday
         mock_now().time.return_value = time(hour=20, second=1)
         shop = self.get_valid_shop()
 
@@ -95,6 +180,7 @@ class ShopModelTest(TestCase):
 
     def test_is_opened_return_true_if_now_is_opening_time(self, mock_now):
         shop = self.get_valid_shop()
+        mock_now().weekday.return_value = 0  # Monday
         mock_now().time.return_value = time(hour=8)
 
         self.assertEqual(shop.opening_time, mock_now().time())
@@ -104,8 +190,670 @@ class ShopModelTest(TestCase):
     def test_is_opened_return_false_if_now_is_closing_time(
             self, mock_now):
         shop = self.get_valid_shop()
+        mock_now().weekday.return_value = 0  # Monday
         mock_now().time.return_value = time(hour=20)
 
         self.assertEqual(shop.closing_time, mock_now().time())
         self.assertFalse(shop.is_opened())
         self.assertTrue(shop.is_closed())
+
+
+@patch('cityshops.models.timezone.now')
+class ShopQuerySetTest(TestCase):
+    def setUp(self):
+        city = City.objects.create(name='Rostov-on-Don')
+        street = Street.objects.create(name='Prospekt Lenina', city=city)
+        self.shop = Shop.objects.create(
+            name='Amused Kid',
+            city=city,
+            street=street,
+            house_numbers=13,
+            opening_time=time(hour=8),
+            closing_time=time(hour=20),
+        )
+
+    def test_opened_and_closed_are_lazy_querysets(self, mock_now):
+        mock_now().weekday.return_value = 0  # Monday
+        mock_now().time.return_value = time(hour=12)
+        self.assertIsInstance(Shop.objects.opened(), Shop.objects.none().__class__)
+        self.assertIsInstance(Shop.objects.closed(), Shop.objects.none().__class__)
+
+    def test_opened_matches_is_opened_at_boundaries(self, mock_now):
+        moments = (
+            time(hour=7, minute=59, second=59),
+            time(hour=8),
+            time(hour=12),
+            time(hour=19, minute=59, second=59),
+            time(hour=20),
+            time(hour=20, second=1),
+        )
+        for moment in moments:
+            mock_now().weekday.return_value = 0  # Monday
+            mock_now().time.return_value = moment
+            with self.subTest(moment=moment):
+                is_opened = self.shop.is_opened()
+                self.assertEqual(Shop.objects.opened().exists(), is_opened)
+                self.assertEqual(Shop.objects.closed().exists(), not is_opened)
+
+
+    def test_seconds_to_next_boundary_today(self, mock_now):
+        mock_now().weekday.return_value = 0  # Monday
+        mock_now().time.return_value = time(hour=19, minute=30)
+        self.assertEqual(Shop.objects.seconds_to_next_boundary(), 30 * 60)
+
+    def test_seconds_to_next_boundary_tomorrow(self, mock_now):
+        mock_now().weekday.return_value = 0  # Monday
+        mock_now().time.return_value = time(hour=23)
+        self.assertEqual(Shop.objects.seconds_to_next_boundary(), 9 * 60 * 60)
+
+    def test_seconds_to_next_boundary_of_no_shops(self, mock_now):
+        mock_now().weekday.return_value = 0  # Monday
+        mock_now().time.return_value = time(hour=12)
+        self.assertIsNone(Shop.objects.none().seconds_to_next_boundary())
+
+
+class OpeningHoursQuerySetTest(TestCase):
+
+    def test_at_scans_two_bounded_index_ranges(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:  # table is tiny here
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = OpeningHours.objects.at(DAY + 1).values('shop_id').explain()
+        if connection.vendor == 'postgresql':
+            conditions = re.findall(r'Index Cond: (.*)', plan)
+        else:
+            conditions = re.findall(r'openinghours_week_idx \((.*)\)', plan)
+        self.assertEqual(len(conditions), 2, plan)
+        for condition in conditions:
+            self.assertRegex(condition, r'start.*>.*start.*<', plan)
+
+
+@patch('cityshops.models.timezone.now')
+class LocalTimeTest(TestCase):
+    def setUp(self):
+        self.shops = {
+            name: self.create_shop(name)
+            for name in ('Europe/Moscow', 'Asia/Vladivostok', 'Europe/Berlin')
+        }
+
+    def create_shop(self, timezone_name: str) -> Shop:
+        city = City.objects.create(name=timezone_name, timezone=timezone_name)
+        street = Street.objects.create(name='Prospekt Lenina', city=city)
+        return Shop.objects.create(
+            name='Amused Kid',
+            city=city,
+            street=street,
+            house_numbers=1,
+            opening_time=time(hour=8),
+            closing_time=time(hour=20),
+        )
+
+    def set_now(self, mock_now, *moment):
+        mock_now.return_value = datetime(*moment, tzinfo=pytz.utc)
+
+    def test_utc_offset(self, mock_now):
+        self.set_now(mock_now, 2026, 1, 5, 0, 0)
+        self.assertEqual(utc_offset('Asia/Vladivostok'), 10 * 60 * 60)
+        self.assertEqual(utc_offset('America/New_York'), -5 * 60 * 60)
+        self.set_now(mock_now, 2026, 7, 6, 0, 0)
+        self.assertEqual(utc_offset('America/New_York'), -4 * 60 * 60)
+
+    def test_shops_are_checked_in_local_time(self, mock_now):
+        self.set_now(mock_now, 2026, 1, 5, 0, 0)  # Monday
+        vladivostok = self.shops['Asia/Vladivostok']
+        self.assertEqual(list(Shop.objects.opened()), [vladivostok])
+        self.assertEqual(set(Shop.objects.closed()),
+                         set(self.shops.values()) - {vladivostok})
+        for shop in self.shops.values():
+            with self.subTest(shop=shop.city.timezone):
+                self.assertEqual(shop.is_opened(), shop == vladivostok)
+
+    def test_opened_is_one_query(self, mock_now):
+        self.set_now(mock_now, 2026, 1, 5, 6, 0)
+        with self.assertNumQueries(1):
+            shops = list(Shop.objects.opened(list(self.shops)))
+        self.assertEqual(set(shops), {self.shops['Europe/Moscow'],
+                                      self.shops['Asia/Vladivostok']})
+
+    def test_opened_after_dst_transition(self, mock_now):
+        berlin = Shop.objects.filter(id=self.shops['Europe/Berlin'].id)
+        self.set_now(mock_now, 2026, 3, 28, 6, 30)  # 07:30 CET
+        self.assertFalse(berlin.opened().exists())
+        self.set_now(mock_now, 2026, 3, 29, 6, 30)  # 08:30 CEST
+        self.assertTrue(berlin.opened().exists())
+
+    def test_dst_transition_is_next_boundary(self, mock_now):
+        berlin = Shop.objects.filter(id=self.shops['Europe/Berlin'].id)
+        self.set_now(mock_now, 2026, 3, 29, 0, 30)  # 01:30 CET
+        self.assertEqual(berlin.seconds_to_next_boundary(), 30 * 60)
+        self.set_now(mock_now, 2026, 3, 29, 1, 0)  # 03:00 CEST
+        self.assertEqual(berlin.seconds_to_next_boundary(), 5 * 60 * 60)
+
+    def test_next_boundary_of_cities_with_different_offsets(self, mock_now):
+        self.set_now(mock_now, 2026, 1, 5, 4, 0)  # 07:00 in Moscow
+        self.assertEqual(Shop.objects.seconds_to_next_boundary(), 60 * 60)
+
+
+class GeoTest(TestCase):
+    def test_encode(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+
+    def test_distance(self):
+        # one degree of meridian
+        self.assertAlmostEqual(geo.distance(0, 0, 1, 0), 111_195, delta=1)
+        self.assertEqual(geo.distance(55.75, 37.62, 55.75, 37.62), 0)
+
+    def test_covering_prefixes_contain_every_point_within_radius(self):
+        rng = random.Random(0)
+        for latitude, longitude in ((55.75, 37.62), (-33.9, 151.2),
+                                    (0.0, 179.999), (78.2, 15.6)):
+            for radius in (10, 700, 10_000):
+                prefixes = geo.covering_prefixes(latitude, longitude, radius)
+                for _ in range(200):
+                    point = (latitude + rng.uniform(-1, 1) * radius / 111_195,
+                             longitude + rng.uniform(-3, 3) * radius / 111_195)
+                    point = (point[0], (point[1] + 180) % 360 - 180)
+                    if geo.distance(latitude, longitude, *point) > radius:
+                        continue
+                    geohash = geo.encode(*point)
+                    with self.subTest(center=(latitude, longitude),
+                                      radius=radius, point=point):
+                        self.assertTrue(any(map(geohash.startswith,
+                                                prefixes)))
+
+
+class ShopNearestTest(TestCase):
+    def setUp(self):
+        city = City.objects.create(name='Moscow')
+        street = Street.objects.create(name='Tverskaya', city=city)
+        rng = random.Random(0)
+        self.shops = [
+            Shop.objects.create(
+                name=f'Shop {number}',
+                city=city,
+                street=street,
+                house_numbers=number,
+                opening_time=time(hour=8),
+                closing_time=time(hour=20),
+                latitude=55.75 + rng.uniform(-0.05, 0.05),
+                longitude=37.62 + rng.uniform(-0.05, 0.05),
+            )
+            for number in range(100)
+        ]
+
+    def test_coordinates_are_geohashed_on_save(self):
+        shop = self.shops[0]
+        self.assertEqual(shop.geohash, geo.encode(shop.latitude,
+                                                  shop.longitude))
+        shop.latitude = shop.longitude = None
+        shop.save()
+        self.assertEqual(shop.geohash, '')
+
+    def test_nearest_matches_brute_force(self):
+        for radius, limit in ((300, 10), (2000, 10), (2000, 1000)):
+            expected = sorted(
+                (distance, shop.id) for shop in self.shops
+                if (distance := geo.distance(55.75, 37.62, shop.latitude,
+                                             shop.longitude)) <= radius
+            )[:limit]
+            with self.subTest(radius=radius, limit=limit):
+                self.assertEqual(
+                    Shop.objects.nearest(55.75, 37.62, radius, limit),
+                    expected,
+                )
+
+    def test_shop_without_coordinates_is_never_near(self):
+        Shop.objects.update(latitude=None, longitude=None, geohash='')
+        self.assertEqual(Shop.objects.nearest(55.75, 37.62, 10_000, 10), [])
+
+    def test_needs_both_coordinates(self):
+        shop = self.shops[0]
+        shop.longitude = None
+        with self.assertRaises(ValidationError):
+            shop.full_clean()
+
+
+class NameIdCacheTest(TestCase):
+    def setUp(self):
+        self.city = City.objects.create(name='Moscow')
+        self.street = Street.objects.create(name='Prospekt Lenina',
+                                            city=self.city)
+
+    def get_version(self, model) -> int:
+        (_, version, _), = TableVersion.objects.of((model,))
+        return version
+
+    def get_city(self, name: str) -> list:
+        return city_cache.get(name, self.get_version(City))
+
+    def get_street(self, name: str) -> list:
+        return street_cache.get(name, self.get_version(Street))
+
+    def test_get_returns_ids_of_named_rows(self):
+        self.assertEqual(self.get_city('Moscow'), [(self.city.id,)])
+        self.assertEqual(self.get_street('Prospekt Lenina'),
+                         [(self.street.id, self.city.id)])
+
+    def test_get_caches_found_names(self):
+        version = self.get_version(City)
+        city_cache.get('Moscow', version)
+        with self.assertNumQueries(0):
+            city_cache.get('Moscow', version)
+
+    def test_get_without_version_bypasses_cache(self):
+        city_cache.get('Moscow', None)
+        with self.assertNumQueries(1):
+            city_cache.get('Moscow', None)
+
+    def test_get_does_not_cache_unknown_names(self):
+        self.assertEqual(self.get_city('Atlantis'), [])
+        city = City.objects.create(name='Atlantis')
+        self.assertEqual(self.get_city('Atlantis'), [(city.id,)])
+
+    def test_save_invalidates_cache(self):
+        self.get_city('Moscow')
+        self.city.name = 'Moskva'
+        self.city.save()
+        self.assertEqual(self.get_city('Moscow'), [])
+
+    def test_delete_invalidates_cache(self):
+        self.get_street('Prospekt Lenina')
+        self.city.delete()  # cascades to street
+        self.assertEqual(self.get_city('Moscow'), [])
+        self.assertEqual(self.get_street('Prospekt Lenina'), [])
+
+    def test_write_of_other_process_invalidates_cache(self):
+        self.get_city('Moscow')
+        # other process renames city, signals of this one do not run
+        City.objects.filter(id=self.city.id).update(name='Moskva')
+        TableVersion.objects.bump(City)
+        self.assertEqual(self.get_city('Moscow'), [])
+
+
+class TableVersionTest(TestCase):
+    def get_version(self, model) -> int:
+        (_, version, _), = TableVersion.objects.of((model,))
+        return version
+
+    def test_save_and_delete_bump_version(self):
+        version = self.get_version(City)
+        city = City.objects.create(name='Moscow')
+        self.assertEqual(self.get_version(City), version + 1)
+        city.delete()
+        self.assertEqual(self.get_version(City), version + 2)
+
+    def test_bump_creates_missing_row(self):
+        TableVersion.objects.all().delete()
+        TableVersion.objects.bump(Street)
+        self.assertEqual(self.get_version(Street), 1)
+
+
+class RowChangeTest(TestCase):
+    def setUp(self):
+        self.city = City.objects.create(name='Moscow')
+        self.street = Street.objects.create(name='Prospekt Lenina',
+                                            city=self.city)
+        self.shop = Shop.objects.create(
+            name='Amused Kid', city=self.city, street=self.street,
+            house_numbers=13, opening_time=time(hour=8),
+            closing_time=time(hour=20),
+        )
+
+    def get_log(self) -> list:
+        return list(RowChange.objects.order_by('id')
+                             .values_list('table', 'row_id', 'deleted'))
+
+    def test_writes_are_logged_in_order(self):
+        self.assertEqual(self.get_log(), [
+            ('cityshops.city', self.city.id, False),
+            ('cityshops.street', self.street.id, False),
+            ('cityshops.shop', self.shop.id, False),
+        ])
+
+    def test_saved_row_moves_to_end_of_log(self):
+        self.city.save()
+        self.assertEqual(self.get_log()[-1],
+                         ('cityshops.city', self.city.id, False))
+        self.assertEqual(len(self.get_log()), 3)
+
+    def test_deleted_rows_leave_tombstones(self):
+        city_id = self.city.id
+        self.city.delete()  # cascades to street and shop
+        self.assertEqual(sorted(self.get_log()), [
+            ('cityshops.city', city_id, True),
+            ('cityshops.shop', self.shop.id, True),
+            ('cityshops.street', self.street.id, True),
+        ])
+
+    def test_recording_no_rows_does_not_bump_version(self):
+        (_, version, _), = TableVersion.objects.of((RowChange,))
+        RowChange.objects.record(Shop, [])
+        self.assertEqual(TableVersion.objects.of((RowChange,))[0][1], version)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs concurrent writers')
+class RowChangeOrderTest(TransactionTestCase):
+    '''Writers run in threads with connections of their own'''
+
+    def setUp(self):
+        TableVersion.objects.bump(RowChange)  # version row to lock
+
+    def record_in_thread(self, row_id: int, recorded: Event,
+                         release: Event = None) -> Thread:
+        def write():
+            try:
+                with transaction.atomic():
+                    RowChange.objects.record(City, [row_id])
+                    recorded.set()
+                    if release is not None:
+                        release.wait(5)
+            finally:
+                connections.close_all()
+        thread = Thread(target=write)
+        thread.start()
+        return thread
+
+    def test_reader_never_skips_change_committed_later(self):
+        first_recorded, second_recorded, release = Event(), Event(), Event()
+        first = self.record_in_thread(1, first_recorded, release)
+        self.assertTrue(first_recorded.wait(5))
+        second = self.record_in_thread(2, second_recorded)
+        # without version row lock second change would get greater id and
+        # commit first, so reader's token would pass uncommitted first one
+        self.assertFalse(second_recorded.wait(0.5))
+        self.assertFalse(RowChange.objects.exists())
+
+        release.set()
+        first.join()
+        second.join()
+        row_ids = RowChange.objects.order_by('id') \
+                                   .values_list('row_id', flat=True)
+        self.assertEqual(list(row_ids), [1, 2])
+
+    def test_cascading_delete_and_save_do_not_deadlock(self):
+        city = City.objects.create(name='Moscow')
+        street = Street.objects.create(name='Prospekt Lenina', city=city)
+        Shop.objects.create(name='Amused Kid', city=city, street=street,
+                            house_numbers=1, opening_time=time(hour=8),
+                            closing_time=time(hour=20))
+        other = Street.objects.create(name='Tverskaya',
+                                      city=City.objects.create(name='Tver'))
+        shop_deleted, release, saved = Event(), Event(), Event()
+        errors = []
+
+        def pause_after_shop(sender, **kwargs):
+            shop_deleted.set()
+            release.wait(5)
+
+        def run(write, done=None):
+            try:
+                with transaction.atomic():
+                    write()
+                if done is not None:
+                    done.set()
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        # delete holds shop and change log versions, street ones are next
+        post_delete.connect(pause_after_shop, sender=Shop)
+        self.addCleanup(post_delete.disconnect, pause_after_shop, sender=Shop)
+        deleting = Thread(target=run, args=(city.delete,))
+        deleting.start()
+        self.assertTrue(shop_deleted.wait(5))
+        saving = Thread(target=run, args=(other.save, saved))
+        saving.start()
+        self.assertFalse(saved.wait(0.5))  # waits for change log version
+
+        release.set()
+        deleting.join()
+        saving.join()
+        self.assertEqual(errors, [])
+        self.assertTrue(saved.is_set())
+        self.assertFalse(City.objects.filter(id=city.id).exists())
+
+
+class ScheduleIndexTest(TestCase):
+    def setUp(self):
+        schedule_index.clear()
+        self.city = City.objects.create(name='Moscow')
+        self.street = Street.objects.create(name='Prospekt Lenina',
+                                            city=self.city)
+        self.shops = [
+            self.create_shop(time(hour=8), time(hour=20)),
+            self.create_shop(time(hour=8), time(hour=12)),
+            self.create_shop(time(hour=22), time(hour=6)),
+        ]
+
+    def create_shop(self, opening_time: time, closing_time: time) -> Shop:
+        return Shop.objects.create(
+            name='Amused Kid',
+            city=self.city,
+            street=self.street,
+            house_numbers=1,
+            opening_time=opening_time,
+            closing_time=closing_time,
+        )
+
+    def get_versions(self) -> tuple:
+        versions = {label: version for label, version, _
+                    in TableVersion.objects.of((City, Shop))}
+        return versions['cityshops.city'], versions['cityshops.shop']
+
+    def get_shop_ids(self, moment: float, opened: bool = True,
+                     city_id='city', limit: int = 100) -> list:
+        city_id = self.city.id if city_id == 'city' else city_id
+        return schedule_index.get_shop_ids(
+            city_id, moment, opened, versions=self.get_versions(), limit=limit,
+        )
+
+    @patch('cityshops.models.timezone.now')
+    def test_matches_opened_and_closed_querysets(self, mock_now):
+        for weekday in (0, 6):
+            mock_now().weekday.return_value = weekday
+            for hour in range(24):
+                mock_now().time.return_value = time(hour=hour)
+                moment = weekday * DAY + hour * 60 * 60
+                with self.subTest(weekday=weekday, hour=hour):
+                    opened = Shop.objects.opened().order_by('id')
+                    closed = Shop.objects.closed().order_by('id')
+                    self.assertEqual(self.get_shop_ids(moment),
+                                     [shop.id for shop in opened])
+                    self.assertEqual(self.get_shop_ids(moment, opened=False),
+                                     [shop.id for shop in closed])
+
+    def test_other_city_and_all_cities(self):
+        other_city = City.objects.create(name='Tver')
+        nine = 9 * 60 * 60
+        self.assertEqual(self.get_shop_ids(nine, city_id=other_city.id), [])
+        self.assertEqual(self.get_shop_ids(nine, city_id=None),
+                         [self.shops[0].id, self.shops[1].id])
+
+    def test_committed_writes_are_applied_without_rebuild(self):
+        self.get_shop_ids(0)
+        with self.captureOnCommitCallbacks(execute=True):
+            shop = self.create_shop(time(hour=6), time(hour=7))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shops[0].delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shops[2].set_opening_hours([(0, time(hour=6), time(hour=8))])
+
+        versions = self.get_versions()
+        with self.assertNumQueries(0):
+            shop_ids = schedule_index.get_shop_ids(
+                self.city.id, 6.5 * 60 * 60, True, versions=versions, limit=100,
+            )
+        self.assertEqual(shop_ids, [self.shops[2].id, shop.id])
+
+    def test_write_without_signals_rebuilds_index(self):
+        self.get_shop_ids(0)
+        OpeningHours.objects.filter(shop=self.shops[1]).update(end=WEEK + DAY)
+        tables_changed(Shop)
+        self.assertIn(self.shops[1].id, self.get_shop_ids(0))
+
+    @patch('cityshops.models.timezone.now')
+    def test_moment_is_converted_to_local_time_of_city(self, mock_now):
+        mock_now.return_value = datetime(2026, 1, 5, tzinfo=pytz.utc)
+        City.objects.filter(id=self.city.id).update(timezone='Asia/Vladivostok')
+        tables_changed(City)
+        # Monday 00:00 UTC is 10:00 in Vladivostok
+        self.assertEqual(self.get_shop_ids(0),
+                         [self.shops[0].id, self.shops[1].id])
+
+    def test_too_many_shops_are_left_to_database(self):
+        self.assertIsNone(self.get_shop_ids(9 * 60 * 60, limit=1))
+        self.assertIsNone(self.get_shop_ids(13 * 60 * 60, opened=False,
+                                            limit=1))
+
+
+class ScheduleIndexRebuildTest(TransactionTestCase):
+    '''Background rebuild reads committed rows by its own connection'''
+
+    def setUp(self):
+        schedule_index.clear()
+        city = City.objects.create(name='Moscow')
+        self.shop = Shop.objects.create(
+            name='Amused Kid', city=city,
+            street=Street.objects.create(name='Prospekt Lenina', city=city),
+            house_numbers=1, opening_time=time(hour=8),
+            closing_time=time(hour=20),
+        )
+        versions = {label: version for label, version, _
+                    in TableVersion.objects.of((City, Shop))}
+        self.versions = versions['cityshops.city'], versions['cityshops.shop']
+
+    def get_shop_ids(self):
+        return schedule_index.get_shop_ids(None, 9 * 60 * 60, True,
+                                           versions=self.versions, limit=100)
+
+    @patch('cityshops.schedule.Thread')
+    def test_stale_index_is_left_to_database_until_rebuilt(self, thread):
+        self.assertIsNone(self.get_shop_ids())
+        self.assertIsNone(self.get_shop_ids())
+        thread.assert_called_once_with(
+            target=schedule_index.rebuild_in_thread, args=(self.versions,),
+            daemon=True)
+
+        schedule_index.rebuild_in_thread(self.versions)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_shop_ids(), [self.shop.id])
+
+
+class AutocompleteIndexTest(TestCase):
+    def setUp(self):
+        autocomplete_index.clear()
+        self.moscow = City.objects.create(name='Moscow')
+        self.tver = City.objects.create(name='Tver')
+        self.streets = [
+            Street.objects.create(name=name, city=city)
+            for name, city in (('Tverskaya', self.moscow),
+                               ('Mokhovaya', self.moscow),
+                               ('Tverskaya', self.tver))
+        ]
+
+    def search(self, text: str, **kwargs) -> dict:
+        return autocomplete_index.search(text, kwargs.pop('limit', 10),
+                                         **kwargs)
+
+    def test_names_starting_with_text_ignoring_case(self):
+        self.assertEqual(self.search('tVeR'), {
+            'cities': [{'id': self.tver.id, 'name': 'Tver'}],
+            'streets': [
+                {'id': self.streets[0].id, 'name': 'Tverskaya',
+                 'city': 'Moscow'},
+                {'id': self.streets[2].id, 'name': 'Tverskaya',
+                 'city': 'Tver'},
+            ],
+        })
+        self.assertEqual(self.search('Mo', limit=1)['streets'],
+                         [{'id': self.streets[1].id, 'name': 'Mokhovaya',
+                           'city': 'Moscow'}])
+
+    def test_fuzzy_search_finds_misspelled_names(self):
+        self.assertEqual(self.search('Moskow')['cities'], [])
+        self.assertEqual(self.search('Moskow', fuzzy=True)['cities'],
+                         [{'id': self.moscow.id, 'name': 'Moscow'}])
+
+    def test_streets_of_one_city(self):
+        result = self.search('Tver', city_id=self.tver.id)
+        self.assertEqual(result['cities'], [])
+        self.assertEqual([street['id'] for street in result['streets']],
+                         [self.streets[2].id])
+
+    def test_committed_writes_are_applied_without_queries(self):
+        self.search('M')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.moscow.name = 'Moskva'
+            self.moscow.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.streets[1].delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            Street.objects.create(name='Mokhovaya', city=self.tver)
+
+        with self.assertNumQueries(0):
+            result = self.search('Mo')
+        self.assertEqual(result['cities'], [{'id': self.moscow.id,
+                                             'name': 'Moskva'}])
+        self.assertEqual([street['city'] for street in result['streets']],
+                         ['Tver'])
+        # applied writes match table versions, so no rebuild follows
+        with patch.object(autocomplete_index, 'check_interval', 0), \
+                patch.object(autocomplete_index, 'rebuild') as rebuild:
+            self.search('Mo')
+        rebuild.assert_not_called()
+
+    def test_street_of_city_unknown_to_index_is_skipped_until_rebuild(self):
+        self.search('M')
+        # commit callbacks of city are not run, as in other process
+        city = City.objects.create(name='Kazan')
+        with self.captureOnCommitCallbacks(execute=True):
+            street = Street.objects.create(name='Bauman', city=city)
+
+        self.assertEqual(self.search('Bau')['streets'], [])
+        self.assertEqual(self.search('Bau')['streets'],
+                         [{'id': street.id, 'name': 'Bauman',
+                           'city': 'Kazan'}])
+
+    def test_bulk_writes_show_up_after_check_interval(self):
+        self.search('M')
+        Street.objects.bulk_create([Street(name='Manezhnaya',
+                                           city=self.moscow)])
+        tables_changed(Street)
+        self.assertEqual(len(self.search('Ma')['streets']), 0)
+        with patch.object(autocomplete_index, 'check_interval', 0):
+            self.assertEqual(len(self.search('Ma')['streets']), 1)
+
+
+class AutocompleteIndexRebuildTest(TransactionTestCase):
+    '''Background rebuild reads committed rows by its own connection'''
+
+    def setUp(self):
+        autocomplete_index.clear()
+        self.city = City.objects.create(name='Moscow')
+        Street.objects.create(name='Mokhovaya', city=self.city)
+
+    def search(self, text: str) -> list:
+        with patch.object(autocomplete_index, 'check_interval', 0):
+            result = autocomplete_index.search(text, 10)
+        return [street['name'] for street in result['streets']]
+
+    @patch('cityshops.autocomplete.Thread')
+    def test_stale_index_is_served_until_rebuilt(self, thread):
+        self.assertEqual(self.search('M'), ['Mokhovaya'])
+        thread.assert_not_called()  # first build has nothing to serve
+
+        Street.objects.bulk_create([Street(name='Manezhnaya',
+                                           city=self.city)])
+        tables_changed(Street)
+        self.assertEqual(self.search('M'), ['Mokhovaya'])
+        self.assertEqual(self.search('M'), ['Mokhovaya'])
+        versions = autocomplete_index.get_versions()
+        thread.assert_called_once_with(
+            target=autocomplete_index.rebuild_in_thread, args=(versions,),
+            daemon=True)
+
+        autocomplete_index.rebuild_in_thread(versions)
+        with patch.object(autocomplete_index, 'rebuild') as rebuild:
+            self.assertEqual(self.search('M'), ['Manezhnaya', 'Mokhovaya'])
+        rebuild.assert_not_called()
@@ -0,0 +1,70 @@
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytz
+from django.test import TestCase
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from cityshops.models import City, Shop, Street
+from cityshops.renderers import FastJSONRenderer, dumps
+from cityshops.views import ShopList
+
+
+DATA = {
+    'name': 'Улица Ленина “1”\u2028\u2029',
+    'opening_time': time(hour=8),
+    'closing_time': time(hour=23, minute=59, second=59, microsecond=5),
+    'day': date(2026, 1, 5),
+    'moment': datetime(2026, 1, 5, 8, 0, 0, 123456, tzinfo=pytz.utc),
+    'naive_moment': datetime(2026, 1, 5, 8, 0),
+    'price': Decimal('1.50'),
+    'error': gettext_lazy('This field is required.'),
+    'nested': [{1: None, 'latitude': 55.75, 'is_opened': True}],
+}
+
+
+class FastJSONRendererTest(TestCase):
+
+    def test_renders_same_bytes_as_json_renderer(self):
+        self.assertEqual(FastJSONRenderer().render(DATA),
+                         JSONRenderer().render(DATA))
+
+    def test_renders_same_bytes_without_orjson(self):
+        with patch('cityshops.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(DATA),
+                             JSONRenderer().render(DATA))
+
+    def test_indented_output_is_left_to_json_renderer(self):
+        media_type = 'application/json; indent=4'
+        self.assertEqual(FastJSONRenderer().render(DATA, media_type),
+                         JSONRenderer().render(DATA, media_type))
+
+    def test_floats_parse_to_same_values(self):
+        data = {'small': 1e-05, 'large': 1e16, 'latitude': 55.75}
+        self.assertEqual(json.loads(dumps(data)),
+                         json.loads(JSONRenderer().render(data)))
+
+    def test_dumps_appends_newline(self):
+        self.assertEqual(dumps([1], newline=True), b'[1]\n')
+
+
+class FastJSONRendererAPITest(APITestCase):
+
+    def setUp(self):
+        city = City.objects.create(name='Москва', timezone='Europe/Moscow')
+        street = Street.objects.create(name='Тверская', city=city)
+        for number in range(3):
+            Shop.objects.create(
+                name=f'Shop {number}', city=city, street=street,
+                house_numbers=number, latitude=55.75, longitude=37.61,
+                opening_time=time(hour=8), closing_time=time(hour=20),
+            )
+
+    def test_shop_list_body_is_unchanged(self):
+        expected = self.client.get('/shop/').content
+        with patch.object(ShopList, 'renderer_classes', [FastJSONRenderer]):
+            self.assertEqual(self.client.get('/shop/').content, expected)
@@ -46,19 +46,38 @@ class StreetSerializerTest(TestCase):
 
 class ShopSerializerTest(TestCase):
 
-    def test_cannot_save_with_closing_time_lesser_than_opening_time(self):
+    def setUp(self):
         city = City.objects.create(name='Rostov-on-Don')
-        street = Street.objects.create(name='Prospekt Lenina', city=city)
-
-        data = {
+        Street.objects.create(name='Prospekt Lenina', city=city)
+        self.data = {
             'name': 'Amused Kid',
-            'city': city.name,
-            'street': street.name,
+            'city': 'Rostov-on-Don',
+            'street': 'Prospekt Lenina',
             'house_numbers': 13,
-            'opening_time': '08:00:00',
-            'closing_time': '07:00:00',
         }
+
+    def test_closing_time_lesser_than_opening_time_is_valid(self):
+        data = dict(self.data, opening_time='22:00:00', closing_time='07:00:00')
         serializer = ShopSerializer(data=data)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    def test_cannot_save_without_hours(self):
+        serializer = ShopSerializer(data=self.data)
         self.assertFalse(serializer.is_valid())
         error_text = str(serializer.errors.get('non_field_errors'))
-        self.assertIn('closing time earlier than opening time', error_text)
+        self.assertIn('opening and closing time or opening hours', error_text)
+
+    def test_save_with_opening_hours_of_weekdays(self):
+        opening_hours = [
+            {'weekday': 4, 'opening_time': '10:00:00', 'closing_time': '02:00:00'},
+            {'weekday': 5, 'opening_time': '12:00:00', 'closing_time': '16:00:00'},
+        ]
+        serializer = ShopSerializer(data=dict(self.data,
+                                              opening_hours=opening_hours))
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        shop = serializer.save()
+
+        data = ShopSerializer(Shop.objects.get(id=shop.id)).data
+        self.assertIsNone(data['opening_time'])
+        self.assertEqual([dict(row) for row in data['opening_hours']],
+                         opening_hours)
@@ -1,10 +1,35 @@
-from datetime import time
+import json
+from datetime import datetime, time
 from unittest.mock import patch
 
-from rest_framework.test import APITestCase
+import pytz
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DatabaseError, connection, connections
+from django.test import TransactionTestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import (
+    APIRequestFactory, APITestCase, APITransactionTestCase,
+)
 from rest_framework import status
 
-from cityshops.models import City, Street, Shop
+from cityshops.autocomplete import autocomplete_index
+from cityshops.bulk import bulk_create_shops
+from cityshops.models import City, OpeningHours, RowChange, Street, Shop
+from cityshops.pagination import IdCursorPagination
+from cityshops.profiling import profile_store
+from cityshops.routers import PRIMARY_COOKIE, ReplicaRouter, current_replica
+from cityshops.schedule import schedule_index
+from cityshops.serializers import ShopSerializer
+from cityshops.views import (
+    CityList, CityStreetsList, ShopExport, ShopImport, ShopList,
+)
 
 
 class RootAPITest(APITestCase):
@@ -25,19 +50,47 @@ class RootAPITest(APITestCase):
         self.assertEquals(expected, response.json())
 
 
+@override_settings(DATABASE_CONN_HEALTH_CHECKS=True)
+class ConnectionHealthCheckTest(TransactionTestCase):
+    '''Health check skips connections inside transaction of TestCase'''
+
+    def test_unusable_connection_is_closed_at_request_start(self):
+        connection.ensure_connection()
+        with patch.object(connection, 'is_usable', return_value=False), \
+                patch.object(connection, 'close') as close:
+            self.client.get(path='/city/')
+        close.assert_called()
+
+    def test_usable_connection_is_kept(self):
+        connection.ensure_connection()
+        with patch.object(connection, 'close') as close:
+            self.client.get(path='/city/')
+        close.assert_not_called()
+
+    @override_settings(DATABASE_CONN_HEALTH_CHECKS=False)
+    def test_disabled_check_does_not_ping(self):
+        connection.ensure_connection()
+        with patch.object(connection, 'is_usable') as is_usable:
+            self.client.get(path='/city/')
+        is_usable.assert_not_called()
+
+
 class CityAPITest(APITestCase):
 
+    def setUp(self):
+        cache.clear()
+
     def test_get_returns_all_cities_from_database(self):
         city1 = City.objects.create(name='Moscow')
         city2 = City.objects.create(name='Saint Petersburg')
         city3 = City.objects.create(name='Rostov-on-Don')
         response = self.client.get(path='/city/')
         self.assertEquals(
-            response.json(),
+            response.json()['results'],
             [
-                {'id': city1.id, 'name': city1.name},
-                {'id': city2.id, 'name': city2.name},
-                {'id': city3.id, 'name': city3.name},
+                {'id': city1.id, 'name': city1.name, 'timezone': 'UTC'},
+                {'id': city2.id, 'name': city2.name, 'timezone': 'UTC'},
+                {'id': city3.id, 'name': city3.name, 'timezone': 'UTC'},
             ]
         )
 
@@ -56,9 +109,19 @@ class CityAPITest(APITestCase):
             {'name': ['This field may not be blank.']}
         )
 
+    def test_post_unknown_timezone_returns_errors(self):
+        data = {'name': 'Moscow', 'timezone': 'Europe/Atlantis'}
+        response = self.client.post(path='/city/', data=data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(),
+                         {'timezone': ['Unknown timezone "Europe/Atlantis"']})
+
 
 class StreetAPITest(APITestCase):
 
+    def setUp(self):
+        cache.clear()
+
     def test_get_returns_all_city_streets_from_database(self):
         city = City.objects.create(name='Rostov-on-Don')
         street1 = Street.objects.create(city=city, name='Prospekt Stachki')
@@ -66,7 +129,7 @@ class StreetAPITest(APITestCase):
         street3 = Street.objects.create(city=city, name='Prospekt Lenina')
         response = self.client.get(path=f'/city/{city.id}/street/')
         self.assertEquals(
-            response.json(),
+            response.json()['results'],
             [
                 {'id': street1.id, 'name': street1.name},
                 {'id': street2.id, 'name': street2.name},
@@ -81,6 +144,7 @@ class StreetAPITest(APITestCase):
         street2 = Street.objects.create(city=city2, name='Prospekt Lenina')
 
         response = self.client.get(path=f'/city/{city1.id}/street/').json()
+        response = response['results']
         self.assertEqual(len(response), 1)
 
         response_street = response[0]
@@ -110,10 +174,98 @@ class StreetAPITest(APITestCase):
         )
 
 
+class StreetBatchAPITest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.city = City.objects.create(name='Rostov-on-Don')
+        self.street = Street.objects.create(name='Prospekt Lenina',
+                                            city=self.city)
+
+    def post_names(self, names, city_id=None):
+        return self.client.post(path=f'/city/{city_id or self.city.id}/street/',
+                                data=names, format='json')
+
+    def test_post_list_creates_missing_streets(self):
+        # city check, existing names, savepoint, insert, ids, change log
+        # version bump, delete and insert, release and table version bump
+        with self.assertNumQueries(10):
+            response = self.post_names(['Ulitsa Borko', 'Prospekt Lenina',
+                                        'Ulitsa Borko', 'Prospekt Stachki'])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        streets = dict(Street.objects.values_list('name', 'id'))
+        self.assertEqual(response.json(), {
+            'created': [
+                {'id': streets['Ulitsa Borko'], 'name': 'Ulitsa Borko'},
+                {'id': streets['Prospekt Stachki'], 'name': 'Prospekt Stachki'},
+            ],
+            'existing': [{'id': self.street.id, 'name': 'Prospekt Lenina'}],
+        })
+
+    def test_post_list_of_existing_streets_creates_nothing(self):
+        response = self.post_names(['Prospekt Lenina'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['created'], [])
+        self.assertEqual(Street.objects.count(), 1)
+
+    def test_post_list_invalidates_cached_streets(self):
+        self.client.get(path=f'/city/{self.city.id}/street/')
+        self.post_names(['Ulitsa Borko'])
+        response = self.client.get(path=f'/city/{self.city.id}/street/')
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_post_list_to_missing_city_returns_400(self):
+        response = self.post_names(['Ulitsa Borko'], city_id=777)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(b'no such city', response.content)
+
+    def test_post_invalid_list_returns_errors(self):
+        for names in ([], ['Ulitsa Borko', ''], ['x' * 257]):
+            with self.subTest(names=names):
+                response = self.post_names(names)
+                self.assertEqual(response.status_code,
+                                 status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Street.objects.count(), 1)
+
+
+class AutocompleteAPITest(APITestCase):
+
+    def setUp(self):
+        autocomplete_index.clear()
+        city = City.objects.create(name='Rostov-on-Don')
+        Street.objects.create(name='Prospekt Lenina', city=city)
+        Street.objects.create(name='Prospekt Stachki', city=city)
+
+    def test_get_completes_names_without_queries(self):
+        self.client.get(path='/autocomplete/', data={'q': 'pro'})
+        with self.assertNumQueries(0):
+            response = self.client.get(path='/autocomplete/',
+                                       data={'q': 'pro', 'limit': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {
+            'cities': [],
+            'streets': [{'id': Street.objects.get(name='Prospekt Lenina').id,
+                         'name': 'Prospekt Lenina', 'city': 'Rostov-on-Don'}],
+        })
+
+    def test_get_fuzzy(self):
+        response = self.client.get(path='/autocomplete/',
+                                   data={'q': 'Rostof', 'fuzzy': 'true'})
+        self.assertEqual([city['name'] for city in response.json()['cities']],
+                         ['Rostov-on-Don'])
+
+    def test_get_invalid_parameters_returns_errors(self):
+        response = self.client.get(path='/autocomplete/', data={'limit': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.json()), {'q', 'limit'})
+
+
 class ShopAPITest(APITestCase):
 
     def setUp(self):
         '''Insert test data'''
+        cache.clear()
+        schedule_index.clear()
         city_names = ('Moscow', 'Saint Petersburg', 'Rostov-on-Don')
         street_names = ('Prospekt Stachki', 'Ulitsa Borko', 'Prospekt Lenina')
         shop_names = ('Opened 1', 'Opened 2', 'Closed')
@@ -132,13 +284,71 @@ class ShopAPITest(APITestCase):
                         closing_time=time(hour=closing_hour),
                     )
 
-    def get_json_response(self, data=None) -> dict:
-        return self.client.get(path='/shop/', data=data).json()
+    def get_json_response(self, data=None) -> list:
+        return self.client.get(path='/shop/', data=data).json()['results']
 
     def test_get_without_data_returns_all_shops_from_database(self):
         response = self.get_json_response()
         self.assertEqual(len(response), Shop.objects.count())
 
+    def test_get_query_count_does_not_depend_on_shops_quantity(self):
+        # table versions, timezones of cities, next opening boundary,
+        # shops page and its hours
+        with self.assertNumQueries(5):
+            self.get_json_response()
+
+        city = City.objects.first()
+        street = Street.objects.filter(city=city).first()
+        for number in range(10):
+            Shop.objects.create(
+                name=f'Extra {number}',
+                city=city,
+                street=street,
+                house_numbers=1,
+                opening_time=time(hour=8),
+                closing_time=time(hour=20),
+            )
+
+        # timezones are cached until cities change
+        with self.assertNumQueries(4):
+            self.get_json_response()
+
+    def test_get_paginates_shops_by_cursor(self):
+        response = self.client.get(path='/shop/', data={'page_size': 10})
+        first_page = response.json()
+        self.assertEqual(len(first_page['results']), 10)
+        self.assertIsNone(first_page['previous'])
+
+        # insert between requests must not shift next page
+        Shop.objects.create(
+            name='Late',
+            city=City.objects.first(),
+            street=Street.objects.first(),
+            house_numbers=1,
+            opening_time=time(hour=8),
+            closing_time=time(hour=20),
+        )
+
+        with self.assertNumQueries(4):
+            second_page = self.client.get(first_page['next']).json()
+        first_ids = [shop['id'] for shop in first_page['results']]
+        second_ids = [shop['id'] for shop in second_page['results']]
+        self.assertEqual(len(second_ids), 10)
+        self.assertLess(max(first_ids), min(second_ids))
+        self.assertEqual(second_ids, sorted(second_ids))
+
+    def test_get_page_size_is_limited(self):
+        response = self.client.get(path='/shop/', data={'page_size': 10**6})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['results']), 27)
+        self.assertEqual(IdCursorPagination.max_page_size, 1000)
+
+    def test_get_pagination_combines_with_search_filters(self):
+        data = {'city': 'Moscow', 'page_size': 2}
+        response = self.client.get(path='/shop/', data=data).json()
+        self.assertEqual(len(response['results']), 2)
+        self.assertIsNotNone(response['next'])
+
     def test_get_with_data_does_search_shops_in_database(self):
         city = City.objects.get(name='Rostov-on-Don')
         street = Street.objects.get(name='Prospekt Lenina', city=city)
@@ -155,6 +365,31 @@ class ShopAPITest(APITestCase):
         city_shops = Shop.objects.filter(city__name='Moscow')
         self.assertEqual(len(response), city_shops.count())
 
+    def test_get_filter_by_city_does_not_join_city(self):
+        self.get_json_response(data={'city': 'Moscow'})  # warm name cache
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.get_json_response(data={'city': 'Moscow'})
+        for query in queries:
+            self.assertNotIn('"cityshops_city"."name" =', query['sql'])
+
+    def test_get_unknown_city_does_not_query_shops(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_json_response(data={'city': 'Atlantis'})
+        self.assertEqual(response, [])
+        for query in queries:
+            self.assertNotIn('cityshops_shop', query['sql'])
+
+    def test_get_street_of_other_city_returns_nothing(self):
+        city = City.objects.create(name='Atlantis')
+        Street.objects.create(name='Ocean Drive', city=city)
+        data = {'city': 'Moscow', 'street': 'Ocean Drive'}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_json_response(data=data)
+        self.assertEqual(response, [])
+        for query in queries:
+            self.assertNotIn('cityshops_shop', query['sql'])
+
     def test_get_filter_by_street(self):
         response = self.get_json_response(data={'street': 'Prospekt Lenina'})
         street_shops = Shop.objects.filter(street__name='Prospekt Lenina')
@@ -162,16 +397,44 @@ class ShopAPITest(APITestCase):
 
     @patch('cityshops.models.timezone.now')
     def test_get_opened_1_returns_opened_shops(self, mock_now):
+        mock_now().weekday.return_value = 0  # Monday
         mock_now().time.return_value = time(hour=15)
         response = self.get_json_response(data={'opened': 1})
         self.assertEqual(len(response), 18)
 
     @patch('cityshops.models.timezone.now')
     def test_get_opened_0_returns_closed_shops(self, mock_now):
+        mock_now().weekday.return_value = 0  # Monday
         mock_now().time.return_value = time(hour=15)
         response = self.get_json_response(data={'opened': 0})
         self.assertEqual(len(response), 9)
 
+    @patch('cityshops.models.timezone.now')
+    def test_opened_search_by_schedule_index_matches_database(self, mock_now):
+        for hour in (7, 8, 15, 20):
+            mock_now().weekday.return_value = 0  # Monday
+            mock_now().time.return_value = time(hour=hour)
+            for data in ({'opened': 1}, {'city': 'Moscow', 'opened': 0}):
+                with self.subTest(hour=hour, data=data):
+                    cache.clear()
+                    indexed = self.get_json_response(data=data)
+                    cache.clear()
+                    with patch.object(ShopList, 'schedule_index_max_ids', 0):
+                        self.assertEqual(self.get_json_response(data=data),
+                                         indexed)
+
+    @patch('cityshops.models.timezone.now')
+    def test_opened_search_uses_schedule_index(self, mock_now):
+        mock_now().weekday.return_value = 0  # Monday
+        mock_now().time.return_value = time(hour=15)
+        self.get_json_response(data={'opened': 1})
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            self.get_json_response(data={'city': 'Moscow', 'opened': 1})
+        page_query = context.captured_queries[-2]['sql']  # before hours
+        self.assertNotIn('closing_time" >', page_query)
+        self.assertIn('."id" IN (', page_query)
+
     def test_get_invalid_opened_value_number_not_0_and_not_1(self):
         response = self.client.get(path='/shop/', data={'opened': 15})
         self.assertIn(b'must be 0 or 1', response.content)
@@ -184,12 +447,14 @@ class ShopAPITest(APITestCase):
 
     @patch('cityshops.models.timezone.now')
     def test_get_opened_shops_when_all_shops_are_closed(self, mock_now):
+        mock_now().weekday.return_value = 0  # Monday
         mock_now().time.return_value = time(hour=23)
         response = self.get_json_response(data={'opened': 1})
         self.assertEqual(len(response), 0)
 
     @patch('cityshops.models.timezone.now')
     def test_get_city_street_opened_shops(self, mock_now):
+        mock_now().weekday.return_value = 0  # Monday
         mock_now().time.return_value = time(hour=15)
         data = {'city': 'Moscow', 'street': 'Prospekt Lenina', 'opened': 1}
         response = self.get_json_response(data=data)
@@ -221,3 +486,788 @@ class ShopAPITest(APITestCase):
         response = self.client.post(path='/shop/', data={'name': 'Krig'})
         self.assertIn(b'This field is required.', response.content)
         self.assertEqual(Shop.objects.count(), 27)
+
+
+@patch('cityshops.models.timezone.now')
+class ShopListRepresentationTest(APITestCase):
+    '''List is built from values rows, output must match ShopSerializer'''
+
+    def setUp(self):
+        cache.clear()
+        schedule_index.clear()
+        for timezone_name in ('UTC', 'Asia/Vladivostok', 'America/New_York'):
+            city = City.objects.create(name=timezone_name,
+                                       timezone=timezone_name)
+            street = Street.objects.create(name='Улица Ленина', city=city)
+            Shop.objects.create(
+                name='Daily "Shop"', city=city, street=street,
+                house_numbers='1-3', latitude=55.75, longitude=37.61,
+                opening_time=time(hour=8), closing_time=time(hour=20),
+            )
+            Shop.objects.create(
+                name='Overnight', city=city, street=street, house_numbers=2,
+                opening_time=time(hour=22), closing_time=time(hour=2, minute=30),
+            )
+            Shop(name='Weekdays', city=city, street=street,
+                 house_numbers=3).set_opening_hours([
+                     (0, time(hour=9), time(hour=13)),
+                     (0, time(hour=14), time(hour=18)),
+                     (4, time(hour=10), time(hour=1)),
+                 ])
+
+    def assert_same_as_serializer(self, data=None, path='/shop/'):
+        response = self.client.get(path=path, data=data)
+        shop_ids = [shop['id'] for shop in response.json()['results']]
+        shops = Shop.objects.filter(id__in=shop_ids).order_by('id')
+        expected = {
+            **response.data,
+            'results': ShopSerializer(shops, many=True).data,
+        }
+        self.assertEqual(response.content, JSONRenderer().render(expected))
+        return response.json()
+
+    def test_list_is_byte_identical_to_serializer_output(self, mock_now):
+        for moment in ((2026, 1, 5, 7, 0), (2026, 1, 9, 23, 0),
+                       (2026, 7, 10, 5, 30)):
+            mock_now.return_value = datetime(*moment, tzinfo=pytz.utc)
+            with self.subTest(moment=moment):
+                cache.clear()
+                results = self.assert_same_as_serializer()['results']
+                self.assertEqual(len(results), Shop.objects.count())
+                self.assertTrue(any(shop['is_opened'] for shop in results))
+
+    def test_pages_and_searches_are_identical(self, mock_now):
+        mock_now.return_value = datetime(2026, 1, 5, 7, 0, tzinfo=pytz.utc)
+        page = self.assert_same_as_serializer({'page_size': 4})
+        self.assert_same_as_serializer(path=page['next'])
+        self.assert_same_as_serializer({'city': 'UTC', 'opened': 1})
+        self.assert_same_as_serializer({'city': 'Nowhere'})
+
+
+class SparseFieldsAPITest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        schedule_index.clear()
+        self.city = City.objects.create(name='Moscow',
+                                        timezone='Europe/Moscow')
+        street = Street.objects.create(name='Prospekt Lenina', city=self.city)
+        for number in range(3):
+            Shop.objects.create(
+                name=f'Shop {number}', city=self.city, street=street,
+                house_numbers=number, opening_time=time(hour=8),
+                closing_time=time(hour=20),
+            )
+
+    def get_results(self, path: str, fields: str, **data) -> list:
+        response = self.client.get(path, {'fields': fields, **data})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()['results']
+
+    def test_shop_fields_are_trimmed_in_serializer_order(self):
+        full = self.client.get('/shop/').json()['results']
+        results = self.get_results('/shop/', 'is_opened,name,id')
+        self.assertEqual(results, [
+            {'id': shop['id'], 'name': shop['name'],
+             'is_opened': shop['is_opened']}
+            for shop in full
+        ])
+        self.assertEqual(list(results[0]), ['id', 'name', 'is_opened'])
+
+    def test_unneeded_columns_and_joins_are_not_fetched(self):
+        self.get_results('/shop/', 'id')  # warm timezone cache
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.get_results('/shop/', 'id,name')
+        shop_queries = [query['sql'] for query in queries
+                        if 'FROM "cityshops_shop"' in query['sql']]
+        self.assertEqual(len(shop_queries), 1)  # no opening hours query
+        self.assertNotIn('JOIN', shop_queries[0])
+        self.assertNotIn('house_numbers', shop_queries[0])
+
+    def test_fields_combine_with_search_and_pagination(self):
+        response = self.client.get('/shop/', {
+            'fields': 'name', 'city': 'Moscow', 'page_size': 2})
+        page = response.json()
+        self.assertEqual(page['results'],
+                         [{'name': 'Shop 0'}, {'name': 'Shop 1'}])
+        self.assertEqual(self.client.get(page['next']).json()['results'],
+                         [{'name': 'Shop 2'}])
+
+    def test_fields_are_cached_apart_from_full_response(self):
+        self.get_results('/shop/', 'id')
+        full = self.client.get('/shop/').json()['results']
+        self.assertIn('opening_hours', full[0])
+
+    def test_city_and_street_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get_results('/city/', 'name'),
+                             [{'name': 'Moscow'}])
+        self.assertFalse(any('"timezone"' in query['sql']
+                             for query in queries))
+        self.assertEqual(
+            self.get_results(f'/city/{self.city.id}/street/', 'name'),
+            [{'name': 'Prospekt Lenina'}],
+        )
+
+    def test_invalid_fields_are_rejected(self):
+        for path, fields in (('/shop/', 'id,price'), ('/shop/', ''),
+                             ('/city/', 'streets'),
+                             (f'/city/{self.city.id}/street/', 'city')):
+            with self.subTest(path=path, fields=fields):
+                response = self.client.get(path, {'fields': fields})
+                self.assertEqual(response.status_code,
+                                 status.HTTP_400_BAD_REQUEST)
+                self.assertIn(b'Got invalid field', response.content)
+
+
+class ShopNearbyAPITest(APITestCase):
+
+    def setUp(self):
+        city = City.objects.create(name='Moscow')
+        street = Street.objects.create(name='Tverskaya', city=city)
+        # about 111 meters to the north per number
+        self.shops = [
+            Shop.objects.create(
+                name=f'Shop {number}',
+                city=city,
+                street=street,
+                house_numbers=number,
+                opening_time=time(hour=8 + number),
+                closing_time=time(hour=20),
+                latitude=55.75 + number / 1000,
+                longitude=37.62,
+            )
+            for number in range(5)
+        ]
+
+    def get_nearby(self, **parameters):
+        parameters = {'lat': 55.7502, 'lon': 37.62, **parameters}
+        return self.client.get(path='/shop/nearby/', data=parameters)
+
+    def test_get_returns_shops_by_distance(self):
+        results = self.get_nearby(radius=350).json()['results']
+        self.assertEqual([shop['id'] for shop in results],
+                         [self.shops[n].id for n in (0, 1, 2, 3)])
+        self.assertAlmostEqual(results[0]['distance'], 22.2, delta=0.1)
+        expected = ShopSerializer(self.shops[1]).data
+        self.assertEqual({**results[1], 'distance': None},
+                         {**expected, 'distance': None})
+
+    def test_get_respects_limit(self):
+        results = self.get_nearby(radius=10_000, limit=2).json()['results']
+        self.assertEqual([shop['id'] for shop in results],
+                         [self.shops[0].id, self.shops[1].id])
+
+    @patch('cityshops.models.timezone.now')
+    def test_get_opened_shops(self, mock_now):
+        mock_now().weekday.return_value = 0  # Monday
+        mock_now().time.return_value = time(hour=10)
+        results = self.get_nearby(opened=1).json()['results']
+        self.assertEqual([shop['id'] for shop in results],
+                         [self.shops[n].id for n in (0, 1, 2)])
+        results = self.get_nearby(opened=0).json()['results']
+        self.assertEqual([shop['id'] for shop in results],
+                         [self.shops[n].id for n in (3, 4)])
+
+    def test_get_invalid_parameters_returns_errors(self):
+        response = self.client.get(path='/shop/nearby/',
+                                   data={'lat': 91, 'radius': 100_000})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.json()), {'lat', 'lon', 'radius'})
+
+
+class ShopChangesAPITest(APITestCase):
+
+    def setUp(self):
+        self.city = City.objects.create(name='Moscow')
+        self.street = Street.objects.create(name='Prospekt Lenina',
+                                            city=self.city)
+        self.shops = [self.create_shop(f'Shop {number}') for number in range(3)]
+
+    def create_shop(self, name: str) -> Shop:
+        return Shop.objects.create(
+            name=name, city=self.city, street=self.street, house_numbers=13,
+            opening_time=time(hour=8), closing_time=time(hour=20),
+        )
+
+    def get_changes(self, **data) -> dict:
+        response = self.client.get('/shop/changes/', data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def get_token(self) -> str:
+        return self.get_changes()['token']
+
+    def test_token_without_since_has_no_results(self):
+        changes = self.get_changes()
+        self.assertEqual(changes['results'], [])
+        self.assertIsNone(changes['next'])
+        self.assertEqual(changes['token'], str(RowChange.objects.last().id))
+
+    def test_returns_only_rows_written_since_token(self):
+        token = self.get_token()
+        self.shops[0].name = 'Renamed'
+        self.shops[0].save()
+        created = self.create_shop('Created')
+        deleted_id = self.shops[1].id
+        self.shops[1].delete()
+
+        changes = self.get_changes(since=token)
+        shop_data = self.client.get('/shop/').json()['results']
+        self.assertEqual(changes['results'], [
+            {'type': 'shop', 'id': self.shops[0].id, 'deleted': False,
+             'data': shop_data[0]},
+            {'type': 'shop', 'id': created.id, 'deleted': False,
+             'data': shop_data[-1]},
+            {'type': 'shop', 'id': deleted_id, 'deleted': True, 'data': None},
+        ])
+        self.assertEqual(self.get_changes(since=changes['token'])['results'],
+                         [])
+
+    def test_cities_and_streets_are_tracked(self):
+        token = self.get_token()
+        city = City.objects.create(name='Tula', timezone='Europe/Moscow')
+        self.client.post(f'/city/{city.id}/street/', ['Tulskaya'],
+                         format='json')
+        street = Street.objects.get(name='Tulskaya')
+        self.assertEqual(self.get_changes(since=token)['results'], [
+            {'type': 'city', 'id': city.id, 'deleted': False,
+             'data': {'id': city.id, 'name': 'Tula',
+                      'timezone': 'Europe/Moscow'}},
+            {'type': 'street', 'id': street.id, 'deleted': False,
+             'data': {'id': street.id, 'name': 'Tulskaya', 'city': city.id}},
+        ])
+
+    def test_imported_shops_are_tracked(self):
+        token = self.get_token()
+        line = json.dumps({'name': 'Imported', 'city': 'Moscow',
+                           'street': 'Prospekt Lenina', 'house_numbers': '1',
+                           'opening_time': '08:00', 'closing_time': '20:00'})
+        self.client.post('/shop/import/', line,
+                         content_type='application/x-ndjson')
+        results = self.get_changes(since=token)['results']
+        self.assertEqual([result['data']['name'] for result in results],
+                         ['Imported'])
+
+    def test_changes_are_paginated(self):
+        token = self.get_token()
+        for shop in self.shops:
+            shop.save()
+        page = self.get_changes(since=token, limit=2)
+        self.assertEqual([result['id'] for result in page['results']],
+                         [shop.id for shop in self.shops[:2]])
+        page = self.client.get(page['next']).json()
+        self.assertEqual([result['id'] for result in page['results']],
+                         [self.shops[2].id])
+        self.assertIsNone(page['next'])
+
+    def test_query_count_does_not_depend_on_table_size(self):
+        token = self.get_token()
+        self.shops[0].save()
+        # changes, shops with timezones and their opening hours
+        with self.assertNumQueries(3):
+            self.get_changes(since=token)
+
+    def test_invalid_token_returns_400(self):
+        response = self.client.get('/shop/changes/', {'since': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ShopImportAPITest(APITestCase):
+
+    def setUp(self):
+        city = City.objects.create(name='Rostov-on-Don')
+        Street.objects.create(name='Prospekt Lenina', city=city)
+        other_city = City.objects.create(name='Moscow')
+        Street.objects.create(name='Ulitsa Borko', city=other_city)
+
+    def get_shop_line(self, **fields) -> str:
+        shop_data = {
+            'name': 'Amused Kid',
+            'city': 'Rostov-on-Don',
+            'street': 'Prospekt Lenina',
+            'house_numbers': '13',
+            'opening_time': '08:00:00',
+            'closing_time': '20:00:00',
+        }
+        shop_data.update(fields)
+        return json.dumps(shop_data)
+
+    def post_lines(self, lines: list):
+        return self.client.post(
+            path='/shop/import/',
+            data='\n'.join(lines),
+            content_type='application/x-ndjson',
+        )
+
+    def test_post_creates_shops_from_every_line(self):
+        lines = [self.get_shop_line(name=f'Shop {n}') for n in range(5)]
+        response = self.post_lines(lines)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {'created': 5, 'errors': []})
+        self.assertEqual(Shop.objects.count(), 5)
+        self.assertEqual(OpeningHours.objects.count(), 5 * 7)
+
+    def test_post_reports_invalid_rows_and_creates_valid_ones(self):
+        lines = [
+            self.get_shop_line(),
+            '{not json',
+            self.get_shop_line(city='Atlantis'),
+            self.get_shop_line(street='Ulitsa Borko'),  # street of Moscow
+            self.get_shop_line(closing_time=None),
+            '',
+            self.get_shop_line(name=''),
+            self.get_shop_line(name='Last'),
+        ]
+        response = self.post_lines(lines).json()
+
+        self.assertEqual(response['created'], 2)
+        self.assertEqual(Shop.objects.count(), 2)
+        error_lines = [error['line'] for error in response['errors']]
+        self.assertEqual(error_lines, [2, 3, 4, 5, 7])
+        errors = {error['line']: error['errors'] for error in response['errors']}
+        self.assertIn('Invalid JSON', str(errors[2]))
+        self.assertIn('city', errors[3])
+        self.assertIn('street', errors[4])
+        self.assertIn('both opening and closing time', str(errors[5]))
+        self.assertIn('name', errors[7])
+
+    def test_post_resolves_names_with_constant_query_count(self):
+        ShopImport.batch_size = 3
+        self.addCleanup(setattr, ShopImport, 'batch_size', 1000)
+        lines = [self.get_shop_line(name=f'Shop {n}') for n in range(6)]
+        # per batch: city lookup, street lookup, savepoint, last id, insert,
+        # created ids, shops without hours, hours insert, change log version
+        # bump and insert, release, table version bump after commit
+        with self.assertNumQueries(2 * 12):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post_lines(lines)
+        self.assertEqual(Shop.objects.count(), 6)
+
+    def test_batches_committed_before_failing_one_are_not_cached_away(self):
+        ShopImport.batch_size = 2
+        self.addCleanup(setattr, ShopImport, 'batch_size', 1000)
+        etag = self.client.get(path='/shop/')['ETag']
+        self.client.raise_request_exception = False
+        lines = [self.get_shop_line(name=f'Shop {n}') for n in range(4)]
+        batches = []
+
+        def fail_second_batch(shops, batch_size):
+            batches.append(shops)
+            if len(batches) == 2:
+                raise DatabaseError('connection lost')
+            return bulk_create_shops(shops, batch_size)
+
+        with patch('cityshops.bulk.bulk_create_shops',
+                   side_effect=fail_second_batch), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.post_lines(lines)
+        self.assertEqual(response.status_code,
+                         status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        response = self.client.get(path='/shop/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([shop['name'] for shop in response.json()['results']],
+                         ['Shop 0', 'Shop 1'])
+
+    def test_import_without_created_shops_keeps_version(self):
+        etag = self.client.get(path='/shop/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post_lines([self.get_shop_line(city='Atlantis')])
+        response = self.client.get(path='/shop/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class ShopExportAPITest(APITestCase):
+
+    def setUp(self):
+        city = City.objects.create(name='Rostov-on-Don')
+        street = Street.objects.create(name='Prospekt Lenina', city=city)
+        for number in range(5):
+            Shop.objects.create(
+                name=f'Шоп {number}',
+                city=city,
+                street=street,
+                house_numbers=number,
+                opening_time=time(hour=8, minute=30),
+                closing_time=time(hour=12 + number),
+            )
+
+    def get_export_lines(self) -> list:
+        response = self.client.get(path='/shop/export/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['content-type'], 'application/x-ndjson')
+        content = b''.join(response.streaming_content).decode()
+        return content.splitlines()
+
+    @patch('cityshops.models.timezone.now')
+    def test_get_streams_every_shop_as_serializer_does(self, mock_now):
+        mock_now().weekday.return_value = 0  # Monday
+        mock_now().time.return_value = time(hour=14)
+        lines = self.get_export_lines()
+
+        expected = ShopSerializer(Shop.objects.order_by('id'), many=True).data
+        self.assertEqual([json.loads(line) for line in lines], expected)
+
+    def test_get_fetches_rows_in_chunks(self):
+        ShopExport.chunk_size = 2
+        self.addCleanup(setattr, ShopExport, 'chunk_size', 2000)
+        response = self.client.get(path='/shop/export/')
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(b''.join(chunks).count(b'\n'), 5)
+
+
+class ResponseCacheTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.city = City.objects.create(name='Moscow')
+        self.street = Street.objects.create(name='Ulitsa Borko',
+                                            city=self.city)
+        self.shop = Shop.objects.create(
+            name='Amused Kid',
+            city=self.city,
+            street=self.street,
+            house_numbers=1,
+            opening_time=time(hour=8),
+            closing_time=time(hour=20),
+        )
+
+    def get_shop_list_view(self, data: dict) -> ShopList:
+        view = ShopList()
+        view.request = Request(APIRequestFactory().get('/shop/', data))
+        view.kwargs = {}
+        return view
+
+    def test_repeated_get_does_not_query_database(self):
+        for path in ('/city/', f'/city/{self.city.id}/street/', '/shop/'):
+            first = self.client.get(path=path, data={'page_size': 5})
+            with self.assertNumQueries(1):  # table versions for ETag
+                second = self.client.get(path=path, data={'page_size': 5})
+            self.assertEqual(first.json(), second.json())
+
+    def test_query_parameters_order_does_not_matter(self):
+        self.client.get(path='/shop/?city=Moscow&street=Ulitsa Borko')
+        with self.assertNumQueries(1):  # table versions for ETag
+            self.client.get(path='/shop/?street=Ulitsa Borko&city=Moscow')
+
+    def test_invalid_search_parameter_is_not_served_from_cache(self):
+        self.client.get(path='/shop/')
+        response = self.client.get(path='/shop/', data={'rating': 10})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_save_invalidates_dependent_responses(self):
+        self.client.get(path='/shop/')
+        self.client.get(path='/city/')
+        self.city.name = 'Moskva'
+        self.city.save()
+
+        shop = self.client.get(path='/shop/').json()['results'][0]
+        self.assertEqual(shop['city'], 'Moskva')
+        city = self.client.get(path='/city/').json()['results'][0]
+        self.assertEqual(city['name'], 'Moskva')
+
+    def test_delete_invalidates_dependent_responses(self):
+        self.client.get(path='/shop/')
+        self.shop.delete()
+        self.assertEqual(self.client.get(path='/shop/').json()['results'], [])
+
+    def test_post_invalidates_list(self):
+        self.client.get(path='/city/')
+        self.client.post(path='/city/', data={'name': 'Tver'})
+        self.assertEqual(len(self.client.get(path='/city/').json()['results']), 2)
+
+    def test_bulk_import_invalidates_shop_list(self):
+        self.client.get(path='/shop/')
+        line = json.dumps({
+            'name': 'Imported', 'city': 'Moscow', 'street': 'Ulitsa Borko',
+            'house_numbers': '2', 'opening_time': '08:00:00',
+            'closing_time': '20:00:00',
+        })
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(path='/shop/import/', data=line,
+                             content_type='application/x-ndjson')
+        self.assertEqual(len(self.client.get(path='/shop/').json()['results']), 2)
+
+    @patch('cityshops.models.timezone.now')
+    def test_opened_search_expires_at_next_boundary(self, mock_now):
+        data = {'city': 'Moscow', 'opened': 1}
+        mock_now().weekday.return_value = 0  # Monday
+        mock_now().time.return_value = time(hour=19, minute=59)
+        self.assertEqual(self.get_shop_list_view(data).get_cache_timeout(), 60)
+
+        cache.clear()  # mocked clock does not expire cached boundary
+        mock_now().time.return_value = time(hour=7, minute=58)
+        self.assertEqual(self.get_shop_list_view(data).get_cache_timeout(), 120)
+
+    @patch('cityshops.models.timezone.now')
+    def test_opened_search_timeout_is_bounded(self, mock_now):
+        mock_now().weekday.return_value = 0  # Monday
+        mock_now().time.return_value = time(hour=12)
+        view = self.get_shop_list_view({'opened': 0})
+        self.assertEqual(view.get_cache_timeout(),
+                         settings.RESPONSE_CACHE_TIMEOUT)
+
+    @patch('cityshops.models.timezone.now')
+    def test_search_without_opened_expires_at_next_boundary(self, mock_now):
+        mock_now().weekday.return_value = 0  # Monday
+        mock_now().time.return_value = time(hour=19, minute=59)
+        view = self.get_shop_list_view({'city': 'Moscow'})
+        self.assertEqual(view.get_cache_timeout(), 60)
+
+
+class ConditionalGetTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.city = City.objects.create(name='Moscow')
+        street = Street.objects.create(name='Ulitsa Borko', city=self.city)
+        self.shop = Shop.objects.create(
+            name='Amused Kid',
+            city=self.city,
+            street=street,
+            house_numbers=1,
+            opening_time=time(hour=8),
+            closing_time=time(hour=20),
+        )
+
+    def test_get_returns_etag_and_last_modified(self):
+        for path in ('/city/', f'/city/{self.city.id}/street/', '/shop/'):
+            response = self.client.get(path=path)
+            self.assertTrue(response.has_header('ETag'))
+            self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_matching_etag_returns_304_without_serializing(self):
+        for path in ('/city/', f'/city/{self.city.id}/street/', '/shop/'):
+            etag = self.client.get(path=path)['ETag']
+            cache.clear()  # response cache would serve body without queries
+            with patch.object(ShopSerializer, 'to_representation') as serialize:
+                with self.assertNumQueries(2 if path == '/shop/' else 1):
+                    response = self.client.get(path=path, HTTP_IF_NONE_MATCH=etag)
+            serialize.assert_not_called()
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(response.content, b'')
+
+    def test_etag_depends_on_query_parameters(self):
+        etag = self.client.get(path='/shop/')['ETag']
+        response = self.client.get(path='/shop/', data={'city': 'Moscow'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_write_changes_etag(self):
+        etag = self.client.get(path='/shop/')['ETag']
+        self.shop.name = 'Lunar Circle'
+        self.shop.save()
+        response = self.client.get(path='/shop/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_delete_changes_etag(self):
+        etag = self.client.get(path='/city/')['ETag']
+        City.objects.create(name='Tver').delete()
+        response = self.client.get(path='/city/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @patch('cityshops.models.timezone.now')
+    def test_shop_etag_changes_when_shop_opens(self, mock_now):
+        mock_now().weekday.return_value = 0  # Monday
+        mock_now().time.return_value = time(hour=7)
+        etag = self.client.get(path='/shop/')['ETag']
+
+        mock_now().time.return_value = time(hour=7, minute=30)
+        response = self.client.get(path='/shop/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        cache.clear()  # mocked clock does not expire cached boundary
+        mock_now().time.return_value = time(hour=8)
+        response = self.client.get(path='/shop/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.json()['results'][0]['is_opened'])
+
+    def test_invalid_search_is_not_answered_with_304(self):
+        etag = self.client.get(path='/shop/')['ETag']
+        response = self.client.get(path='/shop/', data={'rating': 10},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(path='/city/')['Last-Modified']
+        response = self.client.get(path='/city/',
+                                   HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # shop list changes with time of day, only ETag can validate it
+        last_modified = self.client.get(path='/shop/')['Last-Modified']
+        response = self.client.get(path='/shop/',
+                                   HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0', 'replica_1'])
+class ReplicaRoutingTest(APITestCase):
+    '''Views report alias their queries would use, replicas need not exist'''
+
+    def setUp(self):
+        cache.clear()
+        self.city = City.objects.create(name='Moscow')
+
+    def get_read_alias(self, view, path: str) -> str:
+        def list_(request, *args, **kwargs):
+            return Response({'alias': City.objects.all().db})
+
+        with patch.object(view, 'list', list_):
+            return self.client.get(path=path).json()['alias']
+
+    def test_list_reads_go_to_replica(self):
+        for view, path in ((CityList, '/city/'),
+                           (CityStreetsList, f'/city/{self.city.id}/street/'),
+                           (ShopList, '/shop/')):
+            with self.subTest(path=path):
+                self.assertIn(self.get_read_alias(view, path),
+                              ('replica_0', 'replica_1'))
+
+    def test_other_reads_and_writes_go_to_primary(self):
+        self.assertEqual(City.objects.all().db, 'default')
+        self.assertEqual(ReplicaRouter().db_for_write(City), 'default')
+
+    def test_read_after_write_in_request_goes_to_primary(self):
+        router = ReplicaRouter()
+        token = current_replica.set('replica_0')
+        self.addCleanup(current_replica.reset, token)
+        self.assertEqual(router.db_for_read(City), 'replica_0')
+        router.db_for_write(City)
+        self.assertEqual(router.db_for_read(City), 'default')
+
+    def test_client_reads_from_primary_after_write(self):
+        response = self.client.post(path='/city/', data={'name': 'Tver'})
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[PRIMARY_COOKIE]['max-age'],
+                         settings.REPLICA_STICKY_SECONDS)
+        self.assertEqual(self.get_read_alias(CityList, '/city/'), 'default')
+
+        self.client.cookies.clear()
+        self.assertNotEqual(self.get_read_alias(CityList, '/city/'),
+                            'default')
+
+    def test_failed_write_does_not_stick_to_primary(self):
+        response = self.client.post(path='/city/', data={'name': ''})
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_goes_to_primary(self):
+        self.assertEqual(self.get_read_alias(CityList, '/city/'), 'default')
+        response = self.client.post(path='/city/', data={'name': 'Tver'})
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class ReplicaConnectionTest(APITransactionTestCase):
+    '''Queries run on test mirror of default database set up as replica'''
+
+    databases = {'default', 'replica_0'}
+
+    def setUp(self):
+        cache.clear()
+        City.objects.create(name='Moscow')
+
+    def count_queries(self, request) -> tuple:
+        '''Queries request ran on primary and on replica'''
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica_0']) as replica:
+            response = request()
+        self.assertLess(response.status_code, 400)
+        return len(primary), len(replica)
+
+    def test_list_reads_run_on_replica(self):
+        primary, replica = self.count_queries(
+            lambda: self.client.get(path='/city/'))
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_writes_run_on_primary(self):
+        primary, replica = self.count_queries(
+            lambda: self.client.post(path='/city/', data={'name': 'Tver'}))
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_reads_after_write_run_on_primary(self):
+        self.client.post(path='/city/', data={'name': 'Tver'})
+        primary, replica = self.count_queries(
+            lambda: self.client.get(path='/city/'))
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+        self.client.cookies.clear()
+        primary, replica = self.count_queries(
+            lambda: self.client.get(path='/city/'))
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+
+@override_settings(REQUEST_PROFILING=True, PROFILING_STATS_TOKEN='secret')
+class ProfilingTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        profile_store.clear()
+        city = City.objects.create(name='Moscow')
+        street = Street.objects.create(name='Ulitsa Borko', city=city)
+        Shop.objects.create(
+            name='Amused Kid',
+            city=city,
+            street=street,
+            house_numbers=1,
+            opening_time=time(hour=8),
+            closing_time=time(hour=20),
+        )
+
+    def test_response_has_server_timing(self):
+        response = self.client.get(path='/shop/')
+        metrics = dict(metric.split(';', 1)
+                       for metric in response['Server-Timing'].split(', '))
+        self.assertEqual(set(metrics), {'db', 'serializer', 'render', 'total'})
+        self.assertIn('desc="5 queries"', metrics['db'])
+
+    def test_requests_are_aggregated_per_endpoint(self):
+        for _ in range(2):
+            self.client.get(path='/shop/')
+        self.client.get(path=f'/city/{City.objects.get().id}/street/')
+
+        stats = self.client.get(path='/profiling/',
+                                HTTP_X_PROFILING_TOKEN='secret').json()
+        self.assertEqual(set(stats), {'GET /shop/',
+                                      'GET /city/<int:city_pk>/street/'})
+        shop_stats = stats['GET /shop/']
+        self.assertEqual(shop_stats['count'], 2)
+        self.assertEqual(sum(shop_stats['histogram'].values()), 2)
+        self.assertGreater(shop_stats['mean_ms']['serializer'], 0)
+
+    def test_stats_are_hidden_without_token_or_staff_user(self):
+        # local peer is reverse proxy of every client
+        for token in ('', 'guess'):
+            with self.subTest(token=token):
+                response = self.client.get(path='/profiling/',
+                                           REMOTE_ADDR='127.0.0.1',
+                                           HTTP_X_PROFILING_TOKEN=token)
+                self.assertEqual(response.status_code,
+                                 status.HTTP_404_NOT_FOUND)
+
+    @override_settings(PROFILING_STATS_TOKEN='')
+    def test_empty_token_setting_lets_in_staff_users_only(self):
+        response = self.client.get(path='/profiling/', HTTP_X_PROFILING_TOKEN='')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        user = User.objects.create_user('admin', is_staff=True)
+        self.client.force_login(user)
+        response = self.client.get(path='/profiling/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(REQUEST_PROFILING=False)
+    def test_disabled_profiling_adds_nothing(self):
+        response = self.client.get(path='/shop/')
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(profile_store.as_dict(), {})
+        response = self.client.get(path='/profiling/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
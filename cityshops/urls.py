@@ -1,6 +1,6 @@
 from django.urls.conf import include, path
 
-from . import views
+from . import async_views, profiling, views
 
 
 urlpatterns = [
@@ -8,6 +8,20 @@ urlpatterns = [
 
         path('city/', views.CityList.as_view(), name='city-list'),
         path('shop/', views.ShopList.as_view(), name='shop-list'),
+        path('shop/nearby/', views.ShopNearby.as_view(), name='shop-nearby'),
+        path('shop/changes/', views.ShopChanges.as_view(),
+             name='shop-changes'),
+        path('shop/import/', views.ShopImport.as_view(), name='shop-import'),
+        path('shop/export/', views.ShopExport.as_view(), name='shop-export'),
 
         path('city/<int:city_pk>/street/', views.CityStreetsList.as_view()),
+        path('autocomplete/', views.Autocomplete.as_view(),
+             name='autocomplete'),
+
+        path('async/city/', async_views.city_list, name='async-city-list'),
+        path('async/shop/', async_views.shop_list, name='async-shop-list'),
+        path('async/city/<int:city_pk>/street/',
+             async_views.city_streets_list),
+
+        path('profiling/', profiling.profiling_stats, name='profiling-stats'),
 ]
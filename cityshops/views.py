@@ -1,13 +1,37 @@
-from django.http import Http404
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+from django.http import Http404, StreamingHttpResponse
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 from rest_framework.views import APIView
 from rest_framework import status, generics
 from rest_framework.serializers import ValidationError
+from rest_framework.utils.urls import replace_query_param
 
-from cityshops.models import City, Shop, Street
-from cityshops.serializers import CitySerializer, ShopSerializer, StreetSerializer
+from cityshops.autocomplete import autocomplete_index
+from cityshops.bulk import import_shops, upsert_streets
+from cityshops.cache import (
+    CachedListMixin, ConditionalListMixin, get_generations, make_key,
+)
+from cityshops.models import (
+    WEEK, City, RowChange, Shop, Street, TableVersion, seconds_of_week,
+    seconds_until,
+)
+from cityshops.name_cache import city_cache, street_cache, timezone_cache
+from cityshops.profiling import profile_section
+from cityshops.renderers import dumps
+from cityshops.routers import ReplicaReadMixin
+from cityshops.schedule import schedule_index
+from cityshops.serializers import (
+    AutocompleteSearchSerializer, ChangesSearchSerializer, CitySerializer,
+    NearbySearchSerializer, ShopSerializer, StreetNamesField, StreetSerializer,
+    shop_field_sources, shop_row_fields, shop_rows_to_representation,
+)
+from cityshops.signals import tables_changed
 
 
 @api_view(['GET'])
@@ -20,32 +44,157 @@ def api_root(request):
     return Response(table_of_contents)
 
 
-class CityList(generics.ListCreateAPIView):
+class SparseFieldsMixin:
+    '''Trim list output to serializer fields named in `fields` parameter
+
+    Queryset loads only columns of these fields. Responses of writes keep
+    all fields
+    '''
+
+    fields_parameter = 'fields'
+
+    def list(self, request, *args, **kwargs):
+        self.sparse_fields = self.get_sparse_fields()
+        return super().list(request, *args, **kwargs)
+
+    def get_sparse_fields(self):
+        '''Requested fields in serializer order, None when all are'''
+        if (value := self.request.query_params.get(self.fields_parameter)) is None:
+            return None
+        requested = value.split(',')
+        fields = [name for name, field in self.get_serializer().fields.items()
+                  if not field.write_only]
+        for name in requested:
+            if name not in fields:
+                msg = 'Got invalid field = "{}"'
+                raise ValidationError(msg.format(name))
+        return tuple(name for name in fields if name in requested)
+
+    def get_cache_parameters(self) -> tuple:
+        return super().get_cache_parameters() + (self.fields_parameter,)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if fields := getattr(self, 'sparse_fields', None):
+            columns = {field.name for field in queryset.model._meta.concrete_fields}
+            queryset = queryset.only(*columns.intersection(fields))
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if fields := getattr(self, 'sparse_fields', None):
+            child = getattr(serializer, 'child', serializer)
+            for name in set(child.fields) - set(fields):
+                child.fields.pop(name)
+        return serializer
+
+
+class CityList(ReplicaReadMixin, SparseFieldsMixin, ConditionalListMixin,
+               CachedListMixin, generics.ListCreateAPIView):
     '''List all cities or create new city'''
 
+    cache_models = (City,)
     queryset = City.objects.all()
     serializer_class = CitySerializer
 
 
-class CityStreetsList(generics.ListCreateAPIView):
-    '''List all streets of given city'''
+class CityStreetsList(ReplicaReadMixin, SparseFieldsMixin,
+                      ConditionalListMixin, CachedListMixin,
+                      generics.ListCreateAPIView):
+    '''List all streets of given city or create streets in it
+
+    POST of JSON list of names creates missing ones in one batch
+    '''
 
+    cache_models = (City, Street)
     serializer_class = StreetSerializer
 
     def get_queryset(self):
         city_pk = self.kwargs.get('city_pk', 0)
+        self.validate_city(city_pk)
+        return Street.objects.filter(city=city_pk)
 
-        if not City.objects.filter(id=city_pk):
+    def validate_city(self, city_pk: int):
+        if not City.objects.filter(id=city_pk).exists():
             raise ValidationError({'city': 'no such city in database'})
-        return Street.objects.filter(city=city_pk)
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+
+        city_pk = self.kwargs['city_pk']
+        self.validate_city(city_pk)
+        names = StreetNamesField().run_validation(request.data)
+        report = upsert_streets(city_pk, names)
+        if not report['created']:
+            return Response(report)
+        tables_changed(Street)  # bulk_create does not send post_save
+        return Response(report, status=status.HTTP_201_CREATED)
+
+
+class Autocomplete(APIView):
+    '''Complete city and street names from in-process name index'''
+
+    def get(self, request):
+        search = AutocompleteSearchSerializer(data=request.query_params)
+        search.is_valid(raise_exception=True)
+        search = search.validated_data
+        return Response(autocomplete_index.search(
+            search['q'], search['limit'], fuzzy=search['fuzzy'],
+            city_id=search.get('city'),
+        ))
 
 
-class ShopList(generics.ListCreateAPIView):
+class ShopRowsListMixin:
+    '''List shops from values rows instead of model instances
+
+    Output is the same as of ShopSerializer, which still validates and
+    represents created shops. Only values of `sparse_fields` are fetched,
+    so unused columns and joins are skipped
+    '''
+
+    def list(self, request, *args, **kwargs):
+        row_fields = shop_row_fields + ('city__timezone',)
+        fetched = row_fields
+        if fields := getattr(self, 'sparse_fields', None):
+            needed = {'id'}.union(*map(shop_field_sources.get, fields))
+            fetched = [name for name in row_fields if name in needed]
+        queryset = self.filter_queryset(self.get_queryset()) \
+                       .prefetch_related(None) \
+                       .values(*fetched)
+        page = self.paginate_queryset(queryset)
+        rows = queryset if page is None else page
+        with profile_section('serializer'):
+            data = shop_rows_to_representation(
+                [tuple(map(row.get, row_fields)) for row in rows], fields)
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+
+class ShopList(ReplicaReadMixin, SparseFieldsMixin, ConditionalListMixin,
+               CachedListMixin, ShopRowsListMixin, generics.ListCreateAPIView):
     '''List all shops or search specific shop or create new shop'''
 
+    cache_models = (City, Street, Shop)
+    # shops open and close without any write, which Last-Modified misses
+    use_if_modified_since = False
     valid_search_parameters = ('city', 'street', 'opened')
+    # longer id lists are slower than range query over hours index,
+    # 0 disables schedule index
+    schedule_index_max_ids = 1000
     serializer_class = ShopSerializer
 
+    def get_search_parameters(self) -> dict:
+        '''Query parameters without ones consumed by paginator and fields'''
+        other_parameters = self.paginator.query_parameters \
+            + (self.fields_parameter,)
+        return {
+            parameter: value
+            for parameter, value in self.request.query_params.items()
+            if parameter not in other_parameters
+        }
+
     def validate_search_parameters(self, search_parameters: dict):
         for parameter in search_parameters:
             if parameter not in self.valid_search_parameters:
@@ -58,22 +207,273 @@ class ShopList(generics.ListCreateAPIView):
                 raise ValidationError({'opened': msg.format(opened)})
 
     def get_queryset(self):
-        queryset = Shop.objects.all()
+        queryset = Shop.objects.select_related('city', 'street') \
+                               .prefetch_related('opening_hours')
 
-        if not (search_parameters := self.request.query_params):
+        if not (search_parameters := self.get_search_parameters()):
             return queryset
 
         self.validate_search_parameters(search_parameters)
+        queryset = self.filter_by_place(queryset, search_parameters)
+
+        if opened := search_parameters.get('opened'):
+            check_open = bool(int(opened))
+            queryset = self.filter_by_hours(queryset, search_parameters,
+                                            check_open)
+
+        return queryset
 
+    def filter_by_place(self, queryset, search_parameters: dict):
+        '''Apply city and street search by ids of cached names'''
+        city_id = None
         if city_name := search_parameters.get('city'):
-            queryset = queryset.filter(city__name=city_name)
+            cities = city_cache.get(city_name, self.get_table_version(City))
+            if not cities:
+                return queryset.none()
+            city_id = cities[0][0]
+            queryset = queryset.filter(city_id=city_id)
 
         if street_name := search_parameters.get('street'):
-            queryset = queryset.filter(street__name=street_name)
-
-        if opened := search_parameters.get('opened'):
-            check_open = bool(int(opened))
-            check_function = Shop.is_opened if check_open else Shop.is_closed
-            queryset = [shop for shop in queryset if check_function(shop)]
+            streets = street_cache.get(street_name,
+                                       self.get_table_version(Street))
+            street_ids = [street_id for street_id, street_city_id in streets
+                          if city_id in (None, street_city_id)]
+            if not street_ids:
+                return queryset.none()
+            queryset = queryset.filter(street_id__in=street_ids)
 
         return queryset
+
+    def filter_by_hours(self, queryset, search_parameters: dict,
+                        check_open: bool):
+        '''Apply opened search by ids from schedule index when they are few
+
+        Street search is narrower and index-backed, so it is left to database
+        '''
+        shop_ids = None
+        if self.schedule_index_max_ids and not search_parameters.get('street'):
+            city_name = search_parameters.get('city')
+            versions = (self.get_table_version(City),
+                        self.get_table_version(Shop))
+            cities = city_cache.get(city_name, versions[0]) if city_name \
+                else [(None,)]
+            if cities and None not in versions:
+                shop_ids = schedule_index.get_shop_ids(
+                    cities[0][0], seconds_of_week(), check_open,
+                    versions=versions, limit=self.schedule_index_max_ids,
+                )
+
+        if shop_ids is not None:
+            return queryset.filter(id__in=shop_ids)
+        timezones = self.get_timezones()
+        if check_open:
+            return queryset.opened(timezones)
+        return queryset.closed(timezones)
+
+    def get_table_version(self, model):
+        '''Version fetched for ETag, None when table is not tracked'''
+        versions = getattr(self, 'table_versions', None)
+        if versions is None:
+            versions = TableVersion.objects.of(self.cache_models)
+            self.table_versions = versions
+        table = model._meta.label_lower
+        return next((version for label, version, _ in versions
+                     if label == table), None)
+
+    def get_timezones(self) -> list:
+        '''Distinct timezones of cities, opened checks group them by offset'''
+        return timezone_cache.get(self.get_table_version(City))
+
+    def get_next_boundary(self):
+        '''Next opening or closing of searched shops
+
+        Kept in cache until it passes, so repeated searches and conditional
+        requests do not aggregate over shops
+        '''
+        if hasattr(self, '_next_boundary'):
+            return self._next_boundary
+
+        search_parameters = self.get_search_parameters()
+        self.validate_search_parameters(search_parameters)
+        place = [(parameter, search_parameters.get(parameter))
+                 for parameter in ('city', 'street')]
+        key = make_key('boundary', place, get_generations(self.cache_models))
+
+        if (moment := cache.get(key, 'missing')) == 'missing':
+            shops = self.filter_by_place(Shop.objects.all(), search_parameters)
+            boundary = shops.next_boundary(self.get_timezones())
+            moment = None if boundary is None else boundary % WEEK
+            timeout = settings.RESPONSE_CACHE_TIMEOUT
+            if boundary is not None:
+                timeout = min(timeout, int(seconds_until(boundary)))
+            cache.set(key, moment, timeout)
+
+        self._next_boundary = None
+        if moment is not None:
+            weeks = 0 if moment > seconds_of_week() else 1
+            self._next_boundary = moment + weeks * WEEK
+        return self._next_boundary
+
+    def get_cache_timeout(self) -> int:
+        '''Expire at next opening or closing of searched shops
+
+        Both `opened` search and `is_opened` field of every shop depend on
+        current time
+        '''
+        timeout = super().get_cache_timeout()
+        if not self.depends_on_time() \
+                or (boundary := self.get_next_boundary()) is None:
+            return timeout
+        return min(timeout, int(seconds_until(boundary)))
+
+    def get_etag_extra(self):
+        '''Second of week of next boundary
+
+        Opening hours repeat weekly, so it identifies current state of
+        every searched shop
+        '''
+        if not self.depends_on_time():
+            return None
+        boundary = self.get_next_boundary()
+        return None if boundary is None else boundary % WEEK
+
+    def depends_on_time(self) -> bool:
+        '''Whether response changes when searched shops open or close'''
+        fields = getattr(self, 'sparse_fields', None)
+        return fields is None or 'is_opened' in fields \
+            or 'opened' in self.get_search_parameters()
+
+
+class ShopNearby(generics.GenericAPIView):
+    '''List shops nearest to point by distance, `opened` as in ShopList
+
+    Candidates come from geohash prefix index, exact distances are
+    computed in Python
+    '''
+
+    serializer_class = ShopSerializer
+
+    def get(self, request):
+        search = NearbySearchSerializer(data=request.query_params)
+        search.is_valid(raise_exception=True)
+        search = search.validated_data
+
+        opened = search.get('opened')
+        nearest = Shop.objects.nearest(
+            search['lat'], search['lon'], search['radius'], search['limit'],
+            opened=None if opened is None else opened == '1',
+        )
+
+        shops = Shop.objects.select_related('city', 'street') \
+                            .prefetch_related('opening_hours') \
+                            .in_bulk([shop_id for _, shop_id in nearest])
+        results = []
+        for distance, shop_id in nearest:
+            representation = self.get_serializer(shops[shop_id]).data
+            representation['distance'] = round(distance, 1)
+            results.append(representation)
+        return Response({'results': results})
+
+
+class ShopChanges(APIView):
+    '''Cities, streets and shops written since token, deleted ones as tombstones
+
+    Token is id of last change read. Without `since` only current token is
+    returned: take it, fetch full lists, then follow changes since it.
+    `next` links further pages of changes
+    '''
+
+    def get(self, request):
+        search = ChangesSearchSerializer(data=request.query_params)
+        search.is_valid(raise_exception=True)
+        search = search.validated_data
+
+        if (since := search.get('since')) is None:
+            token = RowChange.objects.aggregate(Max('id'))['id__max'] or 0
+            return Response({'token': str(token), 'next': None, 'results': []})
+
+        limit = search['limit']
+        changes = list(RowChange.objects.filter(id__gt=since)
+                                        .order_by('id')[:limit + 1])
+        has_next = len(changes) > limit
+        changes = changes[:limit]
+        token = changes[-1].id if changes else since
+
+        rows = self.get_rows(changes)
+        results = []
+        for change in changes:
+            data = rows.get((change.table, change.row_id))
+            results.append({
+                'type': change.table.split('.')[1],
+                'id': change.row_id,
+                'deleted': data is None,  # also rows deleted while reading
+                'data': data,
+            })
+        next_url = None
+        if has_next:
+            next_url = replace_query_param(request.build_absolute_uri(),
+                                           'since', token)
+        return Response({'token': str(token), 'next': next_url,
+                         'results': results})
+
+    def get_rows(self, changes: list) -> dict:
+        '''{(table, id): representation} of written rows, query per table'''
+        ids = {}
+        for change in changes:
+            if not change.deleted:
+                ids.setdefault(change.table, []).append(change.row_id)
+        rows = {}
+        label = City._meta.label_lower
+        for city in City.objects.filter(id__in=ids.get(label, ())) \
+                                .values('id', 'name', 'timezone'):
+            rows[label, city['id']] = city
+        label = Street._meta.label_lower
+        for street_id, name, city_id in Street.objects.filter(
+                id__in=ids.get(label, ())).values_list('id', 'name', 'city_id'):
+            rows[label, street_id] = {'id': street_id, 'name': name,
+                                      'city': city_id}
+        label = Shop._meta.label_lower
+        shops = Shop.objects.filter(id__in=ids.get(label, ())) \
+                            .values_list(*shop_row_fields, 'city__timezone')
+        for shop in shop_rows_to_representation(list(shops)):
+            rows[label, shop['id']] = shop
+        return rows
+
+
+class ShopImport(APIView):
+    '''Create shops from JSON Lines body, one shop object per line'''
+
+    batch_size = 1000
+
+    def post(self, request):
+        lines = request.stream or ()
+        report = import_shops(lines, batch_size=self.batch_size)
+        return Response(report)
+
+
+class ShopExport(APIView):
+    '''Stream all shops as JSON Lines, one shop object per line'''
+
+    chunk_size = 2000
+
+    def get(self, request):
+        return StreamingHttpResponse(
+            self.iter_chunks(),
+            content_type='application/x-ndjson',
+        )
+
+    def iter_chunks(self):
+        '''Encode rows fetched through server-side cursor chunk by chunk
+
+        Opening hours of chunk are fetched in one more query
+        '''
+        rows = (
+            Shop.objects.order_by('id')
+                        .values_list(*shop_row_fields, 'city__timezone')
+                        .iterator(chunk_size=self.chunk_size)
+        )
+        while chunk := list(islice(rows, self.chunk_size)):
+            yield b''.join(
+                dumps(representation, newline=True)
+                for representation in shop_rows_to_representation(chunk)
+            )
@@ -133,7 +133,7 @@ class TestAssignment(FunctionalTest):
         shop_url = '/shop/?city=Rostov-on-Don&street=Prospekt Lenina'
         self.selenium.get(self.live_server_url + shop_url)
         response_body = self.get_current_response_body()
-        response_json = json.loads(response_body)
+        response_json = json.loads(response_body)['results']
 
         self.assertEqual(len(response_json), 2)
         self.assertNotIn('Amused Kid', response_body)
@@ -154,7 +154,7 @@ class TestAssignment(FunctionalTest):
         shop_url = '/shop/?city=Rostov-on-Don&street=Prospekt Lenina'
         self.selenium.get(self.live_server_url + shop_url)
         response_body = self.get_current_response_body()
-        response_json = json.loads(response_body)
+        response_json = json.loads(response_body)['results']
 
         self.assertEqual(len(response_json), 3)
         self.assertIn('Amused Kid', response_body)
@@ -13,4 +13,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'test_assignment_DRF.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Django 3.2 cannot stream from coroutines, so event stream bypasses it
+from cityshops.events import shop_events  # noqa: E402  after Django setup
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == '/shop/events/':
+        return await shop_events(scope, receive, send)
+    return await django_application(scope, receive, send)
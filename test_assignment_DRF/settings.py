@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
 from os import getenv
 
@@ -50,6 +51,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'cityshops.routers.ReplicaStickinessMiddleware',
+    # last, so its render time includes only DRF rendering
+    'cityshops.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'test_assignment_DRF.urls'
@@ -83,10 +87,77 @@ DATABASES = {
         'USER': 'postgres',
         'PASSWORD': 'postgres',
         'HOST': getenv('DATABASE_HOST', 'localhost'),
-        'PORT': 5432,
+        'PORT': int(getenv('DATABASE_PORT', 5432)),
+        # seconds to keep connection between requests, 0 closes it after each
+        'CONN_MAX_AGE': int(getenv('DATABASE_CONN_MAX_AGE', 60)),
+        # pgbouncer in transaction pooling mode drops server-side cursors
+        # between transactions, so .iterator() must fetch on client side
+        'DISABLE_SERVER_SIDE_CURSORS': bool(int(getenv('DATABASE_PGBOUNCER', 0))),
     }
 }
 
+# ping persistent connections at request start, costs a round trip per
+# connection per request (see cityshops.db)
+DATABASE_CONN_HEALTH_CHECKS = bool(int(getenv('DATABASE_CONN_HEALTH_CHECKS', 0)))
+
+# comma separated hosts of read replicas of default database, which serve
+# list GETs (see cityshops.routers)
+DATABASE_REPLICAS = []
+for number, host in enumerate(
+        filter(None, getenv('DATABASE_REPLICA_HOSTS', '').split(','))):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+
+# tests route reads to mirror of default database, which shows what
+# connection ran queries without replica servers
+if not DATABASE_REPLICAS and sys.argv[1:2] == ['test']:
+    DATABASES['replica_0'] = {**DATABASES['default'],
+                              'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['cityshops.routers.ReplicaRouter']
+
+# seconds client reads from primary after its write, longer than replica lag
+REPLICA_STICKY_SECONDS = int(getenv('REPLICA_STICKY_SECONDS', 5))
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'cityshops.pagination.IdCursorPagination',
+    'PAGE_SIZE': int(getenv('API_PAGE_SIZE', 100)),
+    'DEFAULT_RENDERER_CLASSES': (
+        # same JSON encoded by orjson, see cityshops.renderers
+        'cityshops.renderers.FastJSONRenderer'
+        if bool(int(getenv('API_FAST_JSON', 0)))
+        else 'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# seconds, upper bound for list responses cached by cityshops
+RESPONSE_CACHE_TIMEOUT = int(getenv('RESPONSE_CACHE_TIMEOUT', 300))
+
+# Server-Timing headers and per endpoint stats at /profiling/
+REQUEST_PROFILING = bool(int(getenv('REQUEST_PROFILING', 0)))
+# stats are served to staff users and to requests with this token in
+# X-Profiling-Token header, empty disables token
+PROFILING_STATS_TOKEN = getenv('PROFILING_STATS_TOKEN', '')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators